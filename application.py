@@ -1,11 +1,23 @@
 import os
+import sys
 import json
+import threading
 
+import click
 from flask import Flask
 from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config as jwt_config
 
+from auth_util import get_session_claims, get_session_keys, is_session_revoked
+from cache_util import compress_response, start_entity_cache_listener
 from log_util import get_logger
-from db_config import redis_client as rc
+from db_config import (redis_client as rc, commit_request_session, remove_request_session, request_has_writes,
+                       replica_set, READ_PRIMARY_COOKIE, DB_REPLICA_STICKY_SECONDS)
+from explain_util import check_query_plans, get_query_plans
+from metrics_util import metrics
+from utils import create_response, is_successful_response, HashingRequest
+from models.theater_model import ShowTimingsModel
+from views.movies import MoviesView
 
 from controllers import *
 
@@ -13,6 +25,7 @@ from controllers import *
 logger = get_logger(__name__)
 
 app = Flask(__name__)
+app.request_class = HashingRequest
 app.config['JWT_SECRET_KEY'] = os.environ['secret_key']
 app.config['JWT_HEADER_NAME'] = os.environ['jwt_header_name']
 app.config['JWT_HEADER_TYPE'] = ''
@@ -26,6 +39,54 @@ app.register_blueprint(auth_api)
 app.register_blueprint(movies_api)
 app.register_blueprint(theater_api)
 
+app.after_request(compress_response)
+app.teardown_request(remove_request_session)
+
+# Build the now showing documents when a worker starts serving.
+WARM_NOW_SHOWING_AT_STARTUP = os.environ.get('warm_now_showing_at_startup', 'true') == 'true'
+
+_background_workers_pid = None
+_background_workers_lock = threading.Lock()
+
+
+@app.before_request
+def start_background_workers():
+    """
+    Starts the entity cache listener and the now showing warm up of the serving process, once per process.
+    They are started by the first request, not on import, so cli commands do not start them, and forked
+    workers start their own threads.
+    """
+    global _background_workers_pid
+
+    pid = os.getpid()
+    if _background_workers_pid == pid:
+        return
+
+    with _background_workers_lock:
+        if _background_workers_pid != pid:
+            start_entity_cache_listener()
+            if WARM_NOW_SHOWING_AT_STARTUP:
+                threading.Thread(target=ShowTimingsModel.warm_now_showing, daemon=True).start()
+            _background_workers_pid = pid
+
+
+@app.after_request
+def commit_request(response):
+    """
+    Commits the writes of the request in one transaction, or rolls them back if the response reports an error.
+    It is registered after compress_response, so it runs before it. Clients which wrote read from the primary
+    for a while, so they see their writes.
+    """
+    try:
+        has_writes = commit_request_session(commit=not request_has_writes() or is_successful_response(response))
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        return create_response({'msg': 'Something went wrong.', 'status': False, 'status_code': 5000})
+
+    if has_writes and replica_set.engines:
+        response.set_cookie(READ_PRIMARY_COOKIE, '1', max_age=DB_REPLICA_STICKY_SECONDS, httponly=True)
+    return response
+
 
 @jwt.user_identity_loader
 def user_claims(identity):
@@ -38,12 +99,71 @@ def user_claims(identity):
     return r_key
 
 
+@jwt.additional_claims_loader
+def session_claims(identity):
+    return get_session_claims(identity)
+
+
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header: dict, jwt_payload: dict) -> bool:
-    jti = jwt_payload['jti']
-    token = rc.get(jti)
-
-    return token is not None
+    user_claims, user_epoch = rc.mget(get_session_keys(jwt_payload, jwt_config.identity_claim_key))
+
+    return is_session_revoked(jwt_payload, user_claims, user_epoch)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    resp = {'msg': 'Metrics fetched successfully!', 'data': metrics.snapshot(), 'status_code': 2000, 'status': True}
+    return create_response(resp)
+
+
+@app.cli.command('reap-media-uploads')
+def reap_media_uploads():
+    """ Abort resumable media uploads which stopped receiving chunks. Meant to be run periodically. """
+    reaped = MoviesView.reap_stale_media_uploads()
+    click.echo(f'Reaped {reaped} stale media uploads.')
+
+
+@app.cli.command('warm-now-showing')
+def warm_now_showing():
+    """ Build the now showing documents of all the movies with running shows. """
+    print(f'Built now showing documents of {ShowTimingsModel.warm_now_showing(force=True)} movies.')
+
+
+@app.cli.command('explain-hot-queries')
+@click.option('--analyze', is_flag=True, help='Execute the queries and include actual timings.')
+@click.option('--movie-id', type=int, default=1)
+@click.option('--theater-id', type=int, default=1)
+@click.option('--email-id', default='user@example.com')
+@click.option('--text', 'as_text', is_flag=True, help='Print the plans as text instead of json.')
+def explain_hot_queries(analyze: bool, movie_id: int, theater_id: int, email_id: str, as_text: bool):
+    """ Print the EXPLAIN plans of the hot queries as json. Run it before and after applying a migration. """
+    plans = get_query_plans(analyze, as_text, movie_id=movie_id, theater_id=theater_id, email_id=email_id)
+    if as_text:
+        for name, plan in plans.items():
+            print(f'-- {name}\n{plan}\n')
+    else:
+        print(json.dumps(plans, indent=2))
+
+
+@app.cli.command('check-query-plans')
+@click.option('--scale', type=float, default=1, help='Factor applied to the row counts of the synthetic dataset.')
+@click.option('--budget-scale', type=float, default=1, help='Factor applied to the cost budgets.')
+@click.option('--verbose', is_flag=True, help='Print the plans as json.')
+def check_hot_query_plans(scale: float, budget_scale: float, verbose: bool):
+    """
+    Seed a synthetic dataset and fail if a hot query plan uses a sequential scan or exceeds its cost budget.
+    Point the database environment variables at a local Postgres, the data is rolled back afterwards.
+    """
+    plans, failures = check_query_plans(scale, budget_scale)
+    for name, plan in plans.items():
+        print(f'{name}: {plan["Plan"]["Node Type"]}, total cost {plan["Plan"]["Total Cost"]}')
+    if verbose:
+        print(json.dumps(plans, indent=2))
+
+    for failure in failures:
+        print(f'FAILED {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,606 @@
+"""
+Asyncio serving mode. The hot catalog GET endpoints are served natively with AsyncSession and redis.asyncio,
+with the same routes, payloads and caching headers as the Flask app. They read from the replicas like GET
+requests of the Flask app do. Every other route is handled by the Flask app, which is mounted as a WSGI app and
+runs in a thread pool. That includes the whole auth blueprint, whose routes spend their time hashing passwords
+and writing, and the movie and theater routes which write or upload media to S3.
+
+Run it with `uvicorn asgi:app --workers <n>`.
+"""
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+import jwt
+from redis import asyncio as aioredis, RedisError, WatchError
+from sqlalchemy import URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession as SAAsyncSession
+from sqlalchemy.orm import Query
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from application import app as flask_app, start_background_workers
+from auth_util import get_session_keys, is_session_revoked, verified_token_cache
+from cache_util import (build_catalog_etag, choose_content_encoding, compress, compressed_response_cache,
+                        get_cache_control, get_catalog_max_age, get_encoded_etag, EntityType, CATALOG_VERSION_KEY,
+                        CATALOG_STALE_KEY, CATALOG_STALE_TTL, CATALOG_STALE_WHILE_REVALIDATE, COMPRESSION_MIN_SIZE,
+                        SINGLE_FLIGHT_LEASE_KEY, SINGLE_FLIGHT_LEASE_MS, SINGLE_FLIGHT_POLL_INTERVAL,
+                        SINGLE_FLIGHT_RESULT_KEY, SINGLE_FLIGHT_RESULT_TTL, SINGLE_FLIGHT_WAIT_TIMEOUT)
+from db_config import (url_object, replica_urls, ReplicaSet, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                       DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT, READ_PRIMARY_COOKIE)
+from log_util import get_logger
+from metrics_util import metrics
+from models import STREAM_BATCH_SIZE
+from models.movies_model import MovieModel
+from models.read_models import TheaterRecord, TheaterScreenRecord
+from models.theater_model import (TheaterModel, TheaterScreenModel, ShowTimingsModel, NOW_SHOWING_KEY,
+                                  NOW_SHOWING_GENERATION_KEY, NOW_SHOWING_TTL)
+from views.theater import LIST_SCREENS_IMPL
+from utils import (dumps_json, dumps_json_with_raw, decode_cursor, get_page_size, get_fetch_size, paginate,
+                   PRE_SIGNED_URL_REFRESH_MARGIN, STREAM_CHUNK_SIZE)
+
+logger = get_logger(__name__)
+
+JWT_SECRET_KEY = flask_app.config['JWT_SECRET_KEY']
+JWT_IDENTITY_CLAIM = flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')
+JWT_HEADER_NAME = flask_app.config['JWT_HEADER_NAME']
+
+
+def create_async_db_engine(url: URL, metrics_prefix: str = 'db.async_pool') -> AsyncEngine:
+    """ The counterpart of db_config.create_db_engine, with the same pool and statement timeout settings. """
+    db_engine = create_async_engine(url.set(drivername='postgresql+asyncpg'), pool_size=DB_POOL_SIZE,
+                                    max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                                    pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING,
+                                    connect_args={'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT)}})
+    metrics.register_gauge(f'{metrics_prefix}.checked_out', db_engine.sync_engine.pool.checkedout)
+    return db_engine
+
+
+async_engine = create_async_db_engine(url_object)
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Replicas are tracked by their sync engines, which ReplicaSet listens to for disconnects.
+async_replica_engines = {replica_engine.sync_engine: replica_engine for replica_engine in
+                         [create_async_db_engine(replica_url, metrics_prefix=f'db.async_replica.{idx}.pool')
+                          for idx, replica_url in enumerate(replica_urls)]}
+async_replica_set = ReplicaSet(list(async_replica_engines))
+
+async_redis_client = aioredis.Redis()
+
+
+def get_read_session(request: Request) -> SAAsyncSession:
+    """
+    The counterpart of db_config.get_read_session. The routes of this app only read, so they read from a
+    replica, unless the client wrote recently, see READ_PRIMARY_COOKIE, or every replica is down.
+    """
+    if READ_PRIMARY_COOKIE not in request.cookies:
+        replica_engine = async_replica_set.get_engine()
+        if replica_engine is not None:
+            return AsyncSession(bind=async_replica_engines[replica_engine])
+    return AsyncSession()
+
+
+class StatementBuilder:
+    """
+    Stands in for the session argument of the query builders of the models, like MovieModel.list_movies_query.
+    The queries it builds are not bound to a session, their statements are executed with AsyncSession.
+    """
+
+    @staticmethod
+    def query(*entities) -> Query:
+        return Query(entities)
+
+
+statement_builder = StatementBuilder()
+
+
+class AuthError(Exception):
+    def __init__(self, msg: str, status: int):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+
+
+def json_response(resp_json: dict, status: int = 200) -> Response:
+    return Response(dumps_json(resp_json), status_code=status, media_type='application/json')
+
+
+def get_int_arg(query_params: MultiDict, key: str) -> int | None:
+    """ Same as request.args.get(key, type=int) in Flask, invalid values are ignored. """
+    try:
+        return int(query_params[key])
+    except (KeyError, ValueError):
+        return None
+
+
+async def verify_access_token(request: Request) -> dict:
+    """
+    This method verifies the access token of a request the way jwt_required of flask_jwt_extended does,
+    and checks its session is not revoked.
+    :return: The claims of the token.
+    """
+    parts = request.headers.get(JWT_HEADER_NAME, '').strip().strip(',').split()
+    if not parts:
+        raise AuthError(f'Missing {JWT_HEADER_NAME} Header', 401)
+    if len(parts) != 1:
+        raise AuthError(f"Bad {JWT_HEADER_NAME} header. Expected '{JWT_HEADER_NAME}: <JWT>'", 422)
+
+    token = parts[0]
+    token_hash = hashlib.sha256(token.encode('utf-8')).digest()
+    verified_token = verified_token_cache.get(token_hash)
+    if verified_token is not None:
+        metrics.incr('auth.token_cache.hits')
+        claims = verified_token[1]
+    else:
+        metrics.incr('auth.token_cache.misses')
+        try:
+            claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise AuthError('Token has expired', 401)
+        except jwt.InvalidTokenError as e:
+            raise AuthError(str(e), 422)
+        if claims.get('type') != 'access':
+            raise AuthError('Only non-refresh tokens are allowed', 422)
+        verified_token_cache.set(token_hash, jwt.get_unverified_header(token), claims)
+
+    user_claims, user_epoch = await async_redis_client.mget(get_session_keys(claims, JWT_IDENTITY_CLAIM))
+    if is_session_revoked(claims, user_claims, user_epoch):
+        raise AuthError('Token has been revoked', 401)
+    return claims
+
+
+def jwt_required(handler: Callable) -> Callable:
+    @wraps(handler)
+    async def wrapper(request: Request) -> Response:
+        try:
+            await verify_access_token(request)
+        except AuthError as e:
+            return json_response({'msg': e.msg}, e.status)
+        return await handler(request)
+    return wrapper
+
+
+async def compute_catalog_etag(request: Request, entity_types: tuple[str, ...],
+                               rotate_every: int | None = None) -> str | None:
+    try:
+        versions = await async_redis_client.mget([CATALOG_VERSION_KEY.format(entity_type=entity_type)
+                                                  for entity_type in entity_types])
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        return None
+    return build_catalog_etag(request.url.path, request.url.query, entity_types,
+                              [int(version or 0) for version in versions], rotate_every)
+
+
+def create_response(request: Request, resp_json: dict, etag: str | None = None, cache_control: str | None = None,
+                    raw_data: bytes | None = None) -> Response:
+    """
+    The counterpart of utils.create_response and the compress_response hook. Successful catalog responses get
+    ETag and Cache-Control headers, json bodies of at least COMPRESSION_MIN_SIZE bytes are compressed.
+    """
+    body = dumps_json(resp_json) if raw_data is None else dumps_json_with_raw(resp_json, 'data', raw_data)
+    if not resp_json.get('status'):
+        etag = None
+    return create_json_response(request, body, etag, cache_control)
+
+
+def create_json_response(request: Request, body: bytes, etag: str | None = None,
+                         cache_control: str | None = None) -> Response:
+    """ Sends the json body of a response, see create_response. """
+    headers = {}
+    if etag is not None:
+        headers['Cache-Control'] = cache_control
+
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = choose_content_encoding(parse_accept_header(request.headers.get('accept-encoding')))
+        if encoding is not None:
+            compressed_body = compressed_response_cache.get(etag, encoding) if etag is not None else None
+            if compressed_body is None:
+                compressed_body = compress(body, encoding)
+                if etag is not None:
+                    compressed_response_cache.set(etag, encoding, compressed_body)
+            body = compressed_body
+            headers['Content-Encoding'] = encoding
+            etag = get_encoded_etag(etag, encoding) if etag is not None else None
+
+    if etag is not None:
+        headers['ETag'] = quote_etag(etag)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+class AsyncSingleFlight:
+    """
+    The counterpart of cache_util.SingleFlight on redis.asyncio. It uses the same lease and result keys, so
+    requests are coalesced with the workers of the Flask app as well.
+    """
+
+    def __init__(self, lease_ms: int, wait_timeout: float, result_ttl: int):
+        self.lease_ms = lease_ms
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[tuple[Any, bytes | None]]],
+                 stale_key: str | None = None, stale_ttl: int | None = None) -> tuple[Any, bytes | None]:
+        """ See SingleFlight.do. """
+        call = self._calls.get(key)
+        if call is not None:
+            metrics.incr('single_flight.coalesced')
+            try:
+                data = await asyncio.wait_for(asyncio.shield(call), self.wait_timeout)
+            except asyncio.TimeoutError:
+                data = None
+            if data is not None:
+                return None, data
+            metrics.incr('single_flight.fallbacks')
+            return await compute()
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        data = None
+        try:
+            value, data = await self._do_shared(key, compute, stale_key, stale_ttl)
+            return value, data
+        finally:
+            del self._calls[key]
+            call.set_result(data)
+
+    async def _do_shared(self, key: str, compute: Callable[[], Awaitable[tuple[Any, bytes | None]]],
+                         stale_key: str | None, stale_ttl: int | None) -> tuple[Any, bytes | None]:
+        lease_key = SINGLE_FLIGHT_LEASE_KEY.format(key=key)
+        result_key = SINGLE_FLIGHT_RESULT_KEY.format(key=key)
+        lease_token = uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        check_stale = stale_key is not None
+        try:
+            while True:
+                data = await async_redis_client.get(result_key)
+                if data is not None:
+                    metrics.incr('single_flight.shared')
+                    return None, data
+                if await async_redis_client.set(lease_key, lease_token, nx=True, px=self.lease_ms):
+                    break
+                if check_stale:
+                    check_stale = False
+                    data = await async_redis_client.get(stale_key)
+                    if data is not None:
+                        metrics.incr('single_flight.stale')
+                        return None, data
+                if time.monotonic() >= deadline:
+                    metrics.incr('single_flight.fallbacks')
+                    return await compute()
+                await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        except RedisError as e:
+            logger.exception(e, exc_info=True)
+            return await compute()
+
+        metrics.incr('single_flight.computations')
+        try:
+            value, data = await compute()
+            if data is not None:
+                await self._store_result(result_key, data, stale_key, stale_ttl)
+            return value, data
+        finally:
+            await self._release_lease(lease_key, lease_token)
+
+    async def _store_result(self, result_key: str, data: bytes, stale_key: str | None,
+                            stale_ttl: int | None) -> None:
+        try:
+            pipe = async_redis_client.pipeline(transaction=False)
+            pipe.set(result_key, data, ex=self.result_ttl)
+            if stale_key is not None:
+                pipe.set(stale_key, data, ex=stale_ttl)
+            await pipe.execute()
+        except RedisError as e:
+            logger.exception(e, exc_info=True)
+
+    @staticmethod
+    async def _release_lease(lease_key: str, lease_token: str) -> None:
+        """ Deletes the lease, unless it expired and was taken by another worker meanwhile. """
+        async with async_redis_client.pipeline() as pipe:
+            try:
+                await pipe.watch(lease_key)
+                if await pipe.get(lease_key) != lease_token.encode('utf-8'):
+                    return
+                pipe.multi()
+                pipe.delete(lease_key)
+                await pipe.execute()
+            except WatchError:
+                pass
+            except RedisError as e:
+                logger.exception(e, exc_info=True)
+
+
+async_single_flight = AsyncSingleFlight(SINGLE_FLIGHT_LEASE_MS, SINGLE_FLIGHT_WAIT_TIMEOUT, SINGLE_FLIGHT_RESULT_TTL)
+
+
+def to_response(request: Request, resp: dict | tuple[dict, bytes | None] | Response, etag: str | None,
+                cache_control: str) -> Response:
+    """ Turns the return value of a conditional_get handler into its response. """
+    if isinstance(resp, Response):
+        return resp
+    if isinstance(resp, tuple):
+        resp, raw_data = resp
+        return create_response(request, resp, etag, cache_control, raw_data)
+    return create_response(request, resp, etag, cache_control)
+
+
+async def call_coalesced(request: Request, handler: Callable, etag: str, cache_control: str,
+                         stale_ttl: int | None = None) -> Response:
+    """
+    The counterpart of cache_util.call_coalesced. Successful json responses are shared in the same format,
+    the ETag and the uncompressed body.
+    """
+    async def compute() -> tuple[Response, bytes | None]:
+        resp = await handler(request)
+        if isinstance(resp, Response):
+            return resp, None
+        resp, raw_data = resp if isinstance(resp, tuple) else (resp, None)
+        if not resp.get('status'):
+            return create_response(request, resp, raw_data=raw_data), None
+        body = dumps_json(resp) if raw_data is None else dumps_json_with_raw(resp, 'data', raw_data)
+        return create_json_response(request, body, etag, cache_control), etag.encode('utf-8') + b'\n' + body
+
+    stale_key = None
+    if stale_ttl is not None:
+        stale_key = CATALOG_STALE_KEY.format(path=request.url.path,
+                                             query_string='&'.join(sorted(request.url.query.split('&'))))
+    response, data = await async_single_flight.do(etag, compute, stale_key, stale_ttl)
+    if response is not None:
+        return response
+
+    data_etag, body = data.split(b'\n', 1)
+    return create_json_response(request, body, data_etag.decode('utf-8'), cache_control)
+
+
+def conditional_get(*entity_types: str, rotate_every: int | None = None, coalesce: bool = False,
+                    stale_while_revalidate: bool = CATALOG_STALE_WHILE_REVALIDATE) -> Callable:
+    """
+    The counterpart of cache_util.conditional_get. Decorated handlers return a response dict, a tuple of
+    response dict and raw json data, see utils.dumps_json_with_raw, or a Response which is sent as it is.
+    """
+    cache_control = get_cache_control(get_catalog_max_age(rotate_every))
+    stale_ttl = min(CATALOG_STALE_TTL, rotate_every) if rotate_every else CATALOG_STALE_TTL
+
+    def decorator(handler: Callable) -> Callable:
+        @wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            etag = await compute_catalog_etag(request, entity_types, rotate_every)
+            if etag is not None:
+                encoding = choose_content_encoding(parse_accept_header(request.headers.get('accept-encoding')))
+                if_none_match = parse_etags(request.headers.get('if-none-match'))
+                for etag_ in {get_encoded_etag(etag, encoding), etag}:
+                    if if_none_match.contains(etag_):
+                        return Response(status_code=304, headers={'ETag': quote_etag(etag_),
+                                                                  'Cache-Control': cache_control,
+                                                                  'Vary': 'Accept-Encoding'})
+
+                body = compressed_response_cache.get(etag, encoding) if encoding is not None else None
+                if body is not None:
+                    return Response(body, media_type='application/json',
+                                    headers={'ETag': quote_etag(get_encoded_etag(etag, encoding)),
+                                             'Content-Encoding': encoding, 'Cache-Control': cache_control,
+                                             'Vary': 'Accept-Encoding'})
+
+            if etag is not None and coalesce:
+                return await call_coalesced(request, handler, etag, cache_control,
+                                            stale_ttl if stale_while_revalidate else None)
+            return to_response(request, await handler(request), etag, cache_control)
+        return wrapper
+    return decorator
+
+
+async def create_streaming_response(request: Request, resp_json: dict, query: Query,
+                                    to_dict: Callable[[Any], dict]) -> Response | dict:
+    """
+    The counterpart of utils.create_streaming_response. Rows are read through a server side cursor in batches
+    of STREAM_BATCH_SIZE. The first row is read before the response is started, if the query fails resp_json
+    is returned as an error response dict instead. Later failures abort the response, like in the sync app.
+    """
+    session = get_read_session(request)
+    try:
+        result = await session.stream(query.statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        rows = aiter(result)
+        first_row = await anext(rows, None)
+    except Exception as e:
+        await session.close()
+        resp_json['msg'] = 'Something went wrong.'
+        resp_json['status_code'] = 5000
+        resp_json['status'] = False
+        logger.exception(e, exc_info=True)
+        return resp_json
+
+    resp_head = dumps_json(resp_json)
+
+    async def generate():
+        chunk = bytearray(resp_head[:-1])
+        chunk += b',"data":['
+        try:
+            if first_row is not None:
+                chunk += dumps_json(to_dict(first_row))
+                async for row in rows:
+                    chunk += b','
+                    chunk += dumps_json(to_dict(row))
+                    if len(chunk) >= STREAM_CHUNK_SIZE:
+                        yield bytes(chunk)
+                        chunk.clear()
+            chunk += b']}'
+            yield bytes(chunk)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            raise
+        finally:
+            await session.close()
+
+    return StreamingResponse(generate(), media_type='application/json')
+
+
+async def fetch_all(request: Request, query: Query) -> list:
+    async with get_read_session(request) as session:
+        return (await session.execute(query.statement)).all()
+
+
+@jwt_required
+@conditional_get(EntityType.MOVIES, rotate_every=PRE_SIGNED_URL_REFRESH_MARGIN, coalesce=True)
+async def list_movies(request: Request) -> dict | Response:
+    resp = {'msg': 'Movies fetched successfully!', 'data': [], 'next_cursor': None, 'status_code': 2000,
+            'status': True}
+    try:
+        req_args = request.query_params
+        only_new = req_args.get('only_new')
+        if only_new == 'all':
+            only_new = None
+        movies_query = MovieModel.list_movies_query(statement_builder, only_new, decode_cursor(req_args.get('after')))
+
+        if req_args.get('stream') == 'true':
+            return await create_streaming_response(request, {'msg': resp['msg'], 'status_code': 2000, 'status': True},
+                                                   movies_query, MovieModel.to_movie_dict)
+
+        limit = get_page_size(get_int_arg(req_args, 'limit'), req_args.get('after'))
+        movie_rows = await fetch_all(request, movies_query.limit(get_fetch_size(limit)))
+        resp['data'], resp['next_cursor'] = paginate([MovieModel.to_movie_dict(row) for row in movie_rows], limit)
+    except ValueError as ve:
+        resp['msg'] = str(ve)
+        resp['status_code'] = 4000
+        resp['status'] = False
+        logger.exception(ve, exc_info=True)
+    except Exception as e:
+        resp['msg'] = 'Something went wrong.'
+        resp['status_code'] = 5000
+        resp['status'] = False
+        logger.exception(e, exc_info=True)
+    return resp
+
+
+@jwt_required
+@conditional_get(EntityType.THEATERS)
+async def list_theaters(request: Request) -> dict | Response:
+    resp = {'msg': 'Theaters fetched successfully!', 'data': [], 'next_cursor': None, 'status': True,
+            'status_code': 2000}
+    try:
+        req_args = request.query_params
+        theaters_query = TheaterModel.get_theaters_list_query(statement_builder, decode_cursor(req_args.get('after')))
+
+        if req_args.get('stream') == 'true':
+            return await create_streaming_response(request, {'msg': resp['msg'], 'status': True, 'status_code': 2000},
+                                                   theaters_query, TheaterRecord.row_to_dict)
+
+        limit = get_page_size(get_int_arg(req_args, 'limit'), req_args.get('after'))
+        theater_rows = await fetch_all(request, theaters_query.limit(get_fetch_size(limit)))
+        resp['data'], resp['next_cursor'] = paginate([TheaterRecord.row_to_dict(row) for row in theater_rows], limit)
+        if len(theater_rows) == 0:
+            resp['msg'] = 'No Theaters Found.'
+            resp['status'] = False
+    except ValueError as ve:
+        resp['msg'] = str(ve)
+        resp['status'] = False
+        resp['status_code'] = 4000
+        logger.exception(ve, exc_info=True)
+    except Exception as e:
+        resp['msg'] = 'Something went wrong.'
+        resp['status'] = False
+        resp['status_code'] = 5000
+        logger.exception(e, exc_info=True)
+    return resp
+
+
+@jwt_required
+@conditional_get(EntityType.THEATER_SCREENS)
+async def list_theater_screens(request: Request) -> dict:
+    resp = {'msg': 'Theater screens fetched successfully!', 'data': [], 'next_cursor': None, 'status': True,
+            'status_code': 2000}
+    try:
+        req_args = request.query_params
+        theater_id = request.path_params['theater_id']
+        limit = get_page_size(get_int_arg(req_args, 'limit'), req_args.get('after'))
+        screens_query = TheaterScreenModel.get_theater_screens_query(statement_builder, theater_id,
+                                                                     decode_cursor(req_args.get('after')))
+        screen_rows = await fetch_all(request, screens_query.limit(get_fetch_size(limit)))
+        resp['data'], resp['next_cursor'] = paginate([TheaterScreenRecord.row_to_dict(row) for row in screen_rows],
+                                                     limit)
+    except ValueError as ve:
+        resp['msg'] = str(ve)
+        resp['status'] = False
+        resp['status_code'] = 4000
+        logger.exception(ve, exc_info=True)
+    except Exception as e:
+        resp['msg'] = 'Something went wrong.'
+        resp['status'] = False
+        resp['status_code'] = 5000
+        logger.exception(e, exc_info=True)
+    return resp
+
+
+async def get_now_showing(movie_id: int) -> bytes:
+    """ The counterpart of ShowTimingsModel.get_now_showing and build_now_showing. """
+    now_showing_key = NOW_SHOWING_KEY.format(movie_id=movie_id)
+    generation_key = NOW_SHOWING_GENERATION_KEY.format(movie_id=movie_id)
+    now_showing_json, generation = await async_redis_client.mget([now_showing_key, generation_key])
+    if now_showing_json is not None:
+        return now_showing_json
+
+    async with AsyncSession() as session:
+        now_showing_json = (await session.execute(ShowTimingsModel.list_theater_screens_json_query(
+            statement_builder, movie_id).statement)).scalar().encode('utf-8')
+    async with async_redis_client.pipeline() as pipe:
+        try:
+            await pipe.watch(generation_key)
+            if await pipe.get(generation_key) == generation:
+                pipe.multi()
+                pipe.set(now_showing_key, now_showing_json, ex=NOW_SHOWING_TTL)
+                await pipe.execute()
+        except WatchError:
+            pass
+    return now_showing_json
+
+
+@jwt_required
+@conditional_get(EntityType.THEATERS, EntityType.THEATER_SCREENS, EntityType.SHOW_TIMINGS, coalesce=True)
+async def theater_screens_by_movie(request: Request) -> dict | tuple[dict, bytes | None]:
+    resp = {'msg': 'Movie screens fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
+    try:
+        if LIST_SCREENS_IMPL != 'legacy':
+            theater_screens_json = await get_now_showing(request.path_params['movie_id'])
+            if theater_screens_json == b'[]':
+                resp['msg'] = 'No Theaters Found!'
+            return resp, theater_screens_json
+
+        show_timing_rows = await fetch_all(request, ShowTimingsModel.list_theater_screens_query(
+            statement_builder, request.path_params['movie_id']))
+        if len(show_timing_rows) == 0:
+            resp['msg'] = 'No Theaters Found!'
+        resp['data'] = ShowTimingsModel.group_theater_screens(show_timing_rows)
+    except Exception as e:
+        resp['msg'] = 'Something went wrong.'
+        resp['status'] = False
+        resp['status_code'] = 5000
+        logger.exception(e, exc_info=True)
+    return resp
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    start_background_workers()
+    yield
+    await async_engine.dispose()
+    for replica_engine in async_replica_engines.values():
+        await replica_engine.dispose()
+    await async_redis_client.close()
+
+
+app = Starlette(routes=[
+    Route('/movies/list', list_movies, methods=['GET']),
+    Route('/theaters/list', list_theaters, methods=['GET']),
+    Route('/theaters/screens/{theater_id:int}', list_theater_screens, methods=['GET']),
+    Route('/theaters/list-screens/{movie_id:int}', theater_screens_by_movie, methods=['GET']),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+], lifespan=lifespan)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable
+
+from flask import g, request
+from flask_jwt_extended import decode_token, get_unverified_jwt_headers
+from flask_jwt_extended.config import config
+from flask_jwt_extended.exceptions import InvalidHeaderError, NoAuthorizationError, RevokedTokenError, WrongTokenError
+
+from db_config import redis_client as rc
+from log_util import get_logger
+from metrics_util import metrics
+
+logger = get_logger(__name__)
+
+# Number of verified access tokens kept per worker, each is kept until it expires.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('auth_token_cache_size', 10000))
+
+# Per user session epoch. Tokens carry the epoch of their user at login, incrementing it revokes all of them.
+# The key has no expiry, so it is not evicted before the tokens it revokes.
+USER_EPOCH_KEY = 'user_epoch:{user_id}'
+USER_ID_CLAIM = 'uid'
+USER_EPOCH_CLAIM = 'epoch'
+
+
+class VerifiedTokenCache:
+    """
+    A thread safe LRU cache of the decoded header and claims of verified tokens, keyed by the sha256 of the
+    encoded token. Entries expire with their token, so an expired token is decoded, and rejected, again.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tokens: OrderedDict[bytes, tuple[dict, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def get(self, token_hash: bytes) -> tuple[dict, dict] | None:
+        with self._lock:
+            token = self._tokens.get(token_hash)
+            if token is None:
+                return None
+            if token[1]['exp'] <= time.time():
+                del self._tokens[token_hash]
+                return None
+            self._tokens.move_to_end(token_hash)
+            return token
+
+    def set(self, token_hash: bytes, jwt_header: dict, jwt_data: dict) -> None:
+        with self._lock:
+            self._tokens[token_hash] = (jwt_header, jwt_data)
+            self._tokens.move_to_end(token_hash)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+
+verified_token_cache = VerifiedTokenCache(AUTH_TOKEN_CACHE_SIZE)
+metrics.register_gauge('auth.token_cache.entries', lambda: len(verified_token_cache))
+
+
+def get_session_claims(identity: dict) -> dict:
+    """
+    Claims added to the tokens created at login, the id of the user and its current session epoch.
+    :param identity: The identity passed to create_access_token().
+    :return: The additional claims.
+    """
+    user_id = identity['id']
+    return {USER_ID_CLAIM: user_id, USER_EPOCH_CLAIM: int(rc.get(USER_EPOCH_KEY.format(user_id=user_id)) or 0)}
+
+
+def get_session_keys(jwt_data: dict, identity_claim_key: str) -> list[str]:
+    """
+    Returns the redis keys of the claims of the session of a token and of the session epoch of its user.
+    :param jwt_data: The claims of the token.
+    :param identity_claim_key: The claim holding the identity, the session claims key.
+    :return: The two keys.
+    """
+    return [jwt_data[identity_claim_key], USER_EPOCH_KEY.format(user_id=jwt_data.get(USER_ID_CLAIM, ''))]
+
+
+def is_session_revoked(jwt_data: dict, user_claims: str | bytes | None, user_epoch: str | bytes | None) -> bool:
+    """
+    A token is revoked when the claims of its session were removed by a logout, or when the session epoch of its
+    user was incremented after the token was created.
+    :param jwt_data: The claims of the token.
+    :param user_claims: The value of the session claims key.
+    :param user_epoch: The value of the session epoch key of the user.
+    :return: True if the token is revoked.
+    """
+    return user_claims is None or jwt_data.get(USER_EPOCH_CLAIM, 0) < int(user_epoch or 0)
+
+
+def revoke_user_sessions(user_id: str) -> int:
+    """
+    Revokes every token of a user with one INCR of its session epoch.
+    :param user_id: Id of the user.
+    :return: The new session epoch.
+    """
+    return rc.incr(USER_EPOCH_KEY.format(user_id=user_id))
+
+
+def get_encoded_token() -> str:
+    """ Reads the access token from the JWT header the way flask_jwt_extended does. """
+    header_name, header_type = config.header_name, config.header_type
+    auth_header = request.headers.get(header_name, '').strip().strip(',')
+    if not auth_header:
+        raise NoAuthorizationError(f'Missing {header_name} Header')
+
+    parts = auth_header.split()
+    if header_type:
+        if len(parts) != 2 or parts[0] != header_type:
+            raise InvalidHeaderError(f"Bad {header_name} header. Expected '{header_name}: {header_type} <JWT>'")
+        return parts[1]
+    if len(parts) != 1:
+        raise InvalidHeaderError(f"Bad {header_name} header. Expected '{header_name}: <JWT>'")
+    return parts[0]
+
+
+def verify_access_token() -> None:
+    """
+    This method does the checks of jwt_required() with one redis round trip. The signature of a token is only
+    verified the first time a worker sees it. The claims of the session and the session epoch of the user are
+    fetched with one MGET to check the token is not revoked, the claims are kept on the request context for
+    get_user_claims().
+    It raises the exceptions of flask_jwt_extended, so failures get the same responses as with jwt_required().
+    """
+    if request.method in config.exempt_methods:
+        return
+
+    encoded_token = get_encoded_token()
+    token_hash = hashlib.sha256(encoded_token.encode('utf-8')).digest()
+    verified_token = verified_token_cache.get(token_hash)
+    if verified_token is not None:
+        metrics.incr('auth.token_cache.hits')
+        jwt_header, jwt_data = verified_token
+    else:
+        metrics.incr('auth.token_cache.misses')
+        jwt_data = decode_token(encoded_token)
+        jwt_header = get_unverified_jwt_headers(encoded_token)
+        if jwt_data['type'] == 'refresh':
+            raise WrongTokenError('Only non-refresh tokens are allowed')
+        verified_token_cache.set(token_hash, jwt_header, jwt_data)
+
+    user_claims, user_epoch = rc.mget(get_session_keys(jwt_data, config.identity_claim_key))
+    if is_session_revoked(jwt_data, user_claims, user_epoch):
+        raise RevokedTokenError(jwt_header, jwt_data)
+
+    g._jwt_extended_jwt_user = None
+    g._jwt_extended_jwt_header = jwt_header
+    g._jwt_extended_jwt = jwt_data
+    g._jwt_extended_jwt_location = 'headers'
+    g.user_claims = json.loads(user_claims)
+
+
+def auth_required() -> Callable:
+    """
+    Replacement of jwt_required() for access tokens sent in the JWT header. get_jwt() and get_jwt_identity()
+    work as usual in decorated endpoints. Token verification and user lookup loaders are not called,
+    the app does not register any.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            verify_access_token()
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_user_claims() -> dict | None:
+    """ Returns the claims of the user of the current request, stored by user_identity_loader at login. """
+    return g.get('user_claims')
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the response json encoders on a 1,000 movie /movies/list payload.
+
+    python benchmarks/bench_json_encoder.py [--movies 1000] [--rounds 200]
+
+It compares the former json.dumps(cls=TimeTypeEncoder) path with utils.dumps_json using the
+standard json module and orjson.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utils reads its settings from the environment, the values are not used by the benchmark.
+for env_var in ('database', 'username', 'password', 'host', 'movie_data_s3_bucket', 'aws_region'):
+    os.environ.setdefault(env_var, 'benchmark')
+os.environ.setdefault('port', '5432')
+
+import utils  # noqa: E402
+
+
+class LegacyTimeTypeEncoder(json.JSONEncoder):
+    """ Copy of the TimeTypeEncoder create_response used before the type dispatch table. """
+
+    def default(self, obj: Any) -> Any:
+        if isinstance(obj, datetime.time):
+            time_str = obj.strftime('%H:%M:%S')
+            return time_str
+        if isinstance(obj, datetime.datetime):
+            datetime_str = obj.strftime('%a, %d %b %Y %H:%M:%S %Z')
+            return datetime_str
+        if obj == "":
+            print(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+def build_movies_payload(no_of_movies: int) -> dict:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    signature = f'X-Amz-Signature={"a" * 64}'
+    movies = []
+    for movie_id in range(1, no_of_movies + 1):
+        movies.append({
+            'id': movie_id,
+            'movie_name': f'Movie {movie_id}',
+            'image_urls': [f'https://bucket.s3.amazonaws.com/Movie_{movie_id}/still_{idx}.png?{signature}'
+                           for idx in range(4)],
+            'video_urls': [f'https://bucket.s3.amazonaws.com/Movie_{movie_id}/trailer.mp4?{signature}'],
+            # The former encoder does not handle Decimal, the rating is passed as a float to all the encoders.
+            'movie_rating': 7.5,
+            'is_brand_new': movie_id % 2 == 0,
+            'is_deleted': False,
+            'movie_start_date': now,
+            'created_at': now,
+            'modified_at': now - datetime.timedelta(days=1),
+        })
+    return {'msg': 'Movies fetched successfully!', 'data': movies, 'status_code': 2000, 'status': True}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    payload = build_movies_payload(args.movies)
+    encoders = {'json.dumps(cls=LegacyTimeTypeEncoder)': lambda: json.dumps(payload,
+                                                                            cls=LegacyTimeTypeEncoder).encode(),
+                'dumps_json (std json)': lambda: json.dumps(payload, default=utils.json_default, ensure_ascii=False,
+                                                            separators=(',', ':')).encode('utf-8')}
+    if utils.orjson is not None:
+        encoders['dumps_json (orjson)'] = lambda: utils.orjson.dumps(payload, default=utils.json_default,
+                                                                     option=utils.ORJSON_OPTIONS)
+
+    baseline = None
+    print(f'{args.movies} movies, {args.rounds} rounds')
+    for name, encoder in encoders.items():
+        size = len(encoder())
+        seconds = min(timeit.repeat(encoder, number=args.rounds, repeat=3)) / args.rounds
+        baseline = baseline or seconds
+        print(f'{name:42} {seconds * 1000:8.3f} ms/response {1 / seconds:9.1f} responses/s '
+              f'{size / 1024:8.1f} KiB  x{baseline / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark of the two implementations of /theaters/list-screens/<movie_id> against a database:
+list_theater_screens, which regroups the joined rows in python, and list_theater_screens_json, where
+Postgres builds the json document. Both include serializing the response body.
+
+    python benchmarks/bench_list_screens.py --movie-id 1 [--rounds 50]
+
+The database settings are read from the environment like the app does, use a database with show timings
+for the movie, e.g. the dataset seeded by `flask --app application check-query-plans`.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import Session  # noqa: E402
+from models.theater_model import ShowTimingsModel  # noqa: E402
+from utils import dumps_json, dumps_json_with_raw  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--movie-id', type=int, required=True)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    resp = {'msg': 'Movie screens fetched successfully!', 'status': True, 'status_code': 2000}
+    with Session() as session:
+        def legacy() -> bytes:
+            theater_screen_list, _, _ = ShowTimingsModel.list_theater_screens(args.movie_id, session=session)
+            return dumps_json({**resp, 'data': theater_screen_list})
+
+        def json_agg() -> bytes:
+            theater_screens_json, _, _ = ShowTimingsModel.list_theater_screens_json(args.movie_id, session=session)
+            return dumps_json_with_raw(resp, 'data', theater_screens_json.encode('utf-8'))
+
+        print(f'movie {args.movie_id}, {args.rounds} rounds, response of {len(legacy())} / {len(json_agg())} bytes')
+        for name, case in {'legacy': legacy, 'json_agg': json_agg}.items():
+            seconds = min(timeit.repeat(case, number=args.rounds, repeat=3)) / args.rounds
+            print(f'{name:10} {seconds * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of the read path serialization: Pydantic from_orm(...).dict() on ORM objects against
+mapping selected column tuples with the read records of models.read_models.
+
+    python benchmarks/bench_read_records.py [--rows 1000] [--rounds 50]
+
+It covers the /movies/list rows and the theater/screen/show timing rows of /theaters/list-screens.
+The database is not used, rows are built in memory.
+"""
+import argparse
+import datetime
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The models read their settings from the environment, the values are not used by the benchmark.
+for env_var in ('database', 'username', 'password', 'host', 'movie_data_s3_bucket', 'aws_region'):
+    os.environ.setdefault(env_var, 'benchmark')
+os.environ.setdefault('port', '5432')
+
+from models.movies_model import MovieModel, PydntMovieModel  # noqa: E402
+from models.read_models import MovieRecord, TheaterRecord, TheaterScreenRecord, ShowTimingRecord  # noqa: E402
+from models.theater_model import (PydntTheaterModel, PydntTheaterScreenModel, PydntShowTimings,  # noqa: E402
+                                  TheaterModel, TheaterScreenModel, ShowTimingsModel)
+
+
+def build_movies(no_of_rows: int) -> tuple[list, list]:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    objs, rows = [], []
+    for movie_id in range(1, no_of_rows + 1):
+        values = {'id': movie_id, 'movie_name': f'Movie {movie_id}',
+                  'image_urls': [f'https://bucket.S3.region.amazonaws.com/Movie/still_{idx}.png' for idx in range(4)],
+                  'video_urls': ['https://bucket.S3.region.amazonaws.com/Movie/trailer.mp4'],
+                  'movie_rating': Decimal('7.5'), 'is_brand_new': True, 'is_deleted': False,
+                  'movie_start_date': now, 'movie_end_date': now + datetime.timedelta(days=7),
+                  'created_at': now, 'modified_at': now}
+        objs.append(MovieModel(**values))
+        rows.append(tuple(values[field] for field in MovieRecord.__slots__))
+    return objs, rows
+
+
+def build_show_timings(no_of_rows: int) -> tuple[list, list]:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    objs, rows = [], []
+    for show_id in range(1, no_of_rows + 1):
+        theater = {'id': show_id % 50, 'name': 'Theater', 'no_of_screens': 4, 'created_at': now, 'modified_at': now,
+                   'is_deleted': False}
+        screen = {'id': show_id % 200, 'name': 'Screen', 'theater_id': show_id % 50, 'status': 1, 'total_seats': 120,
+                  'created_at': now, 'modified_at': now, 'is_deleted': False}
+        show_timing = {'id': show_id, 'screen_id': show_id % 200, 'movie_id': 1, 'theater_id': show_id % 50,
+                       'show_starts_at': datetime.time(show_id % 24, 0), 'is_currently_running': True,
+                       'created_at': now, 'modified_at': now}
+        objs.append((TheaterModel(**theater), TheaterScreenModel(**screen), ShowTimingsModel(**show_timing)))
+        rows.append(tuple(theater[field] for field in TheaterRecord.__slots__)
+                    + tuple(screen[field] for field in TheaterScreenRecord.__slots__)
+                    + tuple(show_timing[field] for field in ShowTimingRecord.__slots__))
+    return objs, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    movie_objs, movie_rows = build_movies(args.rows)
+    show_timing_objs, show_timing_rows = build_show_timings(args.rows)
+    screen_offset = len(TheaterRecord.__slots__)
+    show_timing_offset = screen_offset + len(TheaterScreenRecord.__slots__)
+
+    cases = {
+        'movies: PydntMovieModel.from_orm': lambda: [PydntMovieModel.from_orm(obj).dict() for obj in movie_objs],
+        'movies: MovieRecord.row_to_dict': lambda: [MovieRecord.row_to_dict(row) for row in movie_rows],
+        'list-screens: from_orm x3': lambda: [(PydntTheaterModel.from_orm(theater).dict(),
+                                               PydntTheaterScreenModel.from_orm(screen).dict(),
+                                               PydntShowTimings.from_orm(show_timing).dict())
+                                              for theater, screen, show_timing in show_timing_objs],
+        'list-screens: records': lambda: [(TheaterRecord.row_to_dict(row),
+                                           TheaterScreenRecord.row_to_dict(row, screen_offset),
+                                           ShowTimingRecord.row_to_dict(row, show_timing_offset))
+                                          for row in show_timing_rows],
+    }
+
+    print(f'{args.rows} rows, {args.rounds} rounds')
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.rounds, repeat=3)) / args.rounds
+        print(f'{name:36} {seconds * 1000:8.3f} ms {seconds / args.rows * 1e6:8.2f} us/row')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Load test of the catalog endpoints, used to compare the Flask app with the asyncio serving mode of asgi.py.
+Start the server in one of the modes, against the same database and redis:
+
+    python application.py
+    uvicorn asgi:app --port 5001
+
+and run
+
+    python benchmarks/load_test.py --token <access token> [--url http://127.0.0.1:5001] [--concurrency 64]
+                                   [--duration 30] [--path /movies/list?only_new=all ...]
+
+Requests are sent without If-None-Match, so every request is served by the endpoint and not answered with 304.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_PATHS = ['/movies/list?only_new=all&limit=100', '/theaters/list?limit=100', '/theaters/screens/1',
+                 '/theaters/list-screens/1']
+
+
+def run_worker(url: str, token: str, duration: float, latencies: list[float], errors: list[int],
+               lock: threading.Lock) -> None:
+    worker_latencies, worker_errors = [], 0
+    with requests.Session() as session:
+        session.headers.update({'Authorization': token, 'Accept-Encoding': 'gzip, br'})
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30)
+                if response.status_code != 200:
+                    worker_errors += 1
+            except requests.RequestException:
+                worker_errors += 1
+            worker_latencies.append(time.perf_counter() - started_at)
+
+    with lock:
+        latencies.extend(worker_latencies)
+        errors.append(worker_errors)
+
+
+def load_test(url: str, token: str, concurrency: int, duration: float) -> dict:
+    latencies, errors, lock = [], [], threading.Lock()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(run_worker, url, token, duration, latencies, errors, lock)
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else (latencies or [0.0]) * 99
+    return {'requests': len(latencies), 'errors': sum(errors), 'rps': len(latencies) / duration,
+            'p50': quantiles[49], 'p99': quantiles[98]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:5001')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--path', action='append', dest='paths')
+    args = parser.parse_args()
+
+    print(f'{args.url}, {args.concurrency} concurrent clients, {args.duration:.0f} s per path')
+    for path in args.paths or DEFAULT_PATHS:
+        result = load_test(args.url + path, args.token, args.concurrency, args.duration)
+        print(f'{path:36} {result["rps"]:9.1f} req/s  p50 {result["p50"] * 1000:8.2f} ms  '
+              f'p99 {result["p99"] * 1000:8.2f} ms  {result["requests"]} requests, {result["errors"]} errors')
+
+
+if __name__ == '__main__':
+    main()
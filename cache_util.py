@@ -0,0 +1,648 @@
+import os
+import datetime
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from functools import wraps
+from typing import Any, Callable
+from uuid import uuid4
+
+from flask import g, request, Response
+from redis import RedisError, WatchError
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from werkzeug.datastructures import Accept
+
+from db_config import redis_client as rc, is_replica_session, HAS_WRITES
+from log_util import get_logger
+from metrics_util import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = get_logger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog_version:{entity_type}'
+
+# Cache-Control of catalog responses. Catalog endpoints require a token and their bodies hold pre-signed urls,
+# so only the client may cache them, shared caches must not.
+CATALOG_CACHE_MAX_AGE = int(os.environ.get('catalog_cache_max_age', 30))
+
+# Response compression. Smaller responses are sent as they are, compressed catalog responses are cached by ETag.
+COMPRESSION_MIN_SIZE = int(os.environ.get('compression_min_size', 1024))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('compression_cache_max_bytes', 64 * 1024 * 1024))
+GZIP_COMPRESS_LEVEL = int(os.environ.get('gzip_compress_level', 6))
+BROTLI_QUALITY = int(os.environ.get('brotli_quality', 5))
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+# Read-through cache of single rows by primary key. The local tier is kept per worker, the redis tier is shared.
+ENTITY_CACHE_KEY = 'entity:{table}:{row_id}'
+ENTITY_CACHE_GENERATION_KEY = 'entity_generation:{table}:{row_id}'
+ENTITY_CACHE_CHANNEL = 'entity_cache:invalidate'
+ENTITY_CACHE_LOCAL_TTL = int(os.environ.get('entity_cache_local_ttl', 30))
+ENTITY_CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('entity_cache_local_max_entries', 10000))
+ENTITY_CACHE_REDIS_TTL = int(os.environ.get('entity_cache_redis_ttl', 300))
+
+# Request coalescing of expensive catalog endpoints. A computation holds a redis lease of SINGLE_FLIGHT_LEASE_MS,
+# other callers wait up to SINGLE_FLIGHT_WAIT_TIMEOUT seconds for its result before computing it themselves.
+SINGLE_FLIGHT_LEASE_KEY = 'single_flight:{key}:lease'
+SINGLE_FLIGHT_RESULT_KEY = 'single_flight:{key}:result'
+SINGLE_FLIGHT_LEASE_MS = int(os.environ.get('single_flight_lease_ms', 10000))
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.environ.get('single_flight_wait_timeout', 10))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get('single_flight_poll_interval', 0.02))
+SINGLE_FLIGHT_RESULT_TTL = int(os.environ.get('single_flight_result_ttl', 300))
+# With stale-while-revalidate, callers which would wait for another worker get the previous version of the
+# response, if it is at most CATALOG_STALE_TTL seconds old.
+CATALOG_STALE_KEY = 'catalog_stale:{path}?{query_string}'
+CATALOG_STALE_WHILE_REVALIDATE = os.environ.get('catalog_stale_while_revalidate', 'false') == 'true'
+CATALOG_STALE_TTL = int(os.environ.get('catalog_stale_ttl', 600))
+
+
+class CompressedResponseCache:
+    """
+    A thread safe LRU cache of compressed response bodies, keyed by ETag and content encoding.
+    It is bounded by the total size of the cached bodies.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._bodies: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+
+    def get(self, etag: str, encoding: str) -> bytes | None:
+        with self._lock:
+            body = self._bodies.get((etag, encoding))
+            if body is not None:
+                self._bodies.move_to_end((etag, encoding))
+        metrics.incr('compression_cache.hits' if body is not None else 'compression_cache.misses')
+        return body
+
+    def set(self, etag: str, encoding: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous_body = self._bodies.pop((etag, encoding), None)
+            if previous_body is not None:
+                self.size -= len(previous_body)
+            self._bodies[(etag, encoding)] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted_body = self._bodies.popitem(last=False)
+                self.size -= len(evicted_body)
+
+
+compressed_response_cache = CompressedResponseCache(COMPRESSION_CACHE_MAX_BYTES)
+metrics.register_gauge('compression_cache.bytes', lambda: compressed_response_cache.size)
+
+
+class EntityType:
+    MOVIES = 'movies'
+    THEATERS = 'theaters'
+    THEATER_SCREENS = 'theater_screens'
+    SHOW_TIMINGS = 'show_timings'
+
+
+def bump_catalog_version(*entity_types: str) -> None:
+    """
+    This method increments the version counters of the given entity types. It has to be called
+    whenever an entity of that type is written, so ETags derived from the counters change.
+    :param entity_types: EntityType values.
+    :return: None
+    """
+    try:
+        pipe = rc.pipeline(transaction=False)
+        for entity_type in entity_types:
+            pipe.incr(CATALOG_VERSION_KEY.format(entity_type=entity_type))
+        pipe.execute()
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+
+
+def get_catalog_versions(entity_types: tuple[str, ...]) -> list[int] | None:
+    try:
+        versions = rc.mget([CATALOG_VERSION_KEY.format(entity_type=entity_type) for entity_type in entity_types])
+        return [int(version or 0) for version in versions]
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        return None
+
+
+def compute_catalog_etag(entity_types: tuple[str, ...], rotate_every: int | None = None) -> str | None:
+    """
+    This method derives the ETag of the current request from the version counters of the entity types
+    the response depends on, the path and the query string. It does not touch the database.
+    :param entity_types: EntityType values the response is built from.
+    :param rotate_every: If set, the ETag also changes every rotate_every seconds. Used for responses with
+    pre-signed urls, so clients do not revalidate urls which are about to expire.
+    :return: ETag without quotes, or None if the version counters are not available.
+    """
+    versions = get_catalog_versions(entity_types)
+    if versions is None:
+        return None
+    return build_catalog_etag(request.path, request.query_string.decode('utf-8'), entity_types, versions,
+                              rotate_every)
+
+
+def build_catalog_etag(path: str, query_string: str, entity_types: tuple[str, ...], versions: list[int],
+                       rotate_every: int | None = None) -> str:
+    """ Returns the ETag of a catalog response, see compute_catalog_etag. """
+    query_string = '&'.join(sorted(query_string.split('&')))
+    etag_source = f'{path}?{query_string}|{entity_types}|{versions}'
+    if rotate_every:
+        etag_source = f'{etag_source}|{int(time.time() // rotate_every)}'
+    return hashlib.sha1(etag_source.encode('utf-8')).hexdigest()
+
+
+def get_content_encoding() -> str | None:
+    """ Returns the content encoding to use for the current request, based on Accept-Encoding. """
+    return choose_content_encoding(request.accept_encodings)
+
+
+def choose_content_encoding(accept_encodings: Accept) -> str | None:
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+
+
+def get_encoded_etag(etag: str, encoding: str | None) -> str:
+    """ Returns the ETag of the given content encoding of a response, every encoding is a separate representation. """
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+def compress_response(response: Response) -> Response:
+    """
+    after_request hook which compresses json responses of at least COMPRESSION_MIN_SIZE bytes with brotli
+    or gzip, whichever the client accepts. Compressed catalog responses are cached by ETag, so every version
+    of a catalog response is compressed once per worker.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.content_length is None or response.content_length < COMPRESSION_MIN_SIZE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = get_content_encoding()
+    if encoding is None:
+        return response
+
+    etag = g.get('catalog_etag')
+    is_cacheable = etag is not None and response.get_etag()[0] == etag
+    body = compressed_response_cache.get(etag, encoding) if is_cacheable else None
+    if body is None:
+        body = compress(response.get_data(), encoding)
+        if is_cacheable:
+            compressed_response_cache.set(etag, encoding, body)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if is_cacheable:
+        response.set_etag(get_encoded_etag(etag, encoding))
+    return response
+
+
+class SingleFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.data: bytes | None = None
+
+
+class SingleFlight:
+    """
+    Request coalescing. do() runs at most one computation per key at a time: concurrent callers in the same
+    process wait for the running call, callers in other workers wait for the result it stores in redis.
+    The computation holds a redis lease which expires, so a worker which dies while computing only holds
+    the others back until the lease expires. Without redis, calls are only coalesced within the process.
+    """
+
+    def __init__(self, lease_ms: int, wait_timeout: float, result_ttl: int):
+        self.lease_ms = lease_ms
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._calls: dict[str, SingleFlightCall] = {}
+
+    def do(self, key: str, compute: Callable[[], tuple[Any, bytes | None]], stale_key: str | None = None,
+           stale_ttl: int | None = None) -> tuple[Any, bytes | None]:
+        """
+        :param key: Key of the computation, callers with the same key get the same result.
+        :param compute: Callable without arguments, returning a value for the caller and the bytes to share
+        with the other callers, or None if the result must not be shared, like an error response.
+        :param stale_key: If set, the shared bytes are also kept under stale_key for stale_ttl seconds, and a
+        caller which would have to wait for another worker gets them right away instead.
+        :return: The value and bytes returned by compute if this caller computed them, otherwise None and the
+        shared bytes.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = SingleFlightCall()
+
+        if not is_leader:
+            metrics.incr('single_flight.coalesced')
+            if call.done.wait(self.wait_timeout) and call.data is not None:
+                return None, call.data
+            metrics.incr('single_flight.fallbacks')
+            return compute()
+
+        try:
+            value, call.data = self._do_shared(key, compute, stale_key, stale_ttl)
+            return value, call.data
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key: str, compute: Callable[[], tuple[Any, bytes | None]], stale_key: str | None,
+                   stale_ttl: int | None) -> tuple[Any, bytes | None]:
+        lease_key = SINGLE_FLIGHT_LEASE_KEY.format(key=key)
+        result_key = SINGLE_FLIGHT_RESULT_KEY.format(key=key)
+        lease_token = uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        check_stale = stale_key is not None
+        try:
+            while True:
+                data = rc.get(result_key)
+                if data is not None:
+                    metrics.incr('single_flight.shared')
+                    return None, data
+                if rc.set(lease_key, lease_token, nx=True, px=self.lease_ms):
+                    break
+                if check_stale:
+                    check_stale = False
+                    data = rc.get(stale_key)
+                    if data is not None:
+                        metrics.incr('single_flight.stale')
+                        return None, data
+                if time.monotonic() >= deadline:
+                    metrics.incr('single_flight.fallbacks')
+                    return compute()
+                time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        except RedisError as e:
+            logger.exception(e, exc_info=True)
+            return compute()
+
+        metrics.incr('single_flight.computations')
+        try:
+            value, data = compute()
+            if data is not None:
+                self._store_result(result_key, data, stale_key, stale_ttl)
+            return value, data
+        finally:
+            self._release_lease(lease_key, lease_token)
+
+    def _store_result(self, result_key: str, data: bytes, stale_key: str | None, stale_ttl: int | None) -> None:
+        try:
+            pipe = rc.pipeline(transaction=False)
+            pipe.set(result_key, data, ex=self.result_ttl)
+            if stale_key is not None:
+                pipe.set(stale_key, data, ex=stale_ttl)
+            pipe.execute()
+        except RedisError as e:
+            logger.exception(e, exc_info=True)
+
+    @staticmethod
+    def _release_lease(lease_key: str, lease_token: str) -> None:
+        """ Deletes the lease, unless it expired and was taken by another worker meanwhile. """
+        with rc.pipeline() as pipe:
+            try:
+                pipe.watch(lease_key)
+                if pipe.get(lease_key) != lease_token.encode('utf-8'):
+                    return
+                pipe.multi()
+                pipe.delete(lease_key)
+                pipe.execute()
+            except WatchError:
+                pass
+            except RedisError as e:
+                logger.exception(e, exc_info=True)
+
+
+single_flight = SingleFlight(SINGLE_FLIGHT_LEASE_MS, SINGLE_FLIGHT_WAIT_TIMEOUT, SINGLE_FLIGHT_RESULT_TTL)
+
+
+def call_coalesced(func: Callable[[], Response], etag: str, cache_control: str,
+                   stale_ttl: int | None = None) -> Response:
+    """
+    This method calls a catalog endpoint through single_flight, keyed by the ETag of the response, so
+    concurrent requests for the same version of a response run the endpoint once. Only successful json
+    responses are shared, other callers get them with the ETag they were built for.
+    :param func: The endpoint, bound to its arguments.
+    :param stale_ttl: If set, stale-while-revalidate is used, see SingleFlight.do.
+    """
+    def compute() -> tuple[Response, bytes | None]:
+        response = func()
+        if response.status_code == 200 and not response.is_streamed and response.get_etag()[0] == etag:
+            return response, etag.encode('utf-8') + b'\n' + response.get_data()
+        return response, None
+
+    stale_key = None
+    if stale_ttl is not None:
+        stale_key = CATALOG_STALE_KEY.format(path=request.path, query_string='&'.join(
+            sorted(request.query_string.decode('utf-8').split('&'))))
+    response, data = single_flight.do(etag, compute, stale_key, stale_ttl)
+    if response is not None:
+        return response
+
+    data_etag, body = data.split(b'\n', 1)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(data_etag.decode('utf-8'))
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def get_catalog_max_age(rotate_every: int | None = None) -> int:
+    return min(CATALOG_CACHE_MAX_AGE, rotate_every) if rotate_every else CATALOG_CACHE_MAX_AGE
+
+
+def get_cache_control(max_age: int) -> str:
+    return f'private, max-age={max_age}, must-revalidate'
+
+
+def apply_cache_headers(response: Response) -> Response:
+    """
+    This method sets ETag and Cache-Control on a successful catalog response. It is a no-op for
+    responses of endpoints which are not decorated with conditional_get.
+    """
+    etag = g.get('catalog_etag')
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = g.catalog_cache_control
+    return response
+
+
+def conditional_get(*entity_types: str, rotate_every: int | None = None, coalesce: bool = False,
+                    stale_while_revalidate: bool = CATALOG_STALE_WHILE_REVALIDATE) -> Callable:
+    """
+    Decorator for catalog GET endpoints. It answers with 304 Not Modified when If-None-Match matches
+    the current ETag, and with the cached compressed body when there is one, without calling the endpoint.
+    Otherwise, the endpoint is called and create_response adds ETag and Cache-Control headers to a
+    successful response.
+    :param entity_types: EntityType values the response is built from.
+    :param rotate_every: See compute_catalog_etag.
+    :param coalesce: Call the endpoint through call_coalesced, for endpoints with expensive queries.
+    :param stale_while_revalidate: With coalesce, serve the previous version of the response while another
+    worker builds the current one. Stale responses are not kept longer than rotate_every.
+    """
+    max_age = get_catalog_max_age(rotate_every)
+    stale_ttl = min(CATALOG_STALE_TTL, rotate_every) if rotate_every else CATALOG_STALE_TTL
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = compute_catalog_etag(entity_types, rotate_every)
+            if etag is None:
+                return func(*args, **kwargs)
+
+            cache_control = get_cache_control(max_age)
+            encoding = get_content_encoding()
+            for etag_ in {get_encoded_etag(etag, encoding), etag}:
+                if request.if_none_match.contains(etag_):
+                    response = Response(status=304)
+                    response.set_etag(etag_)
+                    response.headers['Cache-Control'] = cache_control
+                    response.vary.add('Accept-Encoding')
+                    return response
+
+            # The compressed body of this version of the response may be cached already.
+            body = compressed_response_cache.get(etag, encoding) if encoding is not None else None
+            if body is not None:
+                response = Response(body, mimetype='application/json')
+                response.set_etag(get_encoded_etag(etag, encoding))
+                response.headers['Content-Encoding'] = encoding
+                response.headers['Cache-Control'] = cache_control
+                response.vary.add('Accept-Encoding')
+                return response
+
+            g.catalog_etag = etag
+            g.catalog_cache_control = cache_control
+            if coalesce:
+                return call_coalesced(lambda: func(*args, **kwargs), etag, cache_control,
+                                      stale_ttl if stale_while_revalidate else None)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LocalEntityCache:
+    """
+    A thread safe LRU cache of encoded rows with a TTL, bounded by the number of entries.
+    Expired entries are dropped when they are read or evicted.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self.size += len(data)
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+local_entity_cache = LocalEntityCache(ENTITY_CACHE_LOCAL_MAX_ENTRIES, ENTITY_CACHE_LOCAL_TTL)
+
+
+def get_entity_cache_hit_ratio() -> float:
+    hits = metrics.get_counter('entity_cache.local.hits') + metrics.get_counter('entity_cache.redis.hits')
+    lookups = hits + metrics.get_counter('entity_cache.misses')
+    return hits / lookups if lookups else 0.0
+
+
+metrics.register_gauge('entity_cache.local.entries', lambda: len(local_entity_cache))
+metrics.register_gauge('entity_cache.local.bytes', lambda: local_entity_cache.size)
+metrics.register_gauge('entity_cache.hit_ratio', get_entity_cache_hit_ratio)
+
+# Values of cached rows are stored as json, with str() of the types json does not support.
+ENTITY_VALUE_DECODERS: dict[type, Callable[[Any], Any]] = {
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    Decimal: Decimal,
+}
+
+
+def get_python_type(column_attr) -> type | None:
+    try:
+        return column_attr.columns[0].type.python_type
+    except NotImplementedError:
+        return None
+
+
+def encode_entity(obj: Any) -> bytes:
+    """ Encodes the column attributes of a loaded model object. """
+    column_attrs = sa_inspect(type(obj)).column_attrs
+    return json.dumps({attr.key: getattr(obj, attr.key) for attr in column_attrs}, default=str).encode('utf-8')
+
+
+def decode_entity(model: type, data: bytes) -> Any:
+    """
+    Builds a detached model object from a row encoded with encode_entity, as if it was loaded by a query.
+    It can be added to a session and saved like any other loaded object.
+    """
+    mapper = sa_inspect(model)
+    values = json.loads(data)
+    obj = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        value = values.get(attr.key)
+        decoder = ENTITY_VALUE_DECODERS.get(get_python_type(attr)) if value is not None else None
+        set_committed_value(obj, attr.key, decoder(value) if decoder is not None else value)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def fill_entity_cache(key: str, generation_key: str, generation: bytes | None, data: bytes) -> None:
+    """
+    This method stores a row read from the database in redis, unless the row was invalidated since
+    generation was read, so a concurrent writer's invalidation is not overwritten by the older row.
+    """
+    with rc.pipeline() as pipe:
+        try:
+            pipe.watch(generation_key)
+            if pipe.get(generation_key) != generation:
+                return
+            pipe.multi()
+            pipe.set(key, data, ex=ENTITY_CACHE_REDIS_TTL)
+            pipe.execute()
+        except WatchError:
+            pass
+
+
+def get_cached_entity(model: type, row_id: int | None, session, owns_session: bool, load: Callable[[], Any]) -> Any:
+    """
+    Read-through lookup of a row by primary key: the local tier first, then redis, then load, which runs the
+    query in session. Rows are only cached when load returns one from the primary, a replica may return a row
+    which was changed and invalidated already. The cache is bypassed for sessions which have written, or which
+    hold the row already, so they see their own changes.
+    :param model: Model class of the row.
+    :param row_id: Primary key of the row.
+    :param session: Session the caller reads in.
+    :param owns_session: Whether the caller closes session once it is done. Otherwise, the cached object is
+    merged into session, like the object load would return.
+    :param load: Callable without arguments which queries the row.
+    :return: The model object, or None.
+    """
+    if row_id is None or session.info.get(HAS_WRITES) or identity_key(model, row_id) in session.identity_map:
+        return load()
+
+    key = ENTITY_CACHE_KEY.format(table=model.__tablename__, row_id=row_id)
+    generation_key = ENTITY_CACHE_GENERATION_KEY.format(table=model.__tablename__, row_id=row_id)
+    data = local_entity_cache.get(key)
+    generation = None
+    if data is not None:
+        metrics.incr('entity_cache.local.hits')
+    else:
+        try:
+            data, generation = rc.mget([key, generation_key])
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+        if data is not None:
+            metrics.incr('entity_cache.redis.hits')
+            local_entity_cache.set(key, data)
+
+    if data is None:
+        metrics.incr('entity_cache.misses')
+        obj = load()
+        if obj is not None and not is_replica_session(session):
+            data = encode_entity(obj)
+            local_entity_cache.set(key, data)
+            try:
+                fill_entity_cache(key, generation_key, generation, data)
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+        return obj
+
+    obj = decode_entity(model, data)
+    return obj if owns_session else session.merge(obj, load=False)
+
+
+def invalidate_entity(model: type, row_id: int | None) -> None:
+    """
+    This method drops a row from both tiers of the entity cache. Other workers drop it from their local tier
+    when they receive the message published on ENTITY_CACHE_CHANNEL. It has to be called after every commit
+    which changes the row.
+    """
+    if row_id is None:
+        return
+
+    key = ENTITY_CACHE_KEY.format(table=model.__tablename__, row_id=row_id)
+    generation_key = ENTITY_CACHE_GENERATION_KEY.format(table=model.__tablename__, row_id=row_id)
+    local_entity_cache.delete(key)
+    try:
+        pipe = rc.pipeline(transaction=False)
+        pipe.incr(generation_key)
+        pipe.expire(generation_key, ENTITY_CACHE_REDIS_TTL)
+        pipe.delete(key)
+        pipe.publish(ENTITY_CACHE_CHANNEL, key)
+        pipe.execute()
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+
+
+def start_entity_cache_listener():
+    """
+    This method subscribes to ENTITY_CACHE_CHANNEL in a daemon thread, which drops invalidated rows from the
+    local tier of this worker. If redis is not available, local entries only expire after ENTITY_CACHE_LOCAL_TTL.
+    :return: The listener thread, or None.
+    """
+    def drop_local_entry(message: dict) -> None:
+        local_entity_cache.delete(message['data'].decode('utf-8'))
+
+    def log_listener_error(e, pubsub, pubsub_thread) -> None:
+        logger.exception(e, exc_info=True)
+        time.sleep(1)
+
+    try:
+        pubsub = rc.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{ENTITY_CACHE_CHANNEL: drop_local_entry})
+        return pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=log_listener_error)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        return None
@@ -1,7 +1,7 @@
-import json
 from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import get_jwt_identity
 
+from auth_util import auth_required, get_user_claims
 from log_util import get_logger
 from db_config import redis_client as rc
 from utils import create_response
@@ -63,19 +63,16 @@ def login_user():
 
 
 @auth_api.route('/logout', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def logout_user():
     resp = {'msg': 'user logged out successfully', 'status_code': 2000, 'status': True}
     try:
         r_key = get_jwt_identity()
-        user_claims = json.loads(rc.get(r_key))
+        user_claims = get_user_claims()
         if not user_claims:
             return
         else:
-            jti = get_jwt()['jti']
-            rc.set(jti, "", ex=3600)
-
-            # remove claims from the cache
+            # remove claims from the cache, this revokes the token of the session
             rc.delete(r_key)
     except Exception as e:
         logger.exception(e, exc_info=True)
@@ -86,12 +83,30 @@ def logout_user():
         return resp
 
 
+@auth_api.route('/logout-all', methods=['DELETE'])
+@auth_required()
+def logout_all():
+    resp = {'msg': '', 'status_code': 2000, 'status': True}
+    try:
+        user_claims = get_user_claims()
+        status, msg = UserView.logout_all(user_claims)
+        resp['msg'] = msg
+        resp['status'] = status
+        resp['status_code'] = 5000 if not status else 2000
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Unable to logout'
+        resp['status'] = False
+        resp['status_code'] = 5000
+    return create_response(resp)
+
+
 @auth_api.route('/deactivate-user', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def deactivate_user():
     resp = {'msg': 'user deactivated successfully', 'status_code': 2000, 'status': True}
     try:
-        user_claims = json.loads(rc.get(get_jwt_identity()))
+        user_claims = get_user_claims()
         status, msg = UserView.deactivate_user(user_claims)
         resp['msg'] = msg
         resp['status'] = status
@@ -105,17 +120,17 @@ def deactivate_user():
 
 
 @auth_api.route('/forgot-password', methods=['POST'])
-@jwt_required()
+@auth_required()
 def forgot_password():
     pass
 
 
 @auth_api.route('/change-password', methods=['POST'])
-@jwt_required()
+@auth_required()
 def change_password():
     resp = {'msg': '', 'status_code': 2000, 'status': True}
     try:
-        user_claims = json.loads(rc.get(get_jwt_identity()))
+        user_claims = get_user_claims()
         req_json = request.get_json()
 
         old_password = req_json.get('old_password')
@@ -140,11 +155,11 @@ def change_password():
 
 
 @auth_api.route('/delete-user', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def delete_user():
     resp = {'msg': '', 'status_code': 2000, 'status': True}
     try:
-        user_claims = json.loads(rc.get(get_jwt_identity()))
+        user_claims = get_user_claims()
         status, msg = UserView.delete_user(user_claims)
 
         if not status:
@@ -159,7 +174,7 @@ def delete_user():
 
 
 @auth_api.route('/update-user', methods=['POST'])
-@jwt_required()
+@auth_required()
 def update_user():
     resp = {'msg': '', 'status_code': 2000, 'status': True}
     try:
@@ -171,7 +186,7 @@ def update_user():
         phone = req_json.get('phone')
 
         details = {'first_name': first_name, 'last_name': last_name, 'email_id': email_id, 'phone': phone}
-        user_claims = json.loads(rc.get(get_jwt_identity()))
+        user_claims = get_user_claims()
         status, msg = UserView.update_user(user_claims, **details)
 
         if not status:
@@ -1,7 +1,8 @@
 from flask import Blueprint, request
-from flask_jwt_extended import jwt_required
 
-from utils import create_response
+from auth_util import auth_required
+from cache_util import conditional_get, EntityType
+from utils import create_response, create_streaming_response, MAX_MEDIA_CHUNK_SIZE, PRE_SIGNED_URL_REFRESH_MARGIN
 from log_util import get_logger
 from views.movies import MoviesView, MovieStarView
 
@@ -11,7 +12,7 @@ movies_api = Blueprint('movies_api', __name__, url_prefix='/movies')
 
 
 @movies_api.route('/<int:movie_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 def get_movie(movie_id):
     resp = {'msg': 'Movie fetched successfully!', 'data': {}, 'status_code': 2000, 'status': True}
     try:
@@ -26,26 +27,34 @@ def get_movie(movie_id):
 
 
 @movies_api.route('/list', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional_get(EntityType.MOVIES, rotate_every=PRE_SIGNED_URL_REFRESH_MARGIN, coalesce=True)
 def list_movies():
     resp = {'msg': 'Movies fetched successfully!', 'data': [], 'status_code': 2000, 'status': True}
+    movies_iter = None
     try:
         req_args = request.args
         only_new = req_args.get('only_new')
         if only_new == 'all':
             only_new = None
-        resp = MoviesView.list_movies(only_new)
+        after = req_args.get('after')
+        if req_args.get('stream') == 'true':
+            resp, movies_iter = MoviesView.stream_movies(only_new, after=after)
+        else:
+            resp = MoviesView.list_movies(only_new, after=after, limit=req_args.get('limit', type=int))
     except Exception as e:
         logger.exception(e, exc_info=True)
         resp['msg'] = 'Something went wrong.'
         resp['status_code'] = 5000
         resp['status'] = False
     finally:
+        if movies_iter is not None:
+            return create_streaming_response(resp, movies_iter)
         return create_response(resp)
 
 
 @movies_api.route('/add-movie', methods=['POST'])
-@jwt_required()
+@auth_required()
 def add_movie():
     resp = {'msg': 'New movie added successfully!', 'status_code': 2001, 'status': True}
     try:
@@ -73,7 +82,7 @@ def add_movie():
 
 
 @movies_api.route('/add-movie-data/<int:movie_id>', methods=['POST'])
-@jwt_required()
+@auth_required()
 def add_movie_data(movie_id: int):
     resp = {'msg': 'Movie data added successfully!', 'status_code': 2001, 'status': True}
     try:
@@ -85,8 +94,135 @@ def add_movie_data(movie_id: int):
         return create_response(resp)
 
 
+@movies_api.route('/media-upload-urls/<int:movie_id>', methods=['POST'])
+@auth_required()
+def create_media_upload_urls(movie_id: int):
+    resp = {'msg': 'Movie media upload urls created successfully!', 'status_code': 2000, 'status': True}
+    try:
+        req_json = request.get_json()
+        media_files = req_json.get('files', [])
+
+        if not media_files:
+            resp['msg'] = 'Files are required.'
+            resp['status'] = False
+            resp['status_code'] = 4000
+            return
+
+        resp = MoviesView.create_media_upload_urls(movie_id, media_files)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
+@movies_api.route('/media-upload-complete/<int:movie_id>', methods=['POST'])
+@auth_required()
+def complete_media_upload(movie_id: int):
+    resp = {'msg': 'Movie media added successfully!', 'status_code': 2000, 'status': True}
+    try:
+        req_json = request.get_json()
+        s3_keys = req_json.get('keys', [])
+
+        if not s3_keys:
+            resp['msg'] = 'Uploaded object keys are required.'
+            resp['status'] = False
+            resp['status_code'] = 4000
+            return
+
+        resp = MoviesView.complete_media_upload(movie_id, s3_keys)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
+@movies_api.route('/media-uploads/<int:movie_id>', methods=['POST'])
+@auth_required()
+def init_media_upload(movie_id: int):
+    resp = {'msg': 'Movie media upload started successfully!', 'status_code': 2001, 'status': True}
+    try:
+        req_json = request.get_json()
+        file_name = req_json.get('file_name')
+        file_size = req_json.get('file_size')
+        content_type = req_json.get('content_type')
+
+        if not file_name:
+            resp['msg'] = 'File name is required.'
+            resp['status'] = False
+            resp['status_code'] = 4000
+            return
+
+        resp = MoviesView.init_media_upload(movie_id, file_name, file_size, content_type)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
+@movies_api.route('/media-uploads/<upload_id>/chunks/<int:part_no>', methods=['PUT'])
+@auth_required()
+def upload_media_chunk(upload_id: str, part_no: int):
+    resp = {'msg': 'Movie media chunk uploaded successfully!', 'status_code': 2000, 'status': True}
+    try:
+        content_length = request.content_length
+        if not content_length or content_length > MAX_MEDIA_CHUNK_SIZE:
+            resp['msg'] = f'Chunk size should be between 1 and {MAX_MEDIA_CHUNK_SIZE} bytes.'
+            resp['status'] = False
+            resp['status_code'] = 4000
+            return
+
+        chunk = request.stream.read(content_length)
+        resp = MoviesView.upload_media_chunk(upload_id, part_no, chunk)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
+@movies_api.route('/media-uploads/<upload_id>', methods=['GET'])
+@auth_required()
+def get_media_upload_status(upload_id: str):
+    resp = {'msg': 'Movie media upload status fetched successfully!', 'status_code': 2000, 'status': True}
+    try:
+        resp = MoviesView.get_media_upload_status(upload_id)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
+@movies_api.route('/media-uploads/<upload_id>/complete', methods=['POST'])
+@auth_required()
+def complete_chunked_media_upload(upload_id: str):
+    resp = {'msg': 'Movie media added successfully!', 'status_code': 2000, 'status': True}
+    try:
+        resp = MoviesView.complete_chunked_media_upload(upload_id)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        resp['msg'] = 'Something went wrong'
+        resp['status_code'] = 5000
+        resp['status'] = False
+    finally:
+        return create_response(resp)
+
+
 @movies_api.route('/update-movie-data/<int:movie_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_movie_info(movie_id: int):
     resp = {'msg': 'Movie data updated successfully!', 'status_code': 2000, 'status': True}
     try:
@@ -108,7 +244,7 @@ def update_movie_info(movie_id: int):
 
 
 @movies_api.route('/delete-movie/<int:movie_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def delete_movie(movie_id: int):
     resp = {'msg': 'Movie deleted successfully!', 'status_code': 2000, 'status': True}
     try:
@@ -123,7 +259,7 @@ def delete_movie(movie_id: int):
 
 
 @movies_api.route('/moviestar/<int:star_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 def get_movie_star(star_id: int):
     resp = {'msg': 'Movie-Star fetched successfully!', 'data': {}, 'status_code': 2000, 'status': True}
     try:
@@ -138,7 +274,7 @@ def get_movie_star(star_id: int):
 
 
 @movies_api.route('/moviestars/<int:movie_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 def get_all_moviestars(movie_id: int):
     resp = {'msg': 'Movie-Stars fetched successfully!', 'data': [], 'status_code': 2000, 'status': True}
     try:
@@ -153,7 +289,7 @@ def get_all_moviestars(movie_id: int):
 
 
 @movies_api.route('/moviestar', methods=['POST'])
-@jwt_required()
+@auth_required()
 def create_moviestar():
     resp = {'msg': 'Movie star added successfully!', 'status_code': 2001, 'status': True}
     try:
@@ -173,7 +309,7 @@ def create_moviestar():
 
 
 @movies_api.route('/moviestar', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_moviestar():
     resp = {'msg': 'Movie star updated successfully!', 'status_code': 2000, 'status': True}
     try:
@@ -201,7 +337,7 @@ def update_moviestar():
 
 
 @movies_api.route('/moviestar-relation', methods=['POST'])
-@jwt_required()
+@auth_required()
 def create_moviestar_relation():
     resp = {'msg': 'Movie-Star relationship created successfully!', 'status': True, 'status_code': 2001}
     try:
@@ -226,7 +362,7 @@ def create_moviestar_relation():
 
 
 @movies_api.route('/moviestar-relation', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def remove_moviestar_relation():
     resp = {'msg': 'Movie star removed successfully!', 'status_code': 2000, 'status': True}
     try:
@@ -1,10 +1,11 @@
 from flask import Blueprint, request
-from flask_jwt_extended import jwt_required
 
-from views.theater import TheaterView, TheaterScreenView, ShowTimingsView
+from views.theater import TheaterView, TheaterScreenView, ShowTimingsView, LIST_SCREENS_IMPL
 
+from auth_util import auth_required
+from cache_util import conditional_get, EntityType
 from log_util import get_logger
-from utils import create_response
+from utils import create_response, create_streaming_response
 
 
 logger = get_logger(__name__)
@@ -12,22 +13,30 @@ theater_api = Blueprint('theater_api', __name__, url_prefix='/theaters')
 
 
 @theater_api.route('/list', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional_get(EntityType.THEATERS)
 def list_theaters():
     resp = {'msg': 'Theaters fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
+    theaters_iter = None
     try:
-        resp = TheaterView.get_theater_list()
+        req_args = request.args
+        if req_args.get('stream') == 'true':
+            resp, theaters_iter = TheaterView.stream_theater_list(after=req_args.get('after'))
+        else:
+            resp = TheaterView.get_theater_list(after=req_args.get('after'), limit=req_args.get('limit', type=int))
     except Exception as e:
         logger.exception(e, exc_info=True)
         resp['msg'] = 'Something went wrong.'
         resp['status'] = False
         resp['status_code'] = 5000
     finally:
+        if theaters_iter is not None:
+            return create_streaming_response(resp, theaters_iter)
         return create_response(resp)
 
 
 @theater_api.route('/<int:theater_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 def get_theater(theater_id: int):
     resp = {'msg': 'Theater fetched successfully!', 'data': {}, 'status': True, 'status_code': 2000}
     try:
@@ -42,7 +51,7 @@ def get_theater(theater_id: int):
 
 
 @theater_api.route('/', methods=['POST'])
-@jwt_required()
+@auth_required()
 def add_theater():
     resp = {'msg': 'Theater added successfully!', 'status': True, 'status_code': 2001}
     try:
@@ -61,7 +70,7 @@ def add_theater():
 
 
 @theater_api.route('/<int:theater_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_theater(theater_id: int):
     resp = {'msg': 'Theater updated successfully!', 'status': True, 'status_code': 2000}
     try:
@@ -79,7 +88,7 @@ def update_theater(theater_id: int):
 
 
 @theater_api.route('/<int:theater_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def delete_theater(theater_id: int):
     resp = {'msg': 'Theater deleted successfully', 'status': True, 'status_code': 2000}
     try:
@@ -94,7 +103,7 @@ def delete_theater(theater_id: int):
 
 
 @theater_api.route('/screen', methods=['POST'])
-@jwt_required()
+@auth_required()
 def add_theater_screen():
     resp = {'msg': 'Screen added to the theater successfully!', 'status': True, 'status_code': 2001}
     try:
@@ -117,7 +126,7 @@ def add_theater_screen():
 
 
 @theater_api.route('/screen/<int:screen_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_theater_screen(screen_id: int):
     resp = {'msg': 'Screen information updated successfully!', 'status': True, 'status_code': 2000}
     try:
@@ -138,11 +147,14 @@ def update_theater_screen(screen_id: int):
 
 
 @theater_api.route('/screens/<int:theater_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional_get(EntityType.THEATER_SCREENS)
 def list_theater_screens(theater_id: int):
     resp = {'msg': 'Theater screens fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
     try:
-        resp = TheaterScreenView.theater_screen_list(theater_id=theater_id)
+        req_args = request.args
+        resp = TheaterScreenView.theater_screen_list(theater_id=theater_id, after=req_args.get('after'),
+                                                     limit=req_args.get('limit', type=int))
     except Exception as e:
         logger.exception(e, exc_info=True)
         resp['msg'] = 'Something went wrong.'
@@ -153,7 +165,7 @@ def list_theater_screens(theater_id: int):
 
 
 @theater_api.route('/screens/<int:screen_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def delete_screen(screen_id):
     resp = {'msg': 'Theater screen deleted successfully!', 'status': True, 'status_code': 2000}
     try:
@@ -168,7 +180,7 @@ def delete_screen(screen_id):
 
 
 @theater_api.route('/screen/show-timings', methods=['POST'])
-@jwt_required()
+@auth_required()
 def add_show_timings():
     resp = {'msg': 'Show Timings added successfully!', 'status': True, 'status_code': 2001}
     try:
@@ -191,7 +203,7 @@ def add_show_timings():
 
 
 @theater_api.route('/screen/show-timings/<int:show_timing_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_show_timings(show_timing_id: int):
     resp = {'msg': 'Show Timings updated successfully!', 'status': True, 'status_code': 2000}
     try:
@@ -214,15 +226,20 @@ def update_show_timings(show_timing_id: int):
 
 
 @theater_api.route('/list-screens/<int:movie_id>', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional_get(EntityType.THEATERS, EntityType.THEATER_SCREENS, EntityType.SHOW_TIMINGS, coalesce=True)
 def theater_screens_by_movie(movie_id: int):
     resp = {'msg': 'Movie screens fetched successfully!', 'status': True, 'status_code': 2000}
+    theater_screens_json = None
     try:
-        resp = ShowTimingsView.list_theater_screens(movie_id=movie_id)
+        if LIST_SCREENS_IMPL == 'legacy':
+            resp = ShowTimingsView.list_theater_screens(movie_id=movie_id)
+        else:
+            resp, theater_screens_json = ShowTimingsView.list_theater_screens_json(movie_id=movie_id)
     except Exception as e:
         logger.exception(e, exc_info=True)
         resp['msg'] = 'Something went wrong.'
         resp['status'] = False
         resp['status_code'] = 5000
     finally:
-        return create_response(resp)
+        return create_response(resp, raw_data=theater_screens_json)
@@ -1,10 +1,40 @@
 import os
+import threading
+import time
+from typing import Callable
 
+from flask import has_request_context, request
 from redis import Redis
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.engine import create_engine
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker, scoped_session, Session as SASession
+from sqlalchemy.engine import create_engine, Engine
+from sqlalchemy.pool import QueuePool
 from sqlalchemy import URL
 
+from log_util import get_logger
+from metrics_util import metrics
+
+logger = get_logger(__name__)
+
+# Connection pool. Recycling and pre ping replace connections which were closed by Postgres or a proxy.
+DB_POOL_SIZE = int(os.environ.get('db_pool_size', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('db_max_overflow', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('db_pool_timeout', 10))
+DB_POOL_RECYCLE = int(os.environ.get('db_pool_recycle', 1800))
+DB_POOL_PRE_PING = os.environ.get('db_pool_pre_ping', 'true') == 'true'
+
+# Statement timeout in milliseconds, set on every connection. 0 disables it.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('db_statement_timeout', 5000))
+
+# Optional read replicas, a comma separated list of host:port. They share database name and credentials.
+DB_REPLICA_HOSTS = [host for host in os.environ.get('db_replica_hosts', '').split(',') if host]
+# Seconds a replica is skipped after it failed, before it is tried again.
+DB_REPLICA_RETRY_INTERVAL = int(os.environ.get('db_replica_retry_interval', 30))
+# Seconds a client reads from the primary after it wrote, so it reads its own writes despite replication lag.
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get('db_replica_sticky_seconds', 10))
+READ_PRIMARY_COOKIE = 'read_primary'
+
 url_object = URL(
   drivername="postgresql",
   database=os.environ['database'],
@@ -15,9 +45,266 @@ url_object = URL(
   query={}
 )
 
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A QueuePool which records the time spent waiting for a connection, and checkouts which timed out.
+    The checkout event fires only once a connection was handed out, so the wait is timed around connect.
+    """
+    metrics_prefix = 'db.pool'
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            metrics.incr(f'{self.metrics_prefix}.checkout_timeouts')
+            raise
+        finally:
+            metrics.observe(f'{self.metrics_prefix}.checkout_wait', time.perf_counter() - started_at)
+
+
+def create_db_engine(url: URL, metrics_prefix: str = 'db.pool') -> Engine:
+    """
+    This method creates an engine with the configured pool and statement timeout, and exports the state
+    of its pool as metrics: connections in use, overflow connections, checkout waits, how long connections are
+    held and invalidations.
+    :param url: Database url.
+    :param metrics_prefix: Prefix of the metric names of the pool.
+    :return: Engine
+    """
+    db_engine = create_engine(url, poolclass=InstrumentedQueuePool, pool_size=DB_POOL_SIZE,
+                              max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                              pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING,
+                              connect_args={'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'})
+
+    pool = db_engine.pool
+    pool.metrics_prefix = metrics_prefix
+    metrics.register_gauge(f'{metrics_prefix}.checked_out', pool.checkedout)
+    metrics.register_gauge(f'{metrics_prefix}.overflow', lambda: max(pool.overflow(), 0))
+
+    @event.listens_for(pool, 'checkout')
+    def start_hold_timer(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.perf_counter()
+
+    @event.listens_for(pool, 'checkin')
+    def observe_hold_time(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop('checked_out_at', None)
+        if checked_out_at is not None:
+            metrics.observe(f'{metrics_prefix}.connection_hold', time.perf_counter() - checked_out_at)
+
+    @event.listens_for(pool, 'invalidate')
+    def count_invalidation(dbapi_connection, connection_record, exception):
+        metrics.incr(f'{metrics_prefix}.invalidations')
+
+    @event.listens_for(pool, 'soft_invalidate')
+    def count_soft_invalidation(dbapi_connection, connection_record, exception):
+        metrics.incr(f'{metrics_prefix}.invalidations')
+
+    return db_engine
+
+
+class ReplicaSet:
+    """
+    Engines of the read replicas, handed out round-robin. A replica whose connection fails is skipped
+    for DB_REPLICA_RETRY_INTERVAL seconds, if all of them are down, reads go to the primary.
+    """
+
+    def __init__(self, engines: list[Engine]):
+        self.engines = engines
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down_until: dict[Engine, float] = {}
+
+        for replica_engine in engines:
+            event.listen(replica_engine, 'handle_error', self._handle_error)
+
+    def get_engine(self) -> Engine | None:
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                replica_engine = self.engines[self._next]
+                self._next = (self._next + 1) % len(self.engines)
+                if self._down_until.get(replica_engine, 0) <= now:
+                    return replica_engine
+        return None
+
+    def mark_down(self, replica_engine: Engine) -> None:
+        with self._lock:
+            self._down_until[replica_engine] = time.monotonic() + DB_REPLICA_RETRY_INTERVAL
+        metrics.incr('db.replica.marked_down')
+
+    def _handle_error(self, context) -> None:
+        if context.is_disconnect and context.engine is not None:
+            logger.error(f'Replica {context.engine.url.host} is down, reading from the other replicas.')
+            self.mark_down(context.engine)
+
+
 # create db engine
-engine = create_engine(url_object, pool_size=10)
+engine = create_db_engine(url_object)
 Session = sessionmaker(bind=engine)
 
+replica_urls = [url_object.set(host=host.split(':')[0], port=int(host.split(':')[1]) if ':' in host else 5432)
+                for host in DB_REPLICA_HOSTS]
+replica_set = ReplicaSet([create_db_engine(replica_url, metrics_prefix=f'db.replica.{idx}.pool')
+                          for idx, replica_url in enumerate(replica_urls)])
+
+# One session per request, it is committed once when the request ends. Objects stay usable after the commit.
+RequestSession = scoped_session(sessionmaker(bind=engine, expire_on_commit=False),
+                                scopefunc=lambda: id(request._get_current_object()))
+
+# Read only session per request on a replica, used by GET requests.
+ReplicaRequestSession = scoped_session(lambda: Session(bind=replica_set.get_engine() or engine),
+                                       scopefunc=lambda: id(request._get_current_object()))
+
+HAS_WRITES = 'has_writes'
+
+AFTER_COMMIT_CALLBACKS = 'after_commit_callbacks'
+LAST_AFTER_COMMIT_CALLBACKS = 'last_after_commit_callbacks'
+
 # Create Redis Client
 redis_client = Redis()
+
+
+def get_session(session: SASession | None = None) -> tuple[SASession, bool]:
+    """
+    This method returns the session a model method has to use, and whether the method owns it.
+    A passed session is used as it is. Inside a request the request session is used, it is committed by the
+    application when the request ends. Otherwise, e.g. in cli commands, a new session is returned which the
+    method has to commit and close itself.
+    :param session: Session passed by the caller, if any.
+    :return: session, owns_session
+    """
+    if session is not None:
+        return session, False
+    if has_request_context():
+        return RequestSession(), False
+    return Session(), True
+
+
+def reads_from_replica() -> bool:
+    """
+    Returns whether read only queries of the current request go to a replica. GET requests read from a
+    replica, unless the client wrote recently or the request wrote already. Everything else uses the primary.
+    """
+    return (bool(replica_set.engines) and has_request_context() and request.method == 'GET'
+            and READ_PRIMARY_COOKIE not in request.cookies
+            and not request_has_writes())
+
+
+def request_has_writes() -> bool:
+    """ Returns whether the session of the current request wrote to the database. """
+    return RequestSession.registry.has() and bool(RequestSession().info.get(HAS_WRITES))
+
+
+def get_read_engine() -> Engine:
+    """ Returns the engine for read only queries which do not use a request session, like streaming queries. """
+    return (replica_set.get_engine() if reads_from_replica() else None) or engine
+
+
+def get_read_session(session: SASession | None = None) -> tuple[SASession, bool]:
+    """
+    The counterpart of get_session for read only model methods. Inside a request which reads from
+    a replica, see reads_from_replica, the replica session of the request is returned.
+    :param session: Session passed by the caller, if any.
+    :return: session, owns_session
+    """
+    if session is None and reads_from_replica():
+        return ReplicaRequestSession(), False
+    return get_session(session)
+
+
+def is_replica_session(session: SASession) -> bool:
+    """ Returns whether session reads from a replica, its rows may lag behind the primary. """
+    return session.get_bind() in replica_set.engines
+
+
+def flush_or_commit(session: SASession, owns_session: bool) -> None:
+    """ Commits an owned session. Sessions owned by a caller are only flushed, the caller commits them. """
+    if owns_session:
+        session.commit()
+    else:
+        session.flush()
+
+
+def run_after_commit(session: SASession, callback: Callable, *args, last: bool = False) -> None:
+    """
+    This method registers a callback which is called once the current transaction of the session is committed.
+    Callbacks are dropped if the transaction is rolled back. Used for side effects like cache invalidation,
+    which must not be visible before the data is.
+    :param session: Session of the transaction.
+    :param callback: Callable to run after the commit.
+    :param args: Arguments of the callback.
+    :param last: Run the callback after all the callbacks registered without it, whenever they were registered.
+    Used for catalog version bumps, so no ETag of the new version is served while caches still hold old data.
+    :return: None
+    """
+    callbacks_key = LAST_AFTER_COMMIT_CALLBACKS if last else AFTER_COMMIT_CALLBACKS
+    session.info.setdefault(callbacks_key, []).append((callback, args))
+
+
+@event.listens_for(SASession, 'after_commit')
+def _run_after_commit_callbacks(session: SASession) -> None:
+    callbacks = session.info.pop(AFTER_COMMIT_CALLBACKS, []) + session.info.pop(LAST_AFTER_COMMIT_CALLBACKS, [])
+    for callback, args in callbacks:
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+
+
+@event.listens_for(SASession, 'after_flush')
+def _mark_flushed_writes(session: SASession, flush_context) -> None:
+    session.info[HAS_WRITES] = True
+
+
+@event.listens_for(SASession, 'do_orm_execute')
+def _mark_executed_writes(orm_execute_state) -> None:
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info[HAS_WRITES] = True
+
+
+@event.listens_for(SASession, 'after_rollback')
+def _drop_after_commit_callbacks(session: SASession) -> None:
+    session.info.pop(AFTER_COMMIT_CALLBACKS, None)
+    session.info.pop(LAST_AFTER_COMMIT_CALLBACKS, None)
+    session.info.pop(HAS_WRITES, None)
+
+
+def set_statement_timeout(session: SASession, timeout: int) -> None:
+    """
+    Overrides the statement timeout for the rest of the current transaction of the session,
+    e.g. for a request which is known to run longer queries.
+    :param session: Session of the transaction.
+    :param timeout: Timeout in milliseconds, 0 disables it.
+    """
+    session.execute(text(f'SET LOCAL statement_timeout = {int(timeout)}'))
+
+
+def commit_request_session(commit: bool = True) -> bool:
+    """
+    Commits the session of the current request, if the request used one.
+    :param commit: If False the session is rolled back instead, e.g. when the request failed.
+    :return: True if the request wrote to the database and the writes were committed.
+    """
+    if not RequestSession.registry.has():
+        return False
+
+    session = RequestSession()
+    if not commit:
+        session.rollback()
+        return False
+
+    has_writes = session.info.pop(HAS_WRITES, False)
+    try:
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return has_writes
+
+
+def remove_request_session(exc: BaseException | None = None) -> None:
+    """ Closes the sessions of the current request. Anything which is not committed is rolled back. """
+    RequestSession.remove()
+    ReplicaRequestSession.remove()
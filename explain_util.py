@@ -0,0 +1,176 @@
+from sqlalchemy import text, Engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query
+
+from db_config import engine, Session, set_statement_timeout
+from models.movies_model import MovieModel
+from models.theater_model import TheaterModel, TheaterScreenModel, ShowTimingsModel
+from models.user_model import UserModel
+from models import Base
+from utils import DEFAULT_PAGE_SIZE
+
+# Schema the synthetic dataset of check_query_plans is created in. It only exists inside a rolled back transaction.
+CHECK_SCHEMA = 'query_plan_check'
+
+# Row counts of the synthetic dataset, at scale 1.
+SEED_ROW_COUNTS = {'movies': 20000, 'theaters': 10000, 'theater_screens': 50000, 'show_timings': 200000,
+                   'users': 50000}
+
+# Upper bound of the estimated total cost of every hot query on the synthetic dataset. Plans which use the
+# indexes stay far below them, a sequential scan of any of the tables exceeds them.
+QUERY_COST_BUDGETS = {
+    'movies.list': 500,
+    'movies.list_all': 500,
+    'movies.list_after': 500,
+    'theaters.list': 500,
+    'theaters.list_after': 500,
+    'theater_screens.list': 200,
+    'show_timings.list_theater_screens': 500,
+    'show_timings.list_theater_screens_json': 500,
+    'users.get_by_email': 50,
+}
+
+# Every table has every 10th to 20th row soft deleted or not running, so partial indexes are selective.
+SEED_STATEMENTS = [
+    """INSERT INTO movies (id, name, image_urls, video_urls, rating, is_brand_new, movie_start_date, movie_end_date,
+                         is_deleted, created_at)
+       SELECT i, 'movie ' || i, ARRAY[]::varchar[], ARRAY[]::varchar[], i % 10 + 0.5, i % 3 = 0, now(),
+              now() + interval '7 days', i % 10 = 0, now()
+       FROM generate_series(1, :movies) AS i""",
+    """INSERT INTO theaters (id, name, no_of_screens, is_deleted, created_at)
+       SELECT i, 'theater ' || i, 5, i % 10 = 0, now() FROM generate_series(1, :theaters) AS i""",
+    """INSERT INTO theater_screens (id, screen_name, theater_id, status, total_seats, is_deleted, created_at)
+       SELECT i, 'screen ' || i % 5, (i - 1) / 5 + 1, 1, 100, i % 20 = 0, now()
+       FROM generate_series(1, :theater_screens) AS i""",
+    """INSERT INTO show_timings (id, screen_id, movie_id, theater_id, show_starts_at, is_currently_running, created_at)
+       SELECT i, (i - 1) / 4 + 1, (i * 7919) % :movies + 1, ((i - 1) / 4) / 5 + 1,
+              time '10:00' + (i % 4) * interval '3 hours', i % 5 != 0, now()
+       FROM generate_series(1, :show_timings) AS i""",
+    """INSERT INTO users (id, first_name, last_name, email_id, password, is_active, is_deleted, created_at)
+       SELECT md5(i::text), 'first', 'last', 'user' || i || '@example.com', repeat('x', 60), true, false, now()
+       FROM generate_series(1, :users) AS i""",
+]
+
+
+def get_hot_queries(session, movie_id: int = 1, theater_id: int = 1, after_id: int = 1,
+                    email_id: str = 'user@example.com') -> dict[str, Query]:
+    """
+    This method returns the queries run on the hot paths, by name, built the same way as the model methods
+    build them. Parameters are representative values, pass ids which exist in the database.
+    :return: dict of name and query.
+    """
+    page_size = DEFAULT_PAGE_SIZE + 1
+    return {
+        'movies.list': MovieModel.list_movies_query(session, True).limit(page_size),
+        'movies.list_all': MovieModel.list_movies_query(session, None).limit(page_size),
+        'movies.list_after': MovieModel.list_movies_query(session, True, after_id).limit(page_size),
+        'theaters.list': TheaterModel.get_theaters_list_query(session).limit(page_size),
+        'theaters.list_after': TheaterModel.get_theaters_list_query(session, after_id).limit(page_size),
+        'theater_screens.list': TheaterScreenModel.get_theater_screens_query(session, theater_id).limit(page_size),
+        'show_timings.list_theater_screens': ShowTimingsModel.list_theater_screens_query(session, movie_id),
+        'show_timings.list_theater_screens_json': ShowTimingsModel.list_theater_screens_json_query(session, movie_id),
+        'users.get_by_email': UserModel.get_user_query(session, username=email_id).limit(1),
+    }
+
+
+def compile_query(query: Query) -> str:
+    """ Returns the SQL of a query with its parameters inlined. """
+    return str(query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def explain(session, query: Query, analyze: bool = False) -> dict:
+    """
+    This method returns the plan of a query, as returned by EXPLAIN (FORMAT JSON).
+    :param session: Session to run EXPLAIN in.
+    :param query: Query to explain.
+    :param analyze: If set, the query is executed and the plan includes actual timings and buffers.
+    :return: The top level plan dict, with the Plan key.
+    """
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    return session.execute(text(f'EXPLAIN ({options}) {compile_query(query)}')).scalar()[0]
+
+
+def explain_text(session, query: Query, analyze: bool = False) -> str:
+    """ Same as explain, but returns the plan as the text EXPLAIN prints by default. """
+    options = 'ANALYZE, BUFFERS' if analyze else 'COSTS'
+    return '\n'.join(session.execute(text(f'EXPLAIN ({options}) {compile_query(query)}')).scalars())
+
+
+def get_query_plans(analyze: bool = False, as_text: bool = False, **params) -> dict[str, dict | str]:
+    """ Returns the plans of all hot queries by name. See get_hot_queries for params. """
+    explain_query = explain_text if as_text else explain
+    session = Session()
+    try:
+        return {name: explain_query(session, query, analyze)
+                for name, query in get_hot_queries(session, **params).items()}
+    finally:
+        session.rollback()
+        session.close()
+
+
+def get_plan_nodes(plan: dict) -> list[dict]:
+    """ Returns all nodes of a plan tree, depth first. """
+    nodes = [plan]
+    for child_plan in plan.get('Plans', []):
+        nodes.extend(get_plan_nodes(child_plan))
+    return nodes
+
+
+def seed_synthetic_data(session, scale: float = 1) -> dict[str, int]:
+    """
+    This method creates the tables and indexes of the models in the current search_path and fills them with
+    a synthetic dataset, then updates the planner statistics.
+    :param session: Session to seed the data in.
+    :param scale: Factor applied to SEED_ROW_COUNTS.
+    :return: dict of table name and row count.
+    """
+    Base.metadata.create_all(session.connection())
+    row_counts = {table: max(int(row_count * scale), 1) for table, row_count in SEED_ROW_COUNTS.items()}
+    for statement in SEED_STATEMENTS:
+        session.execute(text(statement), row_counts)
+    session.execute(text('ANALYZE'))
+    return row_counts
+
+
+def check_query_plans(scale: float = 1, budget_scale: float = 1,
+                      bind: Engine | None = None) -> tuple[dict[str, dict], list[str]]:
+    """
+    This method seeds a synthetic dataset into a temporary schema and checks the plans of all hot queries.
+    A plan fails the check if it contains a sequential scan or its estimated total cost exceeds the
+    budget in QUERY_COST_BUDGETS. Everything runs in one transaction which is rolled back, nothing is kept.
+    :param scale: Factor applied to SEED_ROW_COUNTS.
+    :param budget_scale: Factor applied to QUERY_COST_BUDGETS.
+    :param bind: Engine of the database to run the check in, defaults to the engine of the app.
+    :return: plans by query name, list of failures.
+    """
+    plans, failures = {}, []
+    with (bind or engine).connect() as connection:
+        session = Session(bind=connection)
+        try:
+            session.execute(text(f'CREATE SCHEMA {CHECK_SCHEMA}'))
+            session.execute(text(f'SET LOCAL search_path TO {CHECK_SCHEMA}'))
+            # Seeding runs longer than the statement timeout of the application.
+            set_statement_timeout(session, 0)
+            row_counts = seed_synthetic_data(session, scale)
+
+            # Representative parameters, the first page of every list, a page in the middle and existing rows.
+            movie_id = session.execute(text('SELECT movie_id FROM show_timings WHERE is_currently_running LIMIT 1'))\
+                .scalar()
+            hot_queries = get_hot_queries(session, movie_id=movie_id, theater_id=1,
+                                          after_id=row_counts['movies'] // 2, email_id='user1@example.com')
+            for name, query in hot_queries.items():
+                plan = explain(session, query)
+                plans[name] = plan
+
+                seq_scans = [node['Relation Name'] for node in get_plan_nodes(plan['Plan'])
+                             if node['Node Type'] == 'Seq Scan']
+                if seq_scans:
+                    failures.append(f'{name}: sequential scan of {", ".join(seq_scans)}')
+
+                cost_budget = QUERY_COST_BUDGETS[name] * budget_scale
+                if plan['Plan']['Total Cost'] > cost_budget:
+                    failures.append(f'{name}: total cost {plan["Plan"]["Total Cost"]} exceeds budget {cost_budget}')
+        finally:
+            session.rollback()
+            session.close()
+    return plans, failures
@@ -0,0 +1,67 @@
+import threading
+from typing import Any, Callable
+
+from log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+class MetricsRegistry:
+    """
+    A small in-process registry of counters, gauges and timings.
+    It is thread safe, values are kept per worker process and can be read with snapshot().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._gauge_callbacks: dict[str, Callable[[], float]] = {}
+        self._timings: dict[str, dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """
+        Registers a callback which is evaluated every time a snapshot is taken.
+        :param name: Name of the gauge.
+        :param callback: A callable without arguments returning the current value.
+        """
+        with self._lock:
+            self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            timing['count'] += 1
+            timing['sum'] += value
+            if value > timing['max']:
+                timing['max'] = value
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            gauges = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+            snapshot = {'counters': dict(self._counters),
+                        'timings': {name: dict(value) for name, value in self._timings.items()}}
+
+        for name, callback in callbacks.items():
+            try:
+                gauges[name] = callback()
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+        snapshot['gauges'] = gauges
+        return snapshot
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,43 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from db_config import url_object
+from models import Base
+# Import the models, so their tables are registered on Base.metadata.
+from models import movies_model, theater_model, user_model
+
+config = context.config
+config.set_main_option('sqlalchemy.url', url_object.render_as_string(hide_password=False).replace('%', '%%'))
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """ Emits the migration SQL to stdout, without connecting to the database. """
+    context.configure(url=config.get_main_option('sqlalchemy.url'), target_metadata=target_metadata,
+                      literal_binds=True, dialect_opts={'paramstyle': 'named'})
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = engine_from_config(config.get_section(config.config_ini_section, {}), prefix='sqlalchemy.',
+                                     poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,103 @@
+"""baseline
+
+The schema as it was before migrations were introduced. Databases created from the models already have it,
+mark them with `alembic stamp 0001` instead of upgrading.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('users',
+                    sa.Column('id', sa.String(32), primary_key=True),
+                    sa.Column('first_name', sa.String(30), nullable=False),
+                    sa.Column('last_name', sa.String(30), nullable=False),
+                    sa.Column('email_id', sa.String(70), nullable=False),
+                    sa.Column('password', sa.String(60), nullable=False),
+                    sa.Column('phone', sa.CHAR(10), nullable=True),
+                    sa.Column('email_verified', sa.Boolean()),
+                    sa.Column('is_active', sa.Boolean()),
+                    sa.Column('is_deleted', sa.Boolean()),
+                    sa.Column('last_login', sa.DateTime(timezone=True)),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)))
+
+    op.create_table('movies',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('name', sa.String(50), nullable=False),
+                    sa.Column('image_urls', postgresql.ARRAY(sa.String())),
+                    sa.Column('video_urls', postgresql.ARRAY(sa.String())),
+                    sa.Column('rating', postgresql.NUMERIC()),
+                    sa.Column('is_brand_new', sa.Boolean(), nullable=False),
+                    sa.Column('movie_start_date', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('movie_end_date', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('is_deleted', sa.Boolean()),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)))
+
+    op.create_table('movie_stars',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('name', sa.String(50), nullable=False),
+                    sa.Column('carrier_started_at', sa.Date()),
+                    sa.Column('total_movies', sa.Integer()),
+                    sa.Column('image_urls', postgresql.ARRAY(sa.String())),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)))
+
+    op.create_table('movie_stars_mapping',
+                    sa.Column('star_id', sa.Integer(), sa.ForeignKey('movie_stars.id'), primary_key=True),
+                    sa.Column('movie_id', sa.Integer(), sa.ForeignKey('movies.id'), primary_key=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)))
+
+    op.create_table('theaters',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('name', sa.String(30), nullable=False),
+                    sa.Column('no_of_screens', sa.Integer()),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)),
+                    sa.Column('is_deleted', sa.Boolean(), nullable=False))
+
+    op.create_table('theater_screens',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('screen_name', sa.String(10), nullable=False),
+                    sa.Column('theater_id', sa.Integer(), sa.ForeignKey('theaters.id'), nullable=False),
+                    sa.Column('status', sa.Integer(), nullable=False),
+                    sa.Column('total_seats', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)),
+                    sa.Column('is_deleted', sa.Boolean(), nullable=False))
+
+    op.create_table('show_timings',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('screen_id', sa.Integer(), sa.ForeignKey('theater_screens.id'), nullable=False),
+                    sa.Column('movie_id', sa.Integer(), sa.ForeignKey('movies.id'), nullable=False),
+                    sa.Column('theater_id', sa.Integer(), sa.ForeignKey('theaters.id'), nullable=False),
+                    sa.Column('show_starts_at', postgresql.TIME(), nullable=False),
+                    sa.Column('is_currently_running', sa.Boolean()),
+                    sa.Column('created_at', sa.DateTime(timezone=True)),
+                    sa.Column('modified_at', sa.DateTime(timezone=True)),
+                    sa.UniqueConstraint('movie_id', 'theater_id', 'screen_id', 'show_starts_at',
+                                        name='movie_theater_screen_show_at_ukey'))
+
+
+def downgrade() -> None:
+    op.drop_table('show_timings')
+    op.drop_table('theater_screens')
+    op.drop_table('theaters')
+    op.drop_table('movie_stars_mapping')
+    op.drop_table('movie_stars')
+    op.drop_table('movies')
+    op.drop_table('users')
@@ -0,0 +1,49 @@
+"""hot path indexes
+
+Indexes of the queries run on every request:
+- UserModel.get_user matches email ids through lower(email_id), which also makes email ids unique
+  case-insensitively. Duplicates have to be merged before upgrading, otherwise the index build fails.
+- The list queries filter is_deleted = false and page by id, partial indexes only cover the rows they return.
+- ShowTimingsModel.list_theater_screens filters running show timings of a movie, ordered by show_starts_at.
+
+The indexes are built CONCURRENTLY, outside of the migration transaction, so the tables stay writable.
+Capture the query plans with `flask explain-hot-queries` before and after upgrading. The plans captured on the
+synthetic dataset are in 0002_hot_path_indexes_plans.txt.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('users_lower_email_id_ukey', 'users', [sa.text('lower(email_id)')], unique=True,
+                        postgresql_concurrently=True)
+        op.create_index('movies_brand_new_id_idx', 'movies', ['is_brand_new', 'id'],
+                        postgresql_where=sa.text('is_deleted = false'), postgresql_concurrently=True)
+        op.create_index('theaters_active_id_idx', 'theaters', ['id'],
+                        postgresql_where=sa.text('is_deleted = false'), postgresql_concurrently=True)
+        op.create_index('theater_screens_theater_id_id_idx', 'theater_screens', ['theater_id', 'id'],
+                        postgresql_where=sa.text('is_deleted = false'), postgresql_concurrently=True)
+        op.create_index('show_timings_running_movie_id_starts_at_idx', 'show_timings', ['movie_id', 'show_starts_at'],
+                        postgresql_where=sa.text('is_currently_running = true'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('show_timings_running_movie_id_starts_at_idx', table_name='show_timings',
+                      postgresql_concurrently=True)
+        op.drop_index('theater_screens_theater_id_id_idx', table_name='theater_screens', postgresql_concurrently=True)
+        op.drop_index('theaters_active_id_idx', table_name='theaters', postgresql_concurrently=True)
+        op.drop_index('movies_brand_new_id_idx', table_name='movies', postgresql_concurrently=True)
+        op.drop_index('users_lower_email_id_ukey', table_name='users', postgresql_concurrently=True)
@@ -1,10 +1,36 @@
+import os
 from datetime import datetime, timedelta, date, time
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint, func, inspect, update
+from sqlalchemy.orm import Query
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Boolean, CHAR, Column, Date, DateTime, Integer, String, ForeignKey
 from sqlalchemy.dialects.postgresql import ARRAY, NUMERIC, TIME
 
-from db_config import Session
+from db_config import Session, get_session, get_read_session, get_read_engine, flush_or_commit, run_after_commit
 
 Base = declarative_base()
+
+# Number of rows fetched per round trip by the streaming list methods.
+STREAM_BATCH_SIZE = int(os.environ.get('stream_batch_size', 200))
+
+
+def update_active_row(session, model, row_id: int, values: dict) -> bool:
+    """
+    This method updates a row which is not soft deleted with a single statement,
+    UPDATE ... WHERE id = :row_id AND is_deleted = false RETURNING id, without loading it first.
+    :param session: Session to execute the statement in.
+    :param model: Model class of the row, it needs id and is_deleted columns.
+    :param row_id: Primary key of the row.
+    :param values: dict of model attribute and new value.
+    :return: False if no such row exists or it is soft deleted already.
+    """
+    updated_id = session.execute(update(model).where(model.id == row_id, model.is_deleted == False)
+                                 .values(**values).returning(model.id)).scalar_one_or_none()
+    return updated_id is not None
+
+
+def get_row_id(obj) -> int | None:
+    """ Returns the primary key of a persistent or detached object without loading it, None for new objects. """
+    identity = inspect(obj).identity
+    return identity[0] if identity else None
@@ -1,10 +1,12 @@
 from __future__ import annotations
-from typing import Any
+from typing import Any, Iterator
 
 import pytz
 from pydantic import BaseModel, Field, Extra, PositiveFloat, PositiveInt, HttpUrl, validator
 
 from . import *
+from .read_models import MovieRecord
+from cache_util import bump_catalog_version, get_cached_entity, invalidate_entity, EntityType
 from log_util import get_logger
 from utils import generate_pre_signed_s3_urls
 
@@ -108,16 +110,20 @@ class MovieModel(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow())
     modified_at = Column(DateTime(timezone=True))
 
+    __table_args__ = (Index('movies_brand_new_id_idx', is_brand_new, id, postgresql_where=is_deleted == False),)
+
     @staticmethod
-    def get_movie(movie_id: int) -> MovieModel | None:
-        session = Session()
+    def get_movie(movie_id: int, session=None) -> MovieModel | None:
+        session, owns_session = get_read_session(session)
         movie_obj = None
         try:
-            movie_obj = session.query(MovieModel).filter(MovieModel.id == movie_id).first()
+            movie_obj = get_cached_entity(MovieModel, movie_id, session, owns_session,
+                                          lambda: session.query(MovieModel).filter(MovieModel.id == movie_id).first())
         except Exception as e:
             logger.exception(e, exc_info=True)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return movie_obj
 
     def set_movie_end_date(self, override: bool = False) -> MovieModel:
@@ -144,24 +150,57 @@ class MovieModel(Base):
             raise ValueError('In order to set movie_end_date, movie_start_data is required.')
         return self
 
-    def save(self):
+    def save(self, session=None):
         """
         This method saves the object to database.
         It used in saving a new object, updating an existing object or soft deleting the object.
         :return:
         """
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            run_after_commit(session, invalidate_entity, MovieModel, get_row_id(self))
+            run_after_commit(session, bump_catalog_version, EntityType.MOVIES, last=True)
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             raise Exception(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
+
+    @staticmethod
+    def soft_delete(movie_id: int, session=None) -> tuple[bool, str, bool]:
+        """
+        This method marks a movie as deleted with a single UPDATE statement.
+        :param movie_id: Id of the movie.
+        :return: It returns deleted, msg, status. deleted is False if the movie does not exist or is deleted already.
+        """
+        deleted, msg, status = False, '', True
+        session, owns_session = get_session(session)
+        try:
+            deleted = update_active_row(session, MovieModel, movie_id,
+                                        {'is_deleted': True, 'modified_at': datetime.utcnow()})
+            if deleted:
+                run_after_commit(session, invalidate_entity, MovieModel, movie_id)
+                run_after_commit(session, bump_catalog_version, EntityType.MOVIES, last=True)
+            flush_or_commit(session, owns_session)
+        except Exception as e:
+            if owns_session:
+                session.rollback()
+            logger.exception(e, exc_info=True)
+            msg = 'Something went wrong.'
+            status = False
+        finally:
+            if owns_session:
+                session.close()
+            return deleted, msg, status
 
     @staticmethod
-    def list_movies(only_new: bool | None = True) -> tuple[list[dict] | Any, bool, str]:
+    def list_movies(only_new: bool | None = True, after_id: int | None = None, limit: int | None = None,
+                    session=None) -> tuple[list[dict] | Any, bool, str]:
         """
         This method list only movies which are marked as brand new. In other words
         it checks is_brand_new column and returns only records which are set to True.
@@ -169,38 +208,68 @@ class MovieModel(Base):
         It also allows you to list all the movies including deleted ones from the db, if only_new is set to True.
         :param only_new: A boolean value to manipulate the list of movie records. Allowed values are
         `True`, `False` or `None`.
-        :return: It returns list of Parsed pydantic movie model object, status, msg
+        :param after_id: Keyset pagination, only movies with a greater id are returned.
+        :param limit: Maximum number of movies to return.
+        :return: It returns list of movie dicts, status, msg
         """
-        session = Session()
+        session, owns_session = get_read_session(session)
         movies_list = []
         status = True
         msg = ''
         try:
-            movies_base_query = session.query(MovieModel).filter(MovieModel.is_deleted == False).order_by(MovieModel.id)
-            if only_new is not None:
-                movies_objs = movies_base_query.filter(MovieModel.is_brand_new == only_new).all()
-            else:
-                movies_objs = movies_base_query.all()
-
-            # Parse records into Pydantic Models
-            for movie in movies_objs:
-                movie_obj_dict = PydntMovieModel.from_orm(movie).dict()
-                movie_obj_dict['image_urls'] = generate_pre_signed_s3_urls(movie_obj_dict['image_urls'])
-                movie_obj_dict['video_urls'] = generate_pre_signed_s3_urls(movie_obj_dict['video_urls'])
-                movies_list.append(movie_obj_dict)
+            movie_rows = MovieModel.list_movies_query(session, only_new, after_id).limit(limit).all()
+
+            # Map the selected columns straight into dicts, rows are not validated again.
+            for movie_row in movie_rows:
+                movies_list.append(MovieModel.to_movie_dict(movie_row))
         except Exception as e:
             logger.exception(e, exc_info=True)
             status = False
             msg = 'Something went wrong.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return movies_list, status, msg
 
-    def update_movie(self, **movie_details):
+    @staticmethod
+    def list_movies_query(session, only_new: bool | None = True, after_id: int | None = None) -> Query:
+        movies_base_query = session.query(*MovieRecord.columns(MovieModel))\
+            .filter(MovieModel.is_deleted == False).order_by(MovieModel.id)
+        if only_new is not None:
+            movies_base_query = movies_base_query.filter(MovieModel.is_brand_new == only_new)
+        if after_id is not None:
+            movies_base_query = movies_base_query.filter(MovieModel.id > after_id)
+        return movies_base_query
+
+    @staticmethod
+    def to_movie_dict(movie_row: tuple) -> dict:
+        movie_obj_dict = MovieRecord.row_to_dict(movie_row)
+        movie_obj_dict['image_urls'] = generate_pre_signed_s3_urls(movie_obj_dict['image_urls'])
+        movie_obj_dict['video_urls'] = generate_pre_signed_s3_urls(movie_obj_dict['video_urls'])
+        return movie_obj_dict
+
+    @staticmethod
+    def iter_movies(only_new: bool | None = True, after_id: int | None = None) -> Iterator[dict]:
+        """
+        This method is the streaming counterpart of list_movies. Rows are read through a server side
+        cursor in batches of STREAM_BATCH_SIZE, so only one batch is held in memory at a time.
+        The session is closed once the generator is exhausted or closed.
+        :param only_new: See list_movies.
+        :param after_id: See list_movies.
+        :return: A generator of parsed movie dicts.
+        """
+        session = Session(bind=get_read_engine())
+        try:
+            for movie_row in MovieModel.list_movies_query(session, only_new, after_id).yield_per(STREAM_BATCH_SIZE):
+                yield MovieModel.to_movie_dict(movie_row)
+        finally:
+            session.close()
+
+    def update_movie(self, session=None, **movie_details):
         try:
             for key, value in movie_details.items():
                 setattr(self, key, value)
-            self.save()
+            self.save(session)
         except Exception as e:
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
@@ -217,23 +286,26 @@ class MovieStarModel(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow())
     modified_at = Column(DateTime(timezone=True))
 
-    def save(self):
+    def save(self, session=None):
         """
         This method saves movie star object to db.
         It also can be called if the movie star object got updated or deleted from the database.
         :return: It returns None.
         """
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
 
-    def update_movie_star(self, **star_details):
+    def update_movie_star(self, session=None, **star_details):
         """
         This method updates movie star details, using setattr function. It also raises
         error if something goes wrong.
@@ -243,19 +315,19 @@ class MovieStarModel(Base):
         try:
             for key, val in star_details:
                 setattr(self, key, val)
-            self.save()
+            self.save(session)
         except Exception as e:
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
 
     @staticmethod
-    def get_star(star_ids: list[int]) -> list[MovieStarsMapping] | MovieStarModel | None:
+    def get_star(star_ids: list[int], session=None) -> list[MovieStarsMapping] | MovieStarModel | None:
         """
         This method gets MovieStarModel object from the database using passed star_id.
         :param star_ids: Ids of the MovieStar objects
         :return: MovieStarModel Object
         """
-        session = Session()
+        session, owns_session = get_read_session(session)
         star_objs = None
         try:
             star_objs = session.query(MovieStarModel).filter(MovieStarModel.id.in_(star_ids)).all()
@@ -266,7 +338,8 @@ class MovieStarModel(Base):
         except Exception as e:
             logger.exception(e, exc_info=True)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return star_objs
 
     @classmethod
@@ -293,8 +366,8 @@ class MovieStarsMapping(Base):
     modified_at = Column(DateTime(timezone=True))
 
     @staticmethod
-    def get_all_mappings(movie_id: int) -> list[MovieStarsMapping | None]:
-        session = Session()
+    def get_all_mappings(movie_id: int, session=None) -> list[MovieStarsMapping | None]:
+        session, owns_session = get_read_session(session)
         movie_star_mappings = []
         try:
             movie_star_mappings = session.query(MovieStarsMapping.star_id)\
@@ -303,41 +376,51 @@ class MovieStarsMapping(Base):
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return movie_star_mappings
 
     @staticmethod
-    def remove_movie_star_mappings(sids: list[int], mid: int):
-        session = Session(expire_on_commit=True)
+    def remove_movie_star_mappings(sids: list[int], mid: int, session=None):
+        session, owns_session = get_session(session)
         try:
             session.query(MovieStarsMapping).filter(MovieStarsMapping.star_id.in_(sids)) \
                 .filter(MovieStarsMapping.movie_id == mid).delete(synchronize_session=False)
-            session.commit()
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
 
-    def save(self):
-        session = Session(expire_on_commit=True)
+    def save(self, session=None):
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
 
     @staticmethod
-    def bulk_save(objs: list[MovieStarsMapping]):
-        session = Session(expire_on_commit=True)
+    def bulk_save(objs: list[MovieStarsMapping], session=None):
+        session, owns_session = get_session(session)
         try:
             session.bulk_save_objects(objs)
-            session.commit()
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             raise e.__class__(e)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import Any, Sequence
+
+from sqlalchemy import Date, DateTime, Time, func
+
+
+class ReadRecord:
+    """
+    Read only record of a row selected as a column tuple. Hot read paths use these records instead of
+    parsing ORM objects with Pydantic from_orm, the data comes from our own database and is not validated again.
+    Subclasses list the model attributes to select in __slots__, in the order of the matching Pydantic model.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values: Any):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def columns(cls, model: type) -> list:
+        """ Returns the model columns to select for this record. """
+        return [getattr(model, field) for field in cls.__slots__]
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any], offset: int = 0) -> ReadRecord:
+        return cls(*row[offset:offset + len(cls.__slots__)])
+
+    @classmethod
+    def row_to_dict(cls, row: Sequence[Any], offset: int = 0) -> dict:
+        """
+        Maps a row, or the part of a row starting at offset, straight into a dict.
+        :param row: A row of the columns returned by columns().
+        :param offset: Position of the first column of this record in the row.
+        :return: dict of field name and value.
+        """
+        return dict(zip(cls.__slots__, row[offset:offset + len(cls.__slots__)]))
+
+    @classmethod
+    def json_object(cls, model: type, **extra_fields: Any):
+        """
+        Returns a json_build_object expression of the record columns, keyed and ordered like row_to_dict.
+        Dates and times are formatted in SQL the same way utils.dumps_json formats them.
+        :param model: Model class to select the columns from.
+        :param extra_fields: Additional keys and SQL expressions, added after the record fields.
+        """
+        key_values = []
+        for field in cls.__slots__:
+            key_values += [field, json_value(getattr(model, field))]
+        for field, value in extra_fields.items():
+            key_values += [field, value]
+        return func.json_build_object(*key_values)
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class MovieRecord(ReadRecord):
+    __slots__ = ('id', 'movie_name', 'image_urls', 'video_urls', 'movie_rating', 'is_brand_new', 'is_deleted',
+                 'movie_start_date', 'created_at', 'modified_at')
+
+
+class TheaterRecord(ReadRecord):
+    __slots__ = ('id', 'name', 'no_of_screens', 'created_at', 'modified_at', 'is_deleted')
+
+
+class TheaterScreenRecord(ReadRecord):
+    __slots__ = ('id', 'name', 'theater_id', 'status', 'total_seats', 'created_at', 'modified_at', 'is_deleted')
+
+
+class ShowTimingRecord(ReadRecord):
+    __slots__ = ('id', 'screen_id', 'movie_id', 'theater_id', 'show_starts_at', 'is_currently_running',
+                 'created_at', 'modified_at')
+
+
+def json_value(column):
+    """ Returns the SQL expression of a column formatted like utils.dumps_json formats its python value. """
+    if isinstance(column.type, DateTime):
+        # encode_datetime writes the tzname() of the value, which is UTC, or UTC+hh:mm for other offsets.
+        return func.to_char(column, 'Dy, DD Mon YYYY HH24:MI:SS "UTC"')\
+            .op('||')(func.coalesce(func.nullif(func.to_char(column, 'TZH:TZM'), '+00:00'), ''))
+    if isinstance(column.type, Time):
+        return func.to_char(column, 'HH24:MI:SS')
+    if isinstance(column.type, Date):
+        return func.to_char(column, 'YYYY-MM-DD')
+    return column
@@ -1,14 +1,28 @@
 from __future__ import annotations
-from typing import Any
+import os
+from typing import Any, Iterator
 
 from pydantic import BaseModel, Extra, Field, validator
+from redis import RedisError, WatchError
+from sqlalchemy import Text, cast, inspect, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 
 from . import *
+from .read_models import TheaterRecord, TheaterScreenRecord, ShowTimingRecord
+from cache_util import bump_catalog_version, get_cached_entity, invalidate_entity, EntityType
+from db_config import redis_client as rc
 from log_util import get_logger
 
 
 logger = get_logger(__name__)
 
+# Precomputed /theaters/list-screens/<movie_id> documents, see ShowTimingsModel.get_now_showing.
+NOW_SHOWING_KEY = 'now_showing:{movie_id}'
+NOW_SHOWING_GENERATION_KEY = 'now_showing_generation:{movie_id}'
+NOW_SHOWING_WARM_LOCK_KEY = 'now_showing:warming'
+NOW_SHOWING_TTL = int(os.environ.get('now_showing_ttl', 24 * 3600))
+NOW_SHOWING_WARM_LOCK_TTL = int(os.environ.get('now_showing_warm_lock_ttl', 60))
+
 
 class TheaterScreenStatus:
     ACTIVE = 1
@@ -92,54 +106,118 @@ class TheaterModel(Base):
     modified_at = Column(DateTime(timezone=True))
     is_deleted = Column(Boolean, default=False, nullable=False)
 
+    __table_args__ = (Index('theaters_active_id_idx', id, postgresql_where=is_deleted == False),)
+
     @staticmethod
-    def get_theaters_list() -> tuple[list[dict], str, bool]:
+    def get_theaters_list(after_id: int | None = None, limit: int | None = None,
+                          session=None) -> tuple[list[dict], str, bool]:
         status, msg = True, ''
         theaters_list = []
-        session = Session()
+        session, owns_session = get_read_session(session)
         try:
-            theater_objs = session.query(TheaterModel)\
-                .filter(TheaterModel.is_deleted == False)\
-                .order_by(TheaterModel.id).all()
-            for theater_obj in theater_objs:
-                theater = PydntTheaterModel.from_orm(theater_obj).dict()
-                theaters_list.append(theater)
+            theater_rows = TheaterModel.get_theaters_list_query(session, after_id).limit(limit).all()
+            for theater_row in theater_rows:
+                theaters_list.append(TheaterRecord.row_to_dict(theater_row))
         except Exception as e:
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return theaters_list, msg, status
 
     @staticmethod
-    def get_theater(theater_id: int) -> tuple[TheaterModel | None, str, bool]:
+    def get_theaters_list_query(session, after_id: int | None = None) -> Query:
+        theaters_query = session.query(*TheaterRecord.columns(TheaterModel))\
+            .filter(TheaterModel.is_deleted == False).order_by(TheaterModel.id)
+        if after_id is not None:
+            theaters_query = theaters_query.filter(TheaterModel.id > after_id)
+        return theaters_query
+
+    @staticmethod
+    def iter_theaters(after_id: int | None = None) -> Iterator[dict]:
+        """
+        This method is the streaming counterpart of get_theaters_list. Rows are read through a server side
+        cursor in batches of STREAM_BATCH_SIZE. The session is closed once the generator is exhausted or closed.
+        :return: A generator of parsed theater dicts.
+        """
+        session = Session(bind=get_read_engine())
+        try:
+            for theater_row in TheaterModel.get_theaters_list_query(session, after_id).yield_per(STREAM_BATCH_SIZE):
+                yield TheaterRecord.row_to_dict(theater_row)
+        finally:
+            session.close()
+
+    @staticmethod
+    def get_theater(theater_id: int, session=None) -> tuple[TheaterModel | None, str, bool]:
         status, msg = True, ''
         theater_obj = None
-        session = Session()
+        session, owns_session = get_read_session(session)
         try:
-            theater_obj = session.query(TheaterModel).filter(TheaterModel.id == theater_id)\
-                .filter(TheaterModel.is_deleted == False).first()
+            theater_obj = get_cached_entity(TheaterModel, theater_id, session, owns_session,
+                                            lambda: session.query(TheaterModel).filter(TheaterModel.id == theater_id)
+                                            .filter(TheaterModel.is_deleted == False).first())
         except Exception as e:
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return theater_obj, msg, status
 
-    def save(self) -> tuple[str, bool]:
+    @staticmethod
+    def update_theater(theater_id: int, session=None, **values) -> tuple[bool, str, bool]:
+        """
+        This method updates the given columns of a theater with a single UPDATE statement.
+        :param theater_id: Id of the theater.
+        :param values: Model attributes and their new values, they have to be validated already.
+        :return: It returns updated, msg, status. updated is False if the theater does not exist or is deleted.
+        """
+        updated, msg, status = False, '', True
+        session, owns_session = get_session(session)
+        try:
+            values['modified_at'] = datetime.utcnow()
+            updated = update_active_row(session, TheaterModel, theater_id, values)
+            if updated:
+                run_after_commit(session, invalidate_entity, TheaterModel, theater_id)
+                run_after_commit(session, ShowTimingsModel.refresh_now_showing_of, theater_id, None)
+                run_after_commit(session, bump_catalog_version, EntityType.THEATERS, last=True)
+            flush_or_commit(session, owns_session)
+        except Exception as e:
+            if owns_session:
+                session.rollback()
+            logger.exception(e, exc_info=True)
+            msg = 'Something went wrong.'
+            status = False
+        finally:
+            if owns_session:
+                session.close()
+            return updated, msg, status
+
+    @staticmethod
+    def soft_delete(theater_id: int, session=None) -> tuple[bool, str, bool]:
+        return TheaterModel.update_theater(theater_id, session=session, is_deleted=True)
+
+    def save(self, session=None) -> tuple[str, bool]:
         status, msg = True, ''
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            run_after_commit(session, invalidate_entity, TheaterModel, get_row_id(self))
+            run_after_commit(session, ShowTimingsModel.refresh_now_showing_of, get_row_id(self), None)
+            run_after_commit(session, bump_catalog_version, EntityType.THEATERS, last=True)
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             status = False
             msg = 'Something went wrong.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return msg, status
 
 
@@ -155,57 +233,104 @@ class TheaterScreenModel(Base):
     modified_at = Column(DateTime(timezone=True))
     is_deleted = Column(Boolean, default=False, nullable=False)
 
-    def save(self) -> tuple[str, bool]:
+    __table_args__ = (Index('theater_screens_theater_id_id_idx', theater_id, id, postgresql_where=is_deleted == False),)
+
+    def save(self, session=None) -> tuple[str, bool]:
         msg, status = '', True
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            run_after_commit(session, invalidate_entity, TheaterScreenModel, get_row_id(self))
+            run_after_commit(session, ShowTimingsModel.refresh_now_showing_of, None, get_row_id(self))
+            run_after_commit(session, bump_catalog_version, EntityType.THEATER_SCREENS, last=True)
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return msg, status
 
     @staticmethod
-    def get_theater_screen(screen_id: int) -> tuple[TheaterScreenModel, str, bool]:
+    def get_theater_screen(screen_id: int, session=None) -> tuple[TheaterScreenModel, str, bool]:
         theater_screen_obj, msg, status = None, '', True
-        session = Session()
+        session, owns_session = get_read_session(session)
         try:
-            theater_screen_obj = session.query(TheaterScreenModel)\
-                .filter(TheaterScreenModel.is_deleted == False)\
-                .filter(TheaterScreenModel.id == screen_id).first()
+            theater_screen_obj = get_cached_entity(TheaterScreenModel, screen_id, session, owns_session,
+                                                   lambda: session.query(TheaterScreenModel)
+                                                   .filter(TheaterScreenModel.is_deleted == False)
+                                                   .filter(TheaterScreenModel.id == screen_id).first())
         except Exception as e:
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return theater_screen_obj, msg, status
 
     @staticmethod
-    def get_theater_screens(theater_id: int) -> tuple[list[dict], str, bool]:
+    def soft_delete(screen_id: int, session=None) -> tuple[bool, str, bool]:
+        """
+        This method marks a theater screen as deleted with a single UPDATE statement.
+        :param screen_id: Id of the screen.
+        :return: It returns deleted, msg, status. deleted is False if the screen does not exist or is deleted already.
+        """
+        deleted, msg, status = False, '', True
+        session, owns_session = get_session(session)
+        try:
+            deleted = update_active_row(session, TheaterScreenModel, screen_id,
+                                        {'is_deleted': True, 'modified_at': datetime.utcnow()})
+            if deleted:
+                run_after_commit(session, invalidate_entity, TheaterScreenModel, screen_id)
+                run_after_commit(session, ShowTimingsModel.refresh_now_showing_of, None, screen_id)
+                run_after_commit(session, bump_catalog_version, EntityType.THEATER_SCREENS, last=True)
+            flush_or_commit(session, owns_session)
+        except Exception as e:
+            if owns_session:
+                session.rollback()
+            logger.exception(e, exc_info=True)
+            msg = 'Something went wrong.'
+            status = False
+        finally:
+            if owns_session:
+                session.close()
+            return deleted, msg, status
+
+    @staticmethod
+    def get_theater_screens(theater_id: int, after_id: int | None = None, limit: int | None = None,
+                            session=None) -> tuple[list[dict], str, bool]:
         msg, status = '', True
         theater_screen_list = []
-        session = Session()
+        session, owns_session = get_read_session(session)
         try:
-            theater_screen_objs = session.query(TheaterScreenModel)\
-                .filter(TheaterScreenModel.theater_id == theater_id)\
-                .filter(TheaterScreenModel.is_deleted == False).all()
+            theater_screen_rows = TheaterScreenModel.get_theater_screens_query(session, theater_id, after_id)\
+                .limit(limit).all()
 
-            for screen_obj in theater_screen_objs:
-                screen_dict = PydntTheaterScreenModel.from_orm(screen_obj).dict()
-                theater_screen_list.append(screen_dict)
+            for screen_row in theater_screen_rows:
+                theater_screen_list.append(TheaterScreenRecord.row_to_dict(screen_row))
         except Exception as e:
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return theater_screen_list, msg, status
 
+    @staticmethod
+    def get_theater_screens_query(session, theater_id: int, after_id: int | None = None) -> Query:
+        theater_screens_query = session.query(*TheaterScreenRecord.columns(TheaterScreenModel))\
+            .filter(TheaterScreenModel.theater_id == theater_id)\
+            .filter(TheaterScreenModel.is_deleted == False).order_by(TheaterScreenModel.id)
+        if after_id is not None:
+            theater_screens_query = theater_screens_query.filter(TheaterScreenModel.id > after_id)
+        return theater_screens_query
+
 
 class ShowTimingsModel(Base):
     __tablename__ = 'show_timings'
@@ -220,81 +345,280 @@ class ShowTimingsModel(Base):
     modified_at = Column(DateTime(timezone=True))
 
     __table_args__ = (UniqueConstraint(movie_id, theater_id, screen_id, show_starts_at,
-                                       name='movie_theater_screen_show_at_ukey'),)
+                                       name='movie_theater_screen_show_at_ukey'),
+                      Index('show_timings_running_movie_id_starts_at_idx', movie_id, show_starts_at,
+                            postgresql_where=is_currently_running == True))
 
-    def save(self):
-        session = Session(expire_on_commit=True)
+    def save(self, session=None):
+        session, owns_session = get_session(session)
         msg, status = '', True
         try:
             session.add(self)
-            session.commit()
+            run_after_commit(session, invalidate_entity, ShowTimingsModel, get_row_id(self))
+            # A show timing which is moved to another movie changes the documents of both movies.
+            run_after_commit(session, ShowTimingsModel.refresh_now_showing,
+                             self.movie_id, *inspect(self).attrs.movie_id.history.deleted)
+            run_after_commit(session, bump_catalog_version, EntityType.SHOW_TIMINGS, last=True)
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return msg, status
 
     @staticmethod
-    def get_showtiming(show_id):
+    def get_showtiming(show_id, session=None):
         show_time_obj, msg, status = None, '', True
-        session = Session()
+        session, owns_session = get_read_session(session)
         try:
-            show_time_obj = session.query(ShowTimingsModel).filter(ShowTimingsModel.id == show_id).first()
+            show_time_obj = get_cached_entity(ShowTimingsModel, show_id, session, owns_session,
+                                              lambda: session.query(ShowTimingsModel)
+                                              .filter(ShowTimingsModel.id == show_id).first())
         except Exception as e:
             logger.exception(e, exc_info=True)
             msg = 'Something went wrong.'
             status = False
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return show_time_obj, msg, status
 
     @staticmethod
-    def list_theater_screens(movie_id):
+    def list_theater_screens(movie_id, session=None):
         status, msg = True, ''
-        session = Session()
+        session, owns_session = get_read_session(session)
         theater_screen_list = []
         try:
-            show_timing_objs = session.query(TheaterModel, TheaterScreenModel, ShowTimingsModel)\
-                .join(TheaterModel, TheaterModel.id == ShowTimingsModel.theater_id)\
-                .join(TheaterScreenModel, TheaterScreenModel.id == ShowTimingsModel.screen_id)\
-                .filter(ShowTimingsModel.movie_id == movie_id)\
-                .filter(ShowTimingsModel.is_currently_running == True).order_by(ShowTimingsModel.show_starts_at).all()
-
-            theater_screen_dict: dict[str, Any] = {}
-            for theater_obj, screen_obj, show_timing_obj in show_timing_objs:
-                theater_dict = PydntTheaterModel.from_orm(theater_obj).dict()
-                screen_dict = PydntTheaterScreenModel.from_orm(screen_obj).dict()
-                show_timing_dict = PydntShowTimings.from_orm(show_timing_obj).dict()
-
-                theater_id = str(show_timing_dict['theater_id'])
-                screen_id = str(show_timing_dict['screen_id'])
-
-                if theater_id not in theater_screen_dict:
-                    theater_screen_dict[theater_id]: dict = theater_dict
-
-                if 'screens' in theater_screen_dict[theater_id]:
-                    if screen_id not in theater_screen_dict[theater_id]['screens']:
-                        theater_screen_dict[theater_id]['screens'].update({screen_id: screen_dict})
-                else:
-                    theater_screen_dict[theater_id]['screens'] = {screen_id: screen_dict}
-
-                if 'show_timings' in theater_screen_dict[theater_id]['screens'][screen_id]:
-                    theater_screen_dict[theater_id]['screens'][screen_id]['show_timings'].append(show_timing_dict)
-                else:
-                    theater_screen_dict[theater_id]['screens'][screen_id]['show_timings'] = [show_timing_dict]
-
-            for key, value in theater_screen_dict.items():
-                theater = value.copy()
-                theater['screens'] = []
-                for key2, value2 in theater_screen_dict[key]['screens'].items():
-                    theater['screens'].append(value2)
-                theater_screen_list.append(theater)
+            show_timing_rows = ShowTimingsModel.list_theater_screens_query(session, movie_id).all()
+            theater_screen_list = ShowTimingsModel.group_theater_screens(show_timing_rows)
         except Exception as e:
             logger.exception(e, exc_info=True)
             status = False
             msg = 'Something went wrong.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return theater_screen_list, msg, status
+
+    @staticmethod
+    def get_now_showing(movie_id: int) -> tuple[bytes, str, bool]:
+        """
+        This method returns the json of list_theater_screens_json from its precomputed document in redis.
+        Documents are rebuilt whenever show timings, screens or theaters of the movie change, see
+        refresh_now_showing, so a request is one key fetch. A missing document is built from the primary
+        and stored, a replica may still lag behind the change which outdated it.
+        :param movie_id: Movie to list the running shows of.
+        :return: json of the list, message, status.
+        """
+        now_showing_key = NOW_SHOWING_KEY.format(movie_id=movie_id)
+        generation_key = NOW_SHOWING_GENERATION_KEY.format(movie_id=movie_id)
+        now_showing_json, generation = None, None
+        try:
+            now_showing_json, generation = rc.mget([now_showing_key, generation_key])
+        except RedisError as e:
+            logger.exception(e, exc_info=True)
+        if now_showing_json is not None:
+            return now_showing_json, '', True
+
+        with Session() as session:
+            return ShowTimingsModel.build_now_showing(movie_id, generation, session)
+
+    @staticmethod
+    def build_now_showing(movie_id: int, generation: bytes | None, session) -> tuple[bytes, str, bool]:
+        """
+        This method builds the now showing document of a movie and stores it in redis, unless its generation
+        changed since it was read. A newer build is running then, which read the later state.
+        :param generation: Value of NOW_SHOWING_GENERATION_KEY read before reading from the database.
+        :return: json of the list, message, status.
+        """
+        theater_screens_json, msg, status = ShowTimingsModel.list_theater_screens_json(movie_id, session=session)
+        if not status:
+            return b'[]', msg, status
+
+        now_showing_json = theater_screens_json.encode('utf-8')
+        generation_key = NOW_SHOWING_GENERATION_KEY.format(movie_id=movie_id)
+        with rc.pipeline() as pipe:
+            try:
+                pipe.watch(generation_key)
+                if pipe.get(generation_key) == generation:
+                    pipe.multi()
+                    pipe.set(NOW_SHOWING_KEY.format(movie_id=movie_id), now_showing_json, ex=NOW_SHOWING_TTL)
+                    pipe.execute()
+            except WatchError:
+                pass
+            except RedisError as e:
+                logger.exception(e, exc_info=True)
+        return now_showing_json, '', True
+
+    @staticmethod
+    def refresh_now_showing(*movie_ids: int) -> None:
+        """
+        This method rebuilds the now showing documents of the given movies. It runs after the commit of
+        a change, reading from the primary, and outdates the builds which read before the change.
+        The old document is deleted together with the generation bump, so it is not served anymore even
+        if the rebuild fails, a request builds it then.
+        """
+        with Session() as session:
+            for movie_id in set(movie_ids):
+                if movie_id is None:
+                    continue
+                try:
+                    with rc.pipeline() as pipe:
+                        pipe.incr(NOW_SHOWING_GENERATION_KEY.format(movie_id=movie_id))
+                        pipe.delete(NOW_SHOWING_KEY.format(movie_id=movie_id))
+                        generation, _ = pipe.execute()
+                    ShowTimingsModel.build_now_showing(movie_id, str(generation).encode('utf-8'), session)
+                except Exception as e:
+                    logger.exception(e, exc_info=True)
+                finally:
+                    session.rollback()
+
+    @staticmethod
+    def refresh_now_showing_of(theater_id: int | None = None, screen_id: int | None = None) -> None:
+        """ This method rebuilds the now showing documents of the movies running in a theater or on a screen. """
+        if theater_id is None and screen_id is None:
+            return
+        try:
+            with Session() as session:
+                movie_ids = ShowTimingsModel.get_running_movie_ids(session, theater_id, screen_id)
+            ShowTimingsModel.refresh_now_showing(*movie_ids)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+
+    @staticmethod
+    def get_running_movie_ids(session, theater_id: int | None = None, screen_id: int | None = None) -> list[int]:
+        running_movies_query = session.query(ShowTimingsModel.movie_id)\
+            .filter(ShowTimingsModel.is_currently_running == True).distinct()
+        if theater_id is not None:
+            running_movies_query = running_movies_query.filter(ShowTimingsModel.theater_id == theater_id)
+        if screen_id is not None:
+            running_movies_query = running_movies_query.filter(ShowTimingsModel.screen_id == screen_id)
+        return [movie_id for movie_id, in running_movies_query.all()]
+
+    @staticmethod
+    def warm_now_showing(force: bool = False) -> int:
+        """
+        This method builds the now showing documents of all the movies which have running shows. It is run at
+        startup, workers which start within NOW_SHOWING_WARM_LOCK_TTL seconds of another one skip it.
+        :param force: Build the documents even if another worker warmed them recently.
+        :return: Number of documents built.
+        """
+        try:
+            if not rc.set(NOW_SHOWING_WARM_LOCK_KEY, 1, nx=True, ex=NOW_SHOWING_WARM_LOCK_TTL) and not force:
+                return 0
+            with Session() as session:
+                movie_ids = ShowTimingsModel.get_running_movie_ids(session)
+            ShowTimingsModel.refresh_now_showing(*movie_ids)
+            return len(movie_ids)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            return 0
+
+    @staticmethod
+    def list_theater_screens_query(session, movie_id: int) -> Query:
+        return session.query(*TheaterRecord.columns(TheaterModel),
+                             *TheaterScreenRecord.columns(TheaterScreenModel),
+                             *ShowTimingRecord.columns(ShowTimingsModel))\
+            .select_from(ShowTimingsModel)\
+            .join(TheaterModel, TheaterModel.id == ShowTimingsModel.theater_id)\
+            .join(TheaterScreenModel, TheaterScreenModel.id == ShowTimingsModel.screen_id)\
+            .filter(ShowTimingsModel.movie_id == movie_id)\
+            .filter(ShowTimingsModel.is_currently_running == True).order_by(ShowTimingsModel.show_starts_at)
+
+    @staticmethod
+    def list_theater_screens_json(movie_id: int, session=None) -> tuple[str, str, bool]:
+        """
+        This method returns the same nested list of theaters, screens and show timings as list_theater_screens,
+        built by Postgres as one json document, see list_theater_screens_json_query.
+        :param movie_id: Movie to list the running shows of.
+        :param session: Optional session to read in.
+        :return: json text of the list, message, status.
+        """
+        status, msg = True, ''
+        session, owns_session = get_read_session(session)
+        theater_screens_json = '[]'
+        try:
+            theater_screens_json = ShowTimingsModel.list_theater_screens_json_query(session, movie_id).scalar()
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            status = False
+            msg = 'Something went wrong.'
+        finally:
+            if owns_session:
+                session.close()
+            return theater_screens_json, msg, status
+
+    @staticmethod
+    def list_theater_screens_json_query(session, movie_id: int) -> Query:
+        """
+        Builds the nested list in SQL, aggregating show timings per screen, then screens per theater, then
+        theaters. Keys, value formats and order are the same as group_theater_screens: show timings are ordered
+        by start time, screens and theaters by their first show. The document is returned as text, so it is
+        sent as it is without being parsed.
+        """
+        show_timings = select(ShowTimingsModel.screen_id, ShowTimingsModel.theater_id,
+                              func.min(ShowTimingsModel.show_starts_at).label('first_show_starts_at'),
+                              func.json_agg(aggregate_order_by(ShowTimingRecord.json_object(ShowTimingsModel),
+                                                               ShowTimingsModel.show_starts_at, ShowTimingsModel.id))
+                              .label('show_timings'))\
+            .where(ShowTimingsModel.movie_id == movie_id, ShowTimingsModel.is_currently_running == True)\
+            .group_by(ShowTimingsModel.screen_id, ShowTimingsModel.theater_id).subquery()
+
+        screens = select(show_timings.c.theater_id,
+                         func.min(show_timings.c.first_show_starts_at).label('first_show_starts_at'),
+                         func.json_agg(aggregate_order_by(
+                             TheaterScreenRecord.json_object(TheaterScreenModel,
+                                                             show_timings=show_timings.c.show_timings),
+                             show_timings.c.first_show_starts_at, TheaterScreenModel.id)).label('screens'))\
+            .join(TheaterScreenModel, TheaterScreenModel.id == show_timings.c.screen_id)\
+            .group_by(show_timings.c.theater_id).subquery()
+
+        theaters = func.json_agg(aggregate_order_by(TheaterRecord.json_object(TheaterModel, screens=screens.c.screens),
+                                                    screens.c.first_show_starts_at, TheaterModel.id))
+        return session.query(cast(func.coalesce(theaters, text("'[]'::json")), Text))\
+            .select_from(screens).join(TheaterModel, TheaterModel.id == screens.c.theater_id)
+
+    @staticmethod
+    def group_theater_screens(show_timing_rows: list) -> list[dict]:
+        """
+        This method nests the rows of list_theater_screens_query, one per show timing, into a list of
+        theaters with their screens and the show timings of every screen.
+        """
+        screen_offset = len(TheaterRecord.__slots__)
+        show_timing_offset = screen_offset + len(TheaterScreenRecord.__slots__)
+        theater_screen_list = []
+        theater_screen_dict: dict[str, Any] = {}
+        for show_timing_row in show_timing_rows:
+            theater_dict = TheaterRecord.row_to_dict(show_timing_row)
+            screen_dict = TheaterScreenRecord.row_to_dict(show_timing_row, screen_offset)
+            show_timing_dict = ShowTimingRecord.row_to_dict(show_timing_row, show_timing_offset)
+
+            theater_id = str(show_timing_dict['theater_id'])
+            screen_id = str(show_timing_dict['screen_id'])
+
+            if theater_id not in theater_screen_dict:
+                theater_screen_dict[theater_id]: dict = theater_dict
+
+            if 'screens' in theater_screen_dict[theater_id]:
+                if screen_id not in theater_screen_dict[theater_id]['screens']:
+                    theater_screen_dict[theater_id]['screens'].update({screen_id: screen_dict})
+            else:
+                theater_screen_dict[theater_id]['screens'] = {screen_id: screen_dict}
+
+            if 'show_timings' in theater_screen_dict[theater_id]['screens'][screen_id]:
+                theater_screen_dict[theater_id]['screens'][screen_id]['show_timings'].append(show_timing_dict)
+            else:
+                theater_screen_dict[theater_id]['screens'][screen_id]['show_timings'] = [show_timing_dict]
+
+        for key, value in theater_screen_dict.items():
+            theater = value.copy()
+            theater['screens'] = []
+            for key2, value2 in theater_screen_dict[key]['screens'].items():
+                theater['screens'].append(value2)
+            theater_screen_list.append(theater)
+        return theater_screen_list
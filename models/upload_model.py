@@ -0,0 +1,136 @@
+from __future__ import annotations
+import json
+import time
+from uuid import uuid4
+
+from db_config import redis_client as rc
+from log_util import get_logger
+
+logger = get_logger(__name__)
+
+MEDIA_UPLOAD_KEY = 'media_upload:{upload_id}'
+MEDIA_UPLOAD_PARTS_KEY = 'media_upload:{upload_id}:parts'
+ACTIVE_MEDIA_UPLOADS_KEY = 'media_uploads:active'
+# s3 multipart upload of every active upload. It does not expire with the upload, so the reaper can always abort it.
+ACTIVE_MEDIA_UPLOADS_S3_KEY = 'media_uploads:s3'
+
+
+class MediaUploadModel:
+    """
+    State of a resumable media upload. It is kept in redis, so any worker can accept the next chunk.
+    Every upload is backed by a s3 multipart upload, each received chunk is stored as a part of it.
+    """
+
+    def __init__(self, upload_id: str, movie_id: int, file_name: str, file_type: str, s3_key: str,
+                 s3_upload_id: str, created_at: float, updated_at: float):
+        self.upload_id = upload_id
+        self.movie_id = movie_id
+        self.file_name = file_name
+        self.file_type = file_type
+        self.s3_key = s3_key
+        self.s3_upload_id = s3_upload_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @staticmethod
+    def create(movie_id: int, file_name: str, file_type: str, s3_key: str, s3_upload_id: str,
+               ttl: int) -> MediaUploadModel:
+        now = time.time()
+        upload = MediaUploadModel(upload_id=uuid4().hex, movie_id=movie_id, file_name=file_name, file_type=file_type,
+                                  s3_key=s3_key, s3_upload_id=s3_upload_id, created_at=now, updated_at=now)
+
+        pipe = rc.pipeline()
+        pipe.hset(MEDIA_UPLOAD_KEY.format(upload_id=upload.upload_id), mapping=upload.to_dict())
+        pipe.expire(MEDIA_UPLOAD_KEY.format(upload_id=upload.upload_id), ttl)
+        pipe.zadd(ACTIVE_MEDIA_UPLOADS_KEY, {upload.upload_id: now})
+        pipe.hset(ACTIVE_MEDIA_UPLOADS_S3_KEY, upload.upload_id,
+                  json.dumps({'s3_key': s3_key, 's3_upload_id': s3_upload_id}))
+        pipe.execute()
+        return upload
+
+    @staticmethod
+    def get(upload_id: str) -> MediaUploadModel | None:
+        upload_dict = rc.hgetall(MEDIA_UPLOAD_KEY.format(upload_id=upload_id))
+        if not upload_dict:
+            return None
+
+        upload_dict = {key.decode('utf-8'): value.decode('utf-8') for key, value in upload_dict.items()}
+        return MediaUploadModel(upload_id=upload_dict['upload_id'], movie_id=int(upload_dict['movie_id']),
+                                file_name=upload_dict['file_name'], file_type=upload_dict['file_type'],
+                                s3_key=upload_dict['s3_key'], s3_upload_id=upload_dict['s3_upload_id'],
+                                created_at=float(upload_dict['created_at']),
+                                updated_at=float(upload_dict['updated_at']))
+
+    def to_dict(self) -> dict:
+        return {'upload_id': self.upload_id, 'movie_id': self.movie_id, 'file_name': self.file_name,
+                'file_type': self.file_type, 's3_key': self.s3_key, 's3_upload_id': self.s3_upload_id,
+                'created_at': self.created_at, 'updated_at': self.updated_at}
+
+    def add_part(self, part_no: int, etag: str, size: int, ttl: int) -> None:
+        """
+        This method records a chunk which is uploaded to s3 and refreshes the expiry of the upload.
+        Re-uploading a chunk overwrites the previously recorded part.
+        :param part_no: Part number of the chunk, starting at 1.
+        :param etag: ETag returned by s3 for the part.
+        :param size: Size of the chunk in bytes.
+        :param ttl: Time in seconds the upload is kept after the last chunk.
+        :return: None
+        """
+        now = time.time()
+        upload_key = MEDIA_UPLOAD_KEY.format(upload_id=self.upload_id)
+        parts_key = MEDIA_UPLOAD_PARTS_KEY.format(upload_id=self.upload_id)
+
+        pipe = rc.pipeline()
+        pipe.hset(parts_key, part_no, json.dumps({'etag': etag, 'size': size}))
+        pipe.hset(upload_key, 'updated_at', now)
+        pipe.expire(upload_key, ttl)
+        pipe.expire(parts_key, ttl)
+        pipe.zadd(ACTIVE_MEDIA_UPLOADS_KEY, {self.upload_id: now})
+        pipe.execute()
+        self.updated_at = now
+
+    def get_parts(self) -> list[dict]:
+        parts = rc.hgetall(MEDIA_UPLOAD_PARTS_KEY.format(upload_id=self.upload_id))
+        parts_list = []
+        for part_no, part in parts.items():
+            part_dict = json.loads(part)
+            parts_list.append({'part_no': int(part_no), 'etag': part_dict['etag'], 'size': part_dict['size']})
+        return sorted(parts_list, key=lambda part_: part_['part_no'])
+
+    def delete(self) -> None:
+        pipe = rc.pipeline()
+        pipe.delete(MEDIA_UPLOAD_KEY.format(upload_id=self.upload_id),
+                    MEDIA_UPLOAD_PARTS_KEY.format(upload_id=self.upload_id))
+        pipe.zrem(ACTIVE_MEDIA_UPLOADS_KEY, self.upload_id)
+        pipe.hdel(ACTIVE_MEDIA_UPLOADS_S3_KEY, self.upload_id)
+        pipe.execute()
+
+    @staticmethod
+    def get_stale_upload_ids(idle_for: int) -> list[str]:
+        """
+        This method returns ids of the uploads which did not receive a chunk for idle_for seconds.
+        :param idle_for: Idle time in seconds.
+        :return: list of upload ids.
+        """
+        upload_ids = rc.zrangebyscore(ACTIVE_MEDIA_UPLOADS_KEY, '-inf', time.time() - idle_for)
+        return [upload_id.decode('utf-8') for upload_id in upload_ids]
+
+    @staticmethod
+    def get_s3_upload(upload_id: str) -> tuple[str, str] | None:
+        """
+        This method returns the s3 multipart upload of an upload, also after the state of the upload expired.
+        :param upload_id: Id of the upload.
+        :return: s3 key and s3 upload id, or None.
+        """
+        s3_upload = rc.hget(ACTIVE_MEDIA_UPLOADS_S3_KEY, upload_id)
+        if s3_upload is None:
+            return None
+        s3_upload = json.loads(s3_upload)
+        return s3_upload['s3_key'], s3_upload['s3_upload_id']
+
+    @staticmethod
+    def forget(upload_id: str) -> None:
+        pipe = rc.pipeline()
+        pipe.zrem(ACTIVE_MEDIA_UPLOADS_KEY, upload_id)
+        pipe.hdel(ACTIVE_MEDIA_UPLOADS_S3_KEY, upload_id)
+        pipe.execute()
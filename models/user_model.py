@@ -1,3 +1,4 @@
+from auth_util import revoke_user_sessions
 from log_util import get_logger
 from . import *
 
@@ -20,77 +21,100 @@ class UserModel(Base):
     created_at = Column('created_at', DateTime(timezone=True), default=datetime.utcnow())
     modified_at = Column('modified_at', DateTime(timezone=True))
 
+    __table_args__ = (Index('users_lower_email_id_ukey', func.lower(email_id), unique=True),)
+
     @staticmethod
-    def create_user(**user_attrs):
-        session = Session(expire_on_commit=True)
+    def create_user(session=None, **user_attrs):
+        session, owns_session = get_session(session)
         status = True
         msg = 'User created successfully!'
         try:
             user_obj = UserModel(**user_attrs)
-            user_obj.save()
+            user_obj.save(session)
+            flush_or_commit(session, owns_session)
         except Exception as e:
             logger.exception(e, exc_info=True)
             status = False
             msg = 'Something error occurred.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return status, msg
 
     @staticmethod
-    def get_user(user_id=None, username=None):
-        session = Session(expire_on_commit=True)
+    def get_user(user_id=None, username=None, session=None):
+        session, owns_session = get_session(session)
         user_obj = None
         try:
-            user_base_query = session.query(UserModel).filter(UserModel.is_active == True)
-            if user_id:
-                user_obj = user_base_query.filter(UserModel.id == user_id).first()
-            else:
-                user_obj = user_base_query.filter(UserModel.email_id == username).first()
+            user_obj = UserModel.get_user_query(session, user_id, username).first()
         except Exception as e:
             logger.exception(e, exc_info=True)
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return user_obj
 
-    def save(self):
-        session = Session(expire_on_commit=True)
+    @staticmethod
+    def get_user_query(session, user_id=None, username=None) -> Query:
+        user_base_query = session.query(UserModel).filter(UserModel.is_active == True)
+        if user_id:
+            return user_base_query.filter(UserModel.id == user_id)
+        # Email ids are matched case-insensitively, through the lower(email_id) index.
+        return user_base_query.filter(func.lower(UserModel.email_id) == func.lower(username))
+
+    def save(self, session=None):
+        session, owns_session = get_session(session)
         try:
             session.add(self)
-            session.commit()
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
+            raise
         finally:
-            session.close()
+            if owns_session:
+                session.close()
 
     @staticmethod
-    def deactivate_user(user_id: str):
+    def deactivate_user(user_id: str, session=None):
         status, msg = True, 'User deactivated successfully!'
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             session.query(UserModel).filter(UserModel.id == user_id).update({'is_active': False},
                                                                             synchronize_session=False)
-            session.commit()
+            # Every session of the user is revoked once the change is committed.
+            run_after_commit(session, revoke_user_sessions, user_id)
+            flush_or_commit(session, owns_session)
         except Exception as e:
+            if owns_session:
+                session.rollback()
             logger.exception(e, exc_info=True)
             status, msg = False, 'An error occurred.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return status, msg
 
-    def update_user(self, **details: dict):
+    def update_user(self, session=None, **details: dict):
         status, msg = True, 'User updated successfully.'
-        session = Session(expire_on_commit=True)
+        session, owns_session = get_session(session)
         try:
             # add modified_at field with updated timestamp
             details.update({'modified_at': datetime.utcnow()})
             for key, value in details.items():
                 setattr(self, key, value)
 
-            self.save()
+            # Every session of a deleted or deactivated user is revoked once the change is committed.
+            if details.get('is_deleted') or details.get('is_active') is False:
+                run_after_commit(session, revoke_user_sessions, self.id)
+            self.save(session)
+            flush_or_commit(session, owns_session)
         except Exception as e:
             logger.exception(e, exc_info=True)
             status = False
             msg = 'Unable to update user details.'
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             return status, msg
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The app reads its settings from the environment at import time, tests only need placeholders.
+for key, value in {'secret_key': 'test-secret', 'jwt_header_name': 'Authorization', 'database': 'bookmyshow',
+                   'username': 'postgres', 'password': 'postgres', 'host': 'localhost', 'port': '5432',
+                   'movie_data_s3_bucket': 'movie-data', 'aws_region': 'us-east-1',
+                   'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
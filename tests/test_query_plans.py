@@ -0,0 +1,34 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from explain_util import QUERY_COST_BUDGETS, check_query_plans, get_plan_nodes
+
+# A Postgres database the check can create a temporary schema in, e.g. postgresql://postgres@localhost/bookmyshow.
+TEST_DATABASE_URL = os.environ.get('test_database_url')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason='test_database_url is not set')
+
+
+@pytest.fixture(scope='module')
+def query_plans() -> dict[str, dict]:
+    engine = create_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    try:
+        plans, _ = check_query_plans(bind=engine)
+    finally:
+        engine.dispose()
+    return plans
+
+
+@pytest.mark.parametrize('name', QUERY_COST_BUDGETS)
+def test_hot_query_uses_indexes(query_plans, name):
+    seq_scans = [node['Relation Name'] for node in get_plan_nodes(query_plans[name]['Plan'])
+                 if node['Node Type'] == 'Seq Scan']
+    assert seq_scans == []
+
+
+@pytest.mark.parametrize('name', QUERY_COST_BUDGETS)
+def test_hot_query_is_within_its_cost_budget(query_plans, name):
+    assert query_plans[name]['Plan']['Total Cost'] <= QUERY_COST_BUDGETS[name]
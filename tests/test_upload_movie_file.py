@@ -0,0 +1,204 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import fakeredis
+import pytest
+from boto3.s3.transfer import TransferConfig
+from moto import mock_s3
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import EnvironBuilder
+
+import utils
+
+
+class CancellingStream(io.BytesIO):
+    """ Sets the cancelled event of its upload on its nth read, like a deadline which passes mid upload. """
+
+    def __init__(self, content: bytes, cancelled: threading.Event, cancel_on_read: int):
+        super().__init__(content)
+        self.cancelled = cancelled
+        self.cancel_on_read = cancel_on_read
+        self.reads = 0
+
+    def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        if self.reads == self.cancel_on_read:
+            self.cancelled.set()
+        return super().read(size)
+
+
+class NonSeekableStream(io.RawIOBase):
+    def __init__(self, content: bytes):
+        self._content = io.BytesIO(content)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def readinto(self, buffer) -> int:
+        chunk = self._content.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    # Content hash lookups go to redis, they are not part of these tests.
+    monkeypatch.setattr(utils, 'get_deduplicated_s3_key', lambda s3_client, content_hash: None)
+    monkeypatch.setattr(utils, 'index_uploaded_content', lambda content_hash, s3_key: None)
+    with mock_s3():
+        utils.reset_s3_client()
+        s3_client = utils.get_s3_client()
+        s3_client.create_bucket(Bucket=utils.MOVIE_DATA_S3_BUCKET)
+        yield s3_client
+    utils.reset_s3_client()
+
+
+@pytest.fixture
+def deduplicating_s3_client(monkeypatch):
+    monkeypatch.setattr(utils, 'rc', fakeredis.FakeRedis())
+    with mock_s3():
+        utils.reset_s3_client()
+        s3_client = utils.get_s3_client()
+        s3_client.create_bucket(Bucket=utils.MOVIE_DATA_S3_BUCKET)
+        yield s3_client
+    utils.reset_s3_client()
+
+
+def get_object(s3_client, s3_key: str) -> dict:
+    return s3_client.get_object(Bucket=utils.MOVIE_DATA_S3_BUCKET, Key=s3_key)
+
+
+def test_seekable_stream_is_uploaded_with_upload_fileobj(s3_client, monkeypatch):
+    def named_temporary_file(*args, **kwargs):
+        raise AssertionError('seekable streams must not be copied to a temporary file')
+
+    monkeypatch.setattr(utils.tempfile, 'NamedTemporaryFile', named_temporary_file)
+    content = os.urandom(1024)
+    file_data = FileStorage(stream=io.BytesIO(content), filename='poster.png', content_type='image/png')
+
+    s3_key, is_deduplicated = utils.upload_movie_file(s3_client, 'poster.png', file_data, 'movie/poster.png')
+
+    s3_object = get_object(s3_client, s3_key)
+    assert (s3_key, is_deduplicated) == ('movie/poster.png', False)
+    assert s3_object['Body'].read() == content
+    assert s3_object['ContentType'] == 'image/png'
+    assert s3_object['Metadata']['sha256'] == utils.hash_stream(io.BytesIO(content))
+
+
+def test_large_seekable_stream_is_uploaded_in_parts(s3_client, monkeypatch):
+    part_size = 5 * 1024 * 1024
+    monkeypatch.setattr(utils, 'MEDIA_TRANSFER_CONFIG',
+                        TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size))
+    content = os.urandom(2 * part_size + 1024)
+    file_data = FileStorage(stream=io.BytesIO(content), filename='trailer.mp4', content_type='video/mp4')
+
+    s3_key, _ = utils.upload_movie_file(s3_client, 'trailer.mp4', file_data, 'movie/trailer.mp4')
+
+    s3_object = get_object(s3_client, s3_key)
+    assert s3_object['Body'].read() == content
+    assert s3_object['ETag'].endswith('-3"')
+
+
+def test_non_seekable_stream_is_uploaded_from_a_temp_file(s3_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(utils.tempfile, 'gettempdir', lambda: str(tmp_path))
+    content = os.urandom(1024)
+    file_data = FileStorage(stream=NonSeekableStream(content), filename='still.jpg', content_type='image/jpeg')
+
+    s3_key, is_deduplicated = utils.upload_movie_file(s3_client, 'still.jpg', file_data, 'movie/still.jpg')
+
+    s3_object = get_object(s3_client, s3_key)
+    assert (s3_key, is_deduplicated) == ('movie/still.jpg', False)
+    assert s3_object['Body'].read() == content
+    assert s3_object['ContentType'] == 'image/jpeg'
+    assert s3_object['Metadata']['sha256'] == utils.hash_stream(io.BytesIO(content))
+    # The temp file is removed after the upload.
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cancelled_upload_does_not_read_the_file(s3_client):
+    cancelled = threading.Event()
+    cancelled.set()
+    file_data = FileStorage(stream=io.BytesIO(b'poster'), filename='poster.png', content_type='image/png')
+
+    with pytest.raises(utils.UploadCancelled):
+        utils.upload_movie_file(s3_client, 'poster.png', file_data, 'movie/poster.png', cancelled)
+
+    assert s3_client.list_objects_v2(Bucket=utils.MOVIE_DATA_S3_BUCKET)['KeyCount'] == 0
+
+
+def test_cancelled_multipart_upload_is_aborted(s3_client, monkeypatch):
+    part_size = 5 * 1024 * 1024
+    monkeypatch.setattr(utils, 'S3_MULTIPART_CHUNKSIZE', part_size)
+    monkeypatch.setattr(utils, 'MEDIA_TRANSFER_CONFIG',
+                        TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size))
+    cancelled = threading.Event()
+    # 4 reads hash the file, the 6th one reads the second part of the upload.
+    stream = CancellingStream(os.urandom(3 * part_size), cancelled, cancel_on_read=6)
+    file_data = FileStorage(stream=stream, filename='trailer.mp4', content_type='video/mp4')
+
+    with pytest.raises(utils.UploadCancelled):
+        utils.upload_movie_file(s3_client, 'trailer.mp4', file_data, 'movie/trailer.mp4', cancelled)
+
+    assert s3_client.list_objects_v2(Bucket=utils.MOVIE_DATA_S3_BUCKET)['KeyCount'] == 0
+    assert s3_client.list_multipart_uploads(Bucket=utils.MOVIE_DATA_S3_BUCKET).get('Uploads', []) == []
+
+
+def test_uploads_past_the_deadline_are_reported_as_timed_out(s3_client):
+    class SlowStream(io.BytesIO):
+        def read(self, size: int = -1) -> bytes:
+            time.sleep(0.2)
+            return super().read(size)
+
+    file_data = FileStorage(stream=SlowStream(os.urandom(1024)), filename='still.jpg', content_type='image/jpeg')
+
+    s3_object_urls = utils.save_movie_data_in_s3({'still.jpg': [file_data, 'image']}, 'movie', deadline=0.1)
+
+    assert s3_object_urls['image_urls'] == []
+    assert s3_object_urls['files'][0]['msg'] == 'Upload timed out.'
+    assert s3_client.list_objects_v2(Bucket=utils.MOVIE_DATA_S3_BUCKET)['KeyCount'] == 0
+
+
+def upload(s3_client, content: bytes, s3_file_path: str) -> tuple[str, bool]:
+    file_data = FileStorage(stream=io.BytesIO(content), filename='poster.png', content_type='image/png')
+    return utils.upload_movie_file(s3_client, 'poster.png', file_data, s3_file_path)
+
+
+def test_known_content_is_not_uploaded_again(deduplicating_s3_client):
+    content = os.urandom(1024)
+
+    assert upload(deduplicating_s3_client, content, 'movie/poster.png') == ('movie/poster.png', False)
+    assert upload(deduplicating_s3_client, content, 'sequel/poster.png') == ('movie/poster.png', True)
+    assert deduplicating_s3_client.list_objects_v2(Bucket=utils.MOVIE_DATA_S3_BUCKET)['KeyCount'] == 1
+
+
+def test_overwritten_object_is_not_reused(deduplicating_s3_client):
+    old_content, new_content = os.urandom(1024), os.urandom(1024)
+    upload(deduplicating_s3_client, old_content, 'movie/poster.png')
+    upload(deduplicating_s3_client, new_content, 'movie/poster.png')
+
+    s3_key, is_deduplicated = upload(deduplicating_s3_client, old_content, 'sequel/poster.png')
+
+    assert (s3_key, is_deduplicated) == ('sequel/poster.png', False)
+    assert get_object(deduplicating_s3_client, s3_key)['Body'].read() == old_content
+
+
+def test_content_hash_is_computed_while_the_request_is_parsed(s3_client, monkeypatch):
+    content = os.urandom(600 * 1024)
+    builder = EnvironBuilder(method='POST', data={'trailer': (io.BytesIO(content), 'trailer.mp4', 'video/mp4')})
+    file_data = utils.HashingRequest(builder.get_environ()).files['trailer']
+
+    def hash_stream(stream):
+        raise AssertionError('the file must not be read again to hash it')
+
+    monkeypatch.setattr(utils, 'hash_stream', hash_stream)
+    s3_key, _ = utils.upload_movie_file(s3_client, 'trailer.mp4', file_data, 'movie/trailer.mp4')
+
+    s3_object = get_object(s3_client, s3_key)
+    assert s3_object['Body'].read() == content
+    assert s3_object['Metadata']['sha256'] == hashlib.sha256(content).hexdigest()
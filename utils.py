@@ -1,51 +1,325 @@
 import os
+import base64
 import datetime
+import hashlib
 import json
 import tempfile
-from typing import Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from decimal import Decimal
+from typing import Any, Callable, Iterator
 
 import boto3
 from boto3.s3.transfer import TransferConfig
 from botocore import client
 from pydantic import validate_arguments
 
-from flask import jsonify, make_response, Response
+from flask import jsonify, make_response, stream_with_context, Request, Response
 from werkzeug.datastructures import FileStorage, ImmutableMultiDict
 from werkzeug.utils import secure_filename
 
+from cache_util import apply_cache_headers
+from db_config import redis_client as rc
 from log_util import get_logger
+from metrics_util import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = get_logger(__name__)
 
+# 'fast' serializes responses with orjson when it is installed, 'std' always uses the json module.
+JSON_ENCODER = os.environ.get('json_encoder', 'fast')
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+# Size of the chunks written by streaming responses.
+STREAM_CHUNK_SIZE = int(os.environ.get('stream_chunk_size', 64 * 1024))
+
+# Keyset pagination of the list endpoints. Lists are paginated only when the client passes limit or after.
+DEFAULT_PAGE_SIZE = int(os.environ.get('default_page_size', 100))
+MAX_PAGE_SIZE = int(os.environ.get('max_page_size', 500))
+
 MOVIE_DATA_S3_BUCKET = os.environ['movie_data_s3_bucket']
 AWS_REGION = os.environ['aws_region']
 ALLOWED_FILE_EXTENSIONS = {'JPEG': 'image', 'JPG': 'image', 'PNG': 'image', 'MP4': 'video', 'MOV': 'video'}
 
+# Pre-signed url settings. Cached urls are reused until PRE_SIGNED_URL_REFRESH_MARGIN seconds before they expire.
+PRE_SIGNED_URL_EXPIRY = int(os.environ.get('pre_signed_url_expiry', 3600))
+PRE_SIGNED_URL_REFRESH_MARGIN = int(os.environ.get('pre_signed_url_refresh_margin', 300))
+PRE_SIGNED_URL_CACHE_SIZE = int(os.environ.get('pre_signed_url_cache_size', 10000))
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('s3_max_pool_connections', 20))
+# Optional s3 endpoint, e.g. a local s3 stand-in like moto server.
+S3_ENDPOINT_URL = os.environ.get('s3_endpoint_url') or None
+
+# Streaming upload settings. Memory used per upload is bounded by chunk size * concurrency.
+S3_MULTIPART_THRESHOLD = int(os.environ.get('s3_multipart_threshold', 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.environ.get('s3_multipart_chunksize', 8 * 1024 * 1024))
+S3_UPLOAD_MAX_CONCURRENCY = int(os.environ.get('s3_upload_max_concurrency', 4))
+MEDIA_TRANSFER_CONFIG = TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD,
+                                       multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+                                       max_concurrency=S3_UPLOAD_MAX_CONCURRENCY,
+                                       max_io_queue=S3_UPLOAD_MAX_CONCURRENCY * 2)
+
+# Media files of one request are uploaded concurrently, bounded by MEDIA_UPLOAD_WORKERS and MEDIA_UPLOAD_DEADLINE.
+MEDIA_UPLOAD_WORKERS = int(os.environ.get('media_upload_workers', 8))
+MEDIA_UPLOAD_DEADLINE = float(os.environ.get('media_upload_deadline', 300))
+# Seconds uploads which missed the deadline are given to stop, after they were cancelled.
+MEDIA_UPLOAD_CANCEL_TIMEOUT = float(os.environ.get('media_upload_cancel_timeout', 30))
+
+# Direct browser uploads. Size caps per file type and validity of the pre-signed POST policies.
+MAX_MEDIA_FILE_SIZES = {'image': int(os.environ.get('max_image_upload_size', 10 * 1024 * 1024)),
+                        'video': int(os.environ.get('max_video_upload_size', 5 * 1024 * 1024 * 1024))}
+PRE_SIGNED_POST_EXPIRY = int(os.environ.get('pre_signed_post_expiry', 900))
+
+# Resumable uploads. Chunks are s3 multipart parts, so all but the last chunk must be at least 5 MB.
+MAX_MEDIA_CHUNK_SIZE = int(os.environ.get('max_media_chunk_size', 64 * 1024 * 1024))
+MAX_MEDIA_CHUNKS = 10000
+# Uploads without a new chunk for this many seconds are aborted by the reaper.
+MEDIA_UPLOAD_IDLE_TIMEOUT = int(os.environ.get('media_upload_idle_timeout', 24 * 3600))
+
+# Redis hash of sha256 content hash to s3 key of the uploaded movie media.
+MEDIA_CONTENT_INDEX_KEY = 'media_content_index'
+
+_s3_client = None
+_s3_client_pid = None
+_s3_client_lock = threading.Lock()
+
+_media_upload_executor = None
+_media_upload_executor_pid = None
+_media_upload_executor_lock = threading.Lock()
+
+_pre_signed_url_cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+_pre_signed_url_cache_lock = threading.Lock()
+
+
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def encode_datetime(obj: datetime.datetime) -> str:
+    # Same output as obj.strftime('%a, %d %b %Y %H:%M:%S %Z'), without going through strftime.
+    return (f'{WEEKDAY_NAMES[obj.weekday()]}, {obj.day:02d} {MONTH_NAMES[obj.month - 1]} {obj.year} '
+            f'{obj.hour:02d}:{obj.minute:02d}:{obj.second:02d} {obj.tzname() or ""}')
+
+
+def encode_time(obj: datetime.time) -> str:
+    return f'{obj.hour:02d}:{obj.minute:02d}:{obj.second:02d}'
+
+
+def encode_date(obj: datetime.date) -> str:
+    return obj.strftime('%Y-%m-%d')
+
+
+# Encoders of the types json cannot serialize on its own, looked up by the exact type of the value.
+# datetime is a subclass of date, so it has to be registered before date.
+JSON_TYPE_ENCODERS: dict[type, Callable[[Any], Any]] = {
+    datetime.datetime: encode_datetime,
+    datetime.time: encode_time,
+    datetime.date: encode_date,
+    Decimal: float,
+}
+# Encoders resolved for subclasses of the registered types, filled by json_default.
+_subclass_json_encoders: dict[type, Callable[[Any], Any]] = {}
+_json_encoders_lock = threading.Lock()
+
+
+def register_json_type(type_: type, encoder: Callable[[Any], Any]) -> None:
+    """
+    This method registers an encoder for a type json cannot serialize on its own.
+    :param type_: Type of the value.
+    :param encoder: A callable which converts the value into a json serializable value.
+    :return: None
+    """
+    with _json_encoders_lock:
+        JSON_TYPE_ENCODERS[type_] = encoder
+        _subclass_json_encoders.clear()
+
+
+def json_default(obj: Any) -> Any:
+    encoder = JSON_TYPE_ENCODERS.get(type(obj)) or _subclass_json_encoders.get(type(obj))
+    if encoder is None:
+        # Subclasses of registered types resolve to the encoder of their closest registered base class.
+        with _json_encoders_lock:
+            encoder = next((encoder_ for type_, encoder_ in JSON_TYPE_ENCODERS.items() if isinstance(obj, type_)),
+                           None)
+            if encoder is None:
+                raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+            _subclass_json_encoders[type(obj)] = encoder
+    return encoder(obj)
+
 
 class TimeTypeEncoder(json.JSONEncoder):
     def default(self, obj: Any) -> Any:
-        if isinstance(obj, datetime.time):
-            time_str = obj.strftime('%H:%M:%S')
-            return time_str
-        if isinstance(obj, datetime.datetime):
-            datetime_str = obj.strftime('%a, %d %b %Y %H:%M:%S %Z')
-            return datetime_str
-        if obj == "":
-            print(obj)
-        return json.JSONEncoder.default(self, obj)
-
-
-def create_response(resp_json, status=200) -> Response:
-    resp = json.dumps(resp_json, cls=TimeTypeEncoder)
+        return json_default(obj)
+
+
+def dumps_json(obj: Any) -> bytes:
+    """
+    This method serializes obj straight to utf-8 encoded json bytes.
+    It uses orjson when it is installed and JSON_ENCODER is 'fast', otherwise the standard json module.
+    Types json cannot serialize are encoded through JSON_TYPE_ENCODERS with either encoder.
+    :param obj: Object to serialize.
+    :return: json bytes.
+    """
+    if orjson is not None and JSON_ENCODER == 'fast':
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_json_with_raw(resp_json: dict, key: str, raw_json: bytes) -> bytes:
+    """
+    This method serializes resp_json with raw_json as the value of key. raw_json is json already,
+    like a document built by the database, and is written as it is without being parsed.
+    """
+    resp_head = dumps_json({field: value for field, value in resp_json.items() if field != key})
+    return b''.join([resp_head[:-1], b',' if len(resp_head) > 2 else b'', dumps_json(key), b':', raw_json, b'}'])
+
+
+def create_response(resp_json, status=200, raw_data: bytes | None = None) -> Response:
+    """
+    :param raw_data: Optional json bytes sent as the 'data' of the response, see dumps_json_with_raw.
+    """
+    resp = dumps_json(resp_json) if raw_data is None else dumps_json_with_raw(resp_json, 'data', raw_data)
     resp = make_response(resp, status)
     resp.headers['Content-Type'] = 'application/json'
+    if resp_json.get('status'):
+        apply_cache_headers(resp)
     return resp
 
 
+def is_successful_response(response: Response) -> bool:
+    """
+    Returns whether a response reports success, by its http status and the status and status_code of its json.
+    Streamed responses are only checked by their http status.
+    """
+    if response.status_code >= 400:
+        return False
+    if response.is_streamed or not response.is_json:
+        return True
+
+    resp_json = response.get_json(silent=True)
+    if not isinstance(resp_json, dict):
+        return True
+    try:
+        return resp_json.get('status') is not False and int(resp_json.get('status_code', 2000)) < 4000
+    except (TypeError, ValueError):
+        return True
+
+
+def prime_iterator(rows: Iterator[Any]) -> Iterator[Any]:
+    """
+    This method reads the first row of rows right away, so errors raised while running the query surface
+    before a streaming response is started. It returns a generator of all the rows, closing it closes rows.
+    """
+    first_row = next(rows, StopIteration)
+
+    def generate() -> Iterator[Any]:
+        if first_row is StopIteration:
+            return
+        yield first_row
+        yield from rows
+
+    return generate()
+
+
+def create_streaming_response(resp_json: dict, rows: Iterator[Any]) -> Response:
+    """
+    This method streams resp_json with rows as its 'data' array, using chunked transfer encoding.
+    Rows are serialized one by one and sent in chunks of about STREAM_CHUNK_SIZE bytes, so the whole
+    list is never held in memory. If reading rows fails midway, the error is logged and re-raised, so the
+    server aborts the response and the client never receives a well-formed but truncated list.
+    :param resp_json: Response dict without data.
+    :param rows: An iterator of json serializable rows.
+    :return: Streaming response.
+    """
+    resp_head = dumps_json({key: value for key, value in resp_json.items() if key != 'data'})
+
+    def generate() -> Iterator[bytes]:
+        chunk = bytearray(resp_head[:-1])
+        chunk += b',"data":[' if len(resp_head) > 2 else b'"data":['
+        separator = b''
+        try:
+            for row in rows:
+                chunk += separator
+                chunk += dumps_json(row)
+                separator = b','
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    yield bytes(chunk)
+                    chunk.clear()
+            chunk += b']}'
+            yield bytes(chunk)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            raise
+        finally:
+            close_rows = getattr(rows, 'close', None)
+            if close_rows is not None:
+                close_rows()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def encode_cursor(last_id: int) -> str:
+    """ Returns the opaque cursor of the page which starts after the row with id last_id. """
+    return base64.urlsafe_b64encode(dumps_json({'id': last_id})).decode('utf-8').rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    """
+    This method decodes a cursor created by encode_cursor. It raises ValueError for invalid cursors.
+    :param cursor: Opaque cursor passed as `after` by the client.
+    :return: id of the last row of the previous page, or None if no cursor is passed.
+    """
+    if not cursor:
+        return None
+
+    try:
+        last_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))['id']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError('Invalid cursor.') from e
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError('Invalid cursor.')
+    return last_id
+
+
+def get_page_size(limit: int | None, after: str | None) -> int | None:
+    """
+    This method returns the page size of a list request. Clients which pass neither limit nor after get
+    the full list, as before the endpoints were paginated.
+    :param limit: Page size passed by the client.
+    :param after: Cursor passed by the client.
+    :return: Page size, None if the list is not paginated.
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE if after is not None else None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def get_fetch_size(limit: int | None) -> int | None:
+    """ Returns the number of rows to fetch for a page of limit rows, one extra to know if there is a next page. """
+    return limit + 1 if limit is not None else None
+
+
+def paginate(rows: list[dict], limit: int | None) -> tuple[list[dict], str | None]:
+    """
+    This method trims rows, fetched with get_fetch_size(limit), to a page of limit rows.
+    :param rows: Rows ordered by id, at most limit + 1 of them.
+    :param limit: Page size, None if the list is not paginated.
+    :return: The rows of the page and the cursor of the next page, None if it is the last page.
+    """
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['id'])
+
+
 def allowed_file_formats(file_name: str) -> tuple[bool, Any | None, Any | None]:
     is_allowed, file_type, file_ext = False, None, None
-    if file_name is not None:
-        _, file_ext = file_name.rsplit('.')
+    if file_name is not None and '.' in file_name:
+        _, file_ext = file_name.rsplit('.', 1)
         file_type = ALLOWED_FILE_EXTENSIONS.get(file_ext.upper())
         if file_type:
             is_allowed = True
@@ -55,57 +329,387 @@ def allowed_file_formats(file_name: str) -> tuple[bool, Any | None, Any | None]:
 @validate_arguments
 def parse_movie_file_data(files: ImmutableMultiDict, movie_name) :
     file_data_dict = {}
+    rejected_files = []
     movie_name = secure_filename(movie_name)
     for idx, file in enumerate(files, start=1):
         file_data = files[file]
         is_allowed, file_type, file_ext = allowed_file_formats(file_data.filename)
         if is_allowed:
-            tmp_file_name = secure_filename(filename=file_data.filename)
-            if tmp_file_name == '':
-                tmp_file_name = f'{movie_name}_{file_type}_{idx}.{file_ext.lower()}'
+            tmp_file_name = get_movie_file_name(file_data.filename, movie_name, idx, file_type, file_ext)
             file_data_dict[tmp_file_name] = [file_data, file_type]
         else:
-            pass
+            rejected_files.append({'file_name': file_data.filename, 'file_type': file_type, 'status': False,
+                                   'msg': 'File format not allowed.', 'url': None, 'deduplicated': False})
 
     # store movie files in s3
-    return save_movie_data_in_s3(file_data_dict, movie_name)
+    s3_object_urls = save_movie_data_in_s3(file_data_dict, movie_name)
+    s3_object_urls['files'].extend(rejected_files)
+    return s3_object_urls
+
+
+def get_movie_file_name(file_name: str, movie_name: str, idx: int, file_type: str, file_ext: str) -> str:
+    movie_file_name = secure_filename(filename=file_name)
+    if movie_file_name == '':
+        movie_file_name = f'{movie_name}_{file_type}_{idx}.{file_ext.lower()}'
+    return movie_file_name
+
+
+def get_media_upload_executor() -> ThreadPoolExecutor:
+    """
+    This method returns the bounded thread pool used to upload media files of a request concurrently.
+    The pool is created lazily per process, so forked workers do not inherit a pool without threads.
+    :return: ThreadPoolExecutor
+    """
+    global _media_upload_executor, _media_upload_executor_pid
+
+    pid = os.getpid()
+    if _media_upload_executor is not None and _media_upload_executor_pid == pid:
+        return _media_upload_executor
+
+    with _media_upload_executor_lock:
+        if _media_upload_executor is None or _media_upload_executor_pid != pid:
+            _media_upload_executor = ThreadPoolExecutor(max_workers=MEDIA_UPLOAD_WORKERS,
+                                                        thread_name_prefix='media-upload')
+            _media_upload_executor_pid = pid
+    return _media_upload_executor
 
 
-def save_movie_data_in_s3(file_data_dict: dict, movie_name: str) -> dict[str, list]:
-    s3_object_urls = {'video_urls': [], 'image_urls': []}
+def save_movie_data_in_s3(file_data_dict: dict, movie_name: str, deadline: float | None = None) -> dict[str, list]:
+    """
+    This method uploads movie media files to s3 concurrently on a bounded thread pool.
+    Uploads which do not finish before the deadline are cancelled, they stop reading the request on their next
+    read and their multipart uploads are aborted. They are waited for up to MEDIA_UPLOAD_CANCEL_TIMEOUT seconds,
+    so they do not read the request after the response was sent. The order of the urls and of the per file
+    results follows the order of file_data_dict.
+    :param file_data_dict: A dict of file name and [file data, file type].
+    :param movie_name: Name of the movie, used as s3 key prefix.
+    :param deadline: Overall time in seconds allowed for all the uploads. Defaults to MEDIA_UPLOAD_DEADLINE.
+    :return: A dict of uploaded video urls, image urls and per file upload results.
+    """
+    s3_object_urls = {'video_urls': [], 'image_urls': [], 'files': []}
+    deadline = MEDIA_UPLOAD_DEADLINE if deadline is None else deadline
+    cancelled = threading.Event()
+    futures = []
     try:
-        s3_client = boto3.client('s3', region_name=AWS_REGION, verify=False)
+        s3_client = get_s3_client()
+        executor = get_media_upload_executor()
         for key in file_data_dict:
             file_data, file_type = file_data_dict[key]
-
-            # save file in tmp location and read the file path.
-            tmp_file_path = save_file_temp_location(key, file_data)
             s3_file_path = f'{movie_name}/{key}'
-            s3_client.upload_file(tmp_file_path, MOVIE_DATA_S3_BUCKET, s3_file_path,
-                                  Config=TransferConfig())
+            future = executor.submit(upload_movie_file, s3_client, key, file_data, s3_file_path, cancelled)
+            futures.append((key, file_type, s3_file_path, future))
+
+        _, not_done = wait([future for *_, future in futures], timeout=deadline)
+        if not_done:
+            cancelled.set()
+            for future in not_done:
+                future.cancel()
+            wait(not_done, timeout=MEDIA_UPLOAD_CANCEL_TIMEOUT)
+    except Exception as e:
+        cancelled.set()
+        logger.exception(e, exc_info=True)
+
+    for key, file_type, s3_file_path, future in futures:
+        file_result = {'file_name': key, 'file_type': file_type, 'status': False, 'msg': '', 'url': None,
+                       'deduplicated': False}
+        if not future.done():
+            file_result['msg'] = 'Upload timed out.'
+            logger.error(f'Upload of file {key} to s3 location {s3_file_path} did not stop '
+                         f'{MEDIA_UPLOAD_CANCEL_TIMEOUT}s after it was cancelled.')
+        elif future.cancelled() or isinstance(future.exception(), UploadCancelled):
+            file_result['msg'] = 'Upload timed out.'
+            logger.error(f'Upload of file {key} to s3 location {s3_file_path} did not finish in {deadline}s.')
+        elif future.exception() is not None:
+            file_result['msg'] = 'Upload failed.'
+            logger.exception(future.exception(), exc_info=future.exception())
+        else:
+            s3_file_path, is_deduplicated = future.result()
             object_url = construct_s3_object_url(s3_key=s3_file_path)
+            file_result.update({'status': True, 'msg': 'Uploaded successfully.', 'url': object_url,
+                                'deduplicated': is_deduplicated})
             if file_type == 'video':
                 s3_object_urls['video_urls'].append(object_url)
             else:
                 s3_object_urls['image_urls'].append(object_url)
             logger.info(f'File data for file {key} uploaded to s3 location {s3_file_path} successfully!')
-    except Exception as e:
-        logger.exception(e, exc_info=True)
+        s3_object_urls['files'].append(file_result)
     return s3_object_urls
 
 
-def save_file_temp_location(file_name: str, file_data: FileStorage) -> str:
-    file_path = None
+class UploadCancelled(Exception):
+    pass
+
+
+class CancellableStream:
+    """
+    A read only view of a seekable file stream which raises UploadCancelled once its upload is cancelled.
+    s3transfer reads every part through it, so a cancelled upload fails on its next read and s3transfer
+    aborts the multipart upload.
+    """
+
+    def __init__(self, stream: Any, cancelled: threading.Event):
+        self._stream = stream
+        self._cancelled = cancelled
+
+    def read(self, size: int = -1) -> bytes:
+        if self._cancelled.is_set():
+            raise UploadCancelled()
+        return self._stream.read(size)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+    def close(self) -> None:
+        # s3transfer closes the file objects it uploads, the stream is closed by its owner.
+        pass
+
+
+def is_seekable(stream: Any) -> bool:
+    try:
+        return stream is not None and stream.seekable()
+    except Exception:
+        return False
+
+
+def hash_stream(stream: Any) -> str:
+    """
+    This method computes the sha256 content hash of a stream, reading it in chunks of
+    S3_MULTIPART_CHUNKSIZE bytes. The stream is read till the end.
+    :param stream: A readable binary stream.
+    :return: Hex digest of the content.
+    """
+    content_hash = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(S3_MULTIPART_CHUNKSIZE), b''):
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_deduplicated_s3_key(s3_client: Any, content_hash: str) -> str | None:
+    """
+    This method looks up an already uploaded object with the same content hash. The object is
+    checked with a HEAD request, its sha256 metadata has to match the hash, so keys of objects which were
+    removed or overwritten with other content are not reused, and are dropped from the index.
+    :param s3_client: boto3 s3 client.
+    :param content_hash: sha256 hex digest of the content.
+    :return: Object location in s3, if an object with the same content exists.
+    """
     try:
-        # create a temp directory to store movie media files
-        tmp_dir_path = tempfile.gettempdir()
-        file_path = os.path.join(tmp_dir_path, file_name)
+        s3_key = rc.hget(MEDIA_CONTENT_INDEX_KEY, content_hash)
+        if s3_key is None:
+            return None
 
-        # Write the file to location
-        file_data.save(file_path)
+        s3_key = s3_key.decode('utf-8')
+        s3_object = s3_client.head_object(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key)
+        if s3_object.get('Metadata', {}).get('sha256') != content_hash:
+            rc.hdel(MEDIA_CONTENT_INDEX_KEY, content_hash)
+            return None
+        return s3_key
+    except client.ClientError:
+        rc.hdel(MEDIA_CONTENT_INDEX_KEY, content_hash)
     except Exception as e:
         logger.exception(e, exc_info=True)
-    return file_path
+    return None
+
+
+def index_uploaded_content(content_hash: str, s3_key: str) -> None:
+    try:
+        rc.hset(MEDIA_CONTENT_INDEX_KEY, content_hash, s3_key)
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+
+
+class HashingFile:
+    """
+    The stream of an uploaded file, which computes the sha256 content hash of the file while werkzeug writes
+    it during form parsing. The hash is known once the request is parsed, without reading the file again.
+    """
+
+    def __init__(self, stream: Any):
+        self._stream = stream
+        self._content_hash = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self._content_hash.update(data)
+        return self._stream.write(data)
+
+    @property
+    def content_hash(self) -> str:
+        return self._content_hash.hexdigest()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class HashingRequest(Request):
+    """ Request class of the app, the uploaded files of its forms are written to HashingFile streams. """
+
+    def _get_file_stream(self, total_content_length: int | None, content_type: str | None,
+                         filename: str | None = None, content_length: int | None = None) -> Any:
+        return HashingFile(super()._get_file_stream(total_content_length, content_type, filename, content_length))
+
+
+def upload_movie_file(s3_client: Any, file_name: str, file_data: FileStorage, s3_file_path: str,
+                      cancelled: threading.Event | None = None) -> tuple[str, bool]:
+    """
+    This method uploads a single movie media file to s3.
+    Seekable file streams are piped into a multipart upload as they are, so the file is not copied again.
+    Note that werkzeug spools form parts over 500KB to a temporary file while it parses the request, large
+    media should be sent with the pre-signed POST or the chunked upload api, which do not go through the disk
+    of the app. Non-seekable streams, e.g. from a custom stream factory, are copied to a temporary file
+    first and uploaded from there.
+    The content hash of the file is computed while it is received, see HashingRequest, or while it is copied
+    for non-seekable streams. If an object with the same content was uploaded already, its key is reused and
+    the upload is skipped.
+    :param s3_client: boto3 s3 client.
+    :param file_name: Name of the file.
+    :param file_data: Uploaded file.
+    :param s3_file_path: Object location in s3.
+    :param cancelled: Event which stops the upload on its next read of the file, with UploadCancelled.
+    :return: Object location of the file in s3 and whether an existing object was reused.
+    """
+    cancelled = cancelled or threading.Event()
+    if is_seekable(file_data.stream):
+        content_hash = file_data.stream.content_hash if isinstance(file_data.stream, HashingFile) else None
+        return upload_media_stream(s3_client, CancellableStream(file_data.stream, cancelled), file_data.mimetype,
+                                   s3_file_path, content_hash)
+
+    # copy the file to a temporary file, which is removed when it is closed.
+    with tempfile.NamedTemporaryFile(prefix='media-upload-', suffix=f'-{file_name}') as tmp_file:
+        content_hash = hashlib.sha256()
+        for chunk in iter(lambda: file_data.stream.read(S3_MULTIPART_CHUNKSIZE), b''):
+            if cancelled.is_set():
+                raise UploadCancelled()
+            content_hash.update(chunk)
+            tmp_file.write(chunk)
+        tmp_file.flush()
+        return upload_media_stream(s3_client, CancellableStream(tmp_file, cancelled), file_data.mimetype,
+                                   s3_file_path, content_hash.hexdigest())
+
+
+def upload_media_stream(s3_client: Any, stream: CancellableStream, mimetype: str | None, s3_file_path: str,
+                        content_hash: str | None = None) -> tuple[str, bool]:
+    """
+    Uploads a seekable stream for upload_movie_file, unless its content was uploaded already.
+    The content hash is computed from the stream if it is not given.
+    """
+    extra_args = {}
+    if mimetype:
+        extra_args['ContentType'] = mimetype
+
+    if content_hash is None:
+        stream.seek(0)
+        content_hash = hash_stream(stream)
+    existing_s3_key = get_deduplicated_s3_key(s3_client, content_hash)
+    if existing_s3_key is not None:
+        return existing_s3_key, True
+
+    stream.seek(0)
+    extra_args['Metadata'] = {'sha256': content_hash}
+    s3_client.upload_fileobj(stream, MOVIE_DATA_S3_BUCKET, s3_file_path, ExtraArgs=extra_args,
+                             Config=MEDIA_TRANSFER_CONFIG)
+    index_uploaded_content(content_hash, s3_file_path)
+    return s3_file_path, False
+
+
+def generate_pre_signed_post(movie_name: str, file_name: str, idx: int, file_size: int | None = None) -> dict:
+    """
+    This method creates a pre-signed POST policy, which lets a browser upload one movie media file
+    directly to s3. The policy is restricted to the exact object key and to the size cap of the file type.
+    :param movie_name: Name of the movie, used as s3 key prefix.
+    :param file_name: Name of the file to upload.
+    :param idx: Position of the file in the request, used when the file name cannot be used as it is.
+    :param file_size: Size of the file in bytes, if the client knows it upfront.
+    :return: A dict with the upload url and form fields, or the reason the file was rejected.
+    """
+    movie_name = secure_filename(movie_name)
+    file_upload = {'file_name': file_name, 'file_type': None, 'status': False, 'msg': '', 'key': None,
+                   'url': None, 'fields': None}
+
+    is_allowed, file_type, file_ext = allowed_file_formats(file_name)
+    if not is_allowed:
+        file_upload['msg'] = 'File format not allowed.'
+        return file_upload
+
+    max_file_size = MAX_MEDIA_FILE_SIZES[file_type]
+    file_upload['file_type'] = file_type
+    if file_size is not None and not 0 < file_size <= max_file_size:
+        file_upload['msg'] = f'File size should be between 1 and {max_file_size} bytes.'
+        return file_upload
+
+    s3_key = f'{movie_name}/{get_movie_file_name(file_name, movie_name, idx, file_type, file_ext)}'
+    pre_signed_post = get_s3_client().generate_presigned_post(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key,
+                                                              Conditions=[['content-length-range', 1,
+                                                                           max_file_size]],
+                                                              ExpiresIn=PRE_SIGNED_POST_EXPIRY)
+    file_upload.update({'status': True, 'key': s3_key, 'url': pre_signed_post['url'],
+                        'fields': pre_signed_post['fields']})
+    return file_upload
+
+
+def verify_uploaded_object(s3_key: str, movie_name: str) -> dict:
+    """
+    This method verifies a file uploaded directly to s3 with a HEAD request. The object has to
+    belong to the movie, be of an allowed format and be within the size cap of its file type.
+    :param s3_key: Object location in s3.
+    :param movie_name: Name of the movie the object should belong to.
+    :return: A dict with the verification status, file type and s3 object url.
+    """
+    uploaded_file = {'key': s3_key, 'file_type': None, 'status': False, 'msg': '', 'url': None}
+
+    is_allowed, file_type, _ = allowed_file_formats(s3_key)
+    if not is_allowed or not s3_key.startswith(f'{secure_filename(movie_name)}/'):
+        uploaded_file['msg'] = 'Invalid object key.'
+        return uploaded_file
+
+    uploaded_file['file_type'] = file_type
+    try:
+        s3_object = get_s3_client().head_object(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key)
+    except client.ClientError as ce:
+        logger.exception(ce, exc_info=True)
+        uploaded_file['msg'] = 'File not found.'
+        return uploaded_file
+
+    if s3_object['ContentLength'] > MAX_MEDIA_FILE_SIZES[file_type]:
+        uploaded_file['msg'] = 'File size exceeds the allowed limit.'
+        return uploaded_file
+
+    uploaded_file.update({'status': True, 'msg': 'File verified successfully.',
+                          'url': construct_s3_object_url(s3_key=s3_key)})
+    return uploaded_file
+
+
+def start_multipart_upload(s3_key: str, content_type: str | None = None) -> str:
+    extra_args = {'ContentType': content_type} if content_type else {}
+    s3_upload = get_s3_client().create_multipart_upload(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key, **extra_args)
+    return s3_upload['UploadId']
+
+
+def upload_multipart_chunk(s3_key: str, s3_upload_id: str, part_no: int, chunk: bytes) -> str:
+    s3_part = get_s3_client().upload_part(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key, UploadId=s3_upload_id,
+                                          PartNumber=part_no, Body=chunk)
+    return s3_part['ETag']
+
+
+def complete_multipart_upload(s3_key: str, s3_upload_id: str, parts: list[dict]) -> None:
+    multipart_upload = {'Parts': [{'PartNumber': part['part_no'], 'ETag': part['etag']} for part in parts]}
+    get_s3_client().complete_multipart_upload(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key, UploadId=s3_upload_id,
+                                              MultipartUpload=multipart_upload)
+
+
+def abort_multipart_upload(s3_key: str, s3_upload_id: str) -> None:
+    get_s3_client().abort_multipart_upload(Bucket=MOVIE_DATA_S3_BUCKET, Key=s3_key, UploadId=s3_upload_id)
 
 
 def construct_s3_object_url(s3_key: str) -> str:
@@ -119,23 +723,96 @@ def construct_s3_object_url(s3_key: str) -> str:
     return s3_object_url
 
 
-def generate_pre_signed_s3_urls(s3_object_urls: str):
+def get_s3_client():
+    """
+    This method returns the s3 client shared by all the threads of the current process.
+    boto3 clients are thread safe, so the client is created once and reused. A forked worker
+    creates its own client on first use instead of sharing the parent's connection pool.
+    :return: boto3 s3 client.
+    """
+    global _s3_client, _s3_client_pid
+
+    pid = os.getpid()
+    if _s3_client is not None and _s3_client_pid == pid:
+        return _s3_client
+
+    with _s3_client_lock:
+        if _s3_client is None or _s3_client_pid != pid:
+            _s3_client = boto3.client('s3', region_name=AWS_REGION, verify=False, endpoint_url=S3_ENDPOINT_URL,
+                                      config=client.Config(signature_version='s3v4',
+                                                           max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+            _s3_client_pid = pid
+    return _s3_client
+
+
+def reset_s3_client() -> None:
+    """
+    This method drops the shared s3 client and the pre-signed url cache, so the next call
+    creates a fresh client. Useful when the s3 endpoint changes, e.g. while running against a local s3.
+    """
+    global _s3_client, _s3_client_pid
+
+    with _s3_client_lock:
+        _s3_client, _s3_client_pid = None, None
+    with _pre_signed_url_cache_lock:
+        _pre_signed_url_cache.clear()
+
+
+def get_pre_signed_url(object_key: str) -> str:
+    """
+    This method returns a pre-signed url for the given object key. Urls are cached per object key
+    and reused until PRE_SIGNED_URL_REFRESH_MARGIN seconds before they expire, after which a new
+    url is signed.
+    :param object_key: Object location in s3.
+    :return: pre-signed url.
+    """
+    now = time.time()
+    with _pre_signed_url_cache_lock:
+        cached = _pre_signed_url_cache.get(object_key)
+        if cached is not None and cached[1] > now:
+            _pre_signed_url_cache.move_to_end(object_key)
+            metrics.incr('s3.pre_signed_url_cache.hits')
+            return cached[0]
+
+    metrics.incr('s3.pre_signed_url_cache.misses')
+    pre_signed_url = get_s3_client().generate_presigned_url(ClientMethod='get_object',
+                                                            Params={
+                                                                'Bucket': MOVIE_DATA_S3_BUCKET,
+                                                                'Key': object_key
+                                                            },
+                                                            ExpiresIn=PRE_SIGNED_URL_EXPIRY)
+    reuse_until = now + PRE_SIGNED_URL_EXPIRY - PRE_SIGNED_URL_REFRESH_MARGIN
+    with _pre_signed_url_cache_lock:
+        _pre_signed_url_cache[object_key] = (pre_signed_url, reuse_until)
+        _pre_signed_url_cache.move_to_end(object_key)
+        while len(_pre_signed_url_cache) > PRE_SIGNED_URL_CACHE_SIZE:
+            _pre_signed_url_cache.popitem(last=False)
+    return pre_signed_url
+
+
+def get_pre_signed_url_cache_stats() -> dict[str, Any]:
+    hits = metrics.get_counter('s3.pre_signed_url_cache.hits')
+    misses = metrics.get_counter('s3.pre_signed_url_cache.misses')
+    with _pre_signed_url_cache_lock:
+        size = len(_pre_signed_url_cache)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'size': size, 'hit_ratio': hits / total if total else 0.0}
+
+
+metrics.register_gauge('s3.pre_signed_url_cache.size', lambda: get_pre_signed_url_cache_stats()['size'])
+metrics.register_gauge('s3.pre_signed_url_cache.hit_ratio', lambda: get_pre_signed_url_cache_stats()['hit_ratio'])
+
+
+def generate_pre_signed_s3_urls(s3_object_urls: list[str] | None) -> list[str]:
     pre_signed_urls = []
 
-    for s3_object_url in s3_object_urls:
+    for s3_object_url in s3_object_urls or []:
         url_split = s3_object_url.split('/')
 
         # s3 object path is between domain and file.
         object_key = '/'.join(url_split[3:])
         try:
-            s3_client = boto3.client('s3', region_name=AWS_REGION, config=client.Config(signature_version='s3v4'))
-            pre_signed_url = s3_client.generate_presigned_url(ClientMethod='get_object',
-                                                              Params={
-                                                                  'Bucket': MOVIE_DATA_S3_BUCKET,
-                                                                  'Key': object_key
-                                                              },
-                                                              ExpiresIn=3600)
-            pre_signed_urls.append(pre_signed_url)
+            pre_signed_urls.append(get_pre_signed_url(object_key))
         except Exception as e:
             logger.exception(e, exc_info=True)
     return pre_signed_urls
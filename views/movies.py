@@ -1,13 +1,21 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterator
 
+from botocore.exceptions import ClientError
 from pydantic import ValidationError
 from werkzeug.datastructures import ImmutableMultiDict
+from werkzeug.utils import secure_filename
 
 from models.movies_model import (MovieModel, MovieStarModel, MovieStarsMapping, PydntMovieModel, PydntMovieStarModel,
                                  PydntMovieStarRelationModel)
+from models.upload_model import MediaUploadModel
 from log_util import get_logger
-from utils import parse_movie_file_data, generate_pre_signed_s3_urls
+from utils import (parse_movie_file_data, prime_iterator, decode_cursor, get_page_size, get_fetch_size, paginate,
+                   generate_pre_signed_s3_urls, generate_pre_signed_post,
+                   verify_uploaded_object, allowed_file_formats, get_movie_file_name, start_multipart_upload,
+                   upload_multipart_chunk, complete_multipart_upload, abort_multipart_upload,
+                   construct_s3_object_url, MAX_MEDIA_FILE_SIZES, MAX_MEDIA_CHUNK_SIZE, MAX_MEDIA_CHUNKS,
+                   MEDIA_UPLOAD_IDLE_TIMEOUT)
 
 logger = get_logger(__name__)
 
@@ -70,13 +78,23 @@ class MoviesView:
             return resp
 
     @staticmethod
-    def list_movies(only_new: bool | None = True) -> dict:
-        resp = {'msg': 'Movies fetched successfully!', 'data': [], 'status_code': 2000, 'status': True}
+    def list_movies(only_new: bool | None = True, after: str | None = None, limit: int | None = None) -> dict:
+        resp = {'msg': 'Movies fetched successfully!', 'data': [], 'next_cursor': None, 'status_code': 2000,
+                'status': True}
         try:
-            movies_list, status, msg = MovieModel.list_movies(only_new)
+            after_id = decode_cursor(after)
+            limit = get_page_size(limit, after)
+
+            movies_list, status, msg = MovieModel.list_movies(only_new, after_id=after_id,
+                                                              limit=get_fetch_size(limit))
             if not status:
-                raise ValueError(msg)
-            resp['data'] = movies_list
+                raise RuntimeError(msg)
+            resp['data'], resp['next_cursor'] = paginate(movies_list, limit)
+        except ValueError as ve:
+            resp['msg'] = str(ve)
+            resp['status_code'] = 4000
+            resp['status'] = False
+            logger.exception(ve, exc_info=True)
         except Exception as e:
             resp['msg'] = 'Something went wrong.'
             resp['status_code'] = 5000
@@ -85,6 +103,25 @@ class MoviesView:
         finally:
             return resp
 
+    @staticmethod
+    def stream_movies(only_new: bool | None = True, after: str | None = None) -> tuple[dict, Iterator[dict] | None]:
+        resp = {'msg': 'Movies fetched successfully!', 'status_code': 2000, 'status': True}
+        movies_iter = None
+        try:
+            movies_iter = prime_iterator(MovieModel.iter_movies(only_new, after_id=decode_cursor(after)))
+        except ValueError as ve:
+            resp['msg'] = str(ve)
+            resp['status_code'] = 4000
+            resp['status'] = False
+            logger.exception(ve, exc_info=True)
+        except Exception as e:
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+            resp['status'] = False
+            logger.exception(e, exc_info=True)
+        finally:
+            return resp, movies_iter
+
     @staticmethod
     def add_movie_data(movie_id: int, media_files: ImmutableMultiDict) -> dict | None:
         resp: dict[str, Any] = {'msg': 'Movie media added successfully!', 'status_code': 2000, 'status': True}
@@ -93,6 +130,16 @@ class MoviesView:
             if movie_obj is not None:
                 movie_name = movie_obj.movie_name
                 s3_object_urls_dict = parse_movie_file_data(media_files, movie_name)
+                resp['data'] = s3_object_urls_dict['files']
+
+                uploaded_files = [file for file in s3_object_urls_dict['files'] if file['status']]
+                if not uploaded_files:
+                    resp['status'] = False
+                    resp['msg'] = 'Unable to upload movie media.'
+                    resp['status_code'] = 5000 if s3_object_urls_dict['files'] else 4000
+                    return
+                if len(uploaded_files) != len(s3_object_urls_dict['files']):
+                    resp['msg'] = 'Some of the movie media files could not be uploaded.'
 
                 # Parse data as pydantic model
                 pydnt_movie_model = PydntMovieModel.from_orm(movie_obj)
@@ -120,6 +167,279 @@ class MoviesView:
         finally:
             return resp
 
+    @staticmethod
+    def create_media_upload_urls(movie_id: int, media_files: list[dict]) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media upload urls created successfully!', 'data': [],
+                                'status_code': 2000, 'status': True}
+        try:
+            movie_obj = MovieModel.get_movie(movie_id)
+            if movie_obj is None:
+                resp['status'] = False
+                resp['msg'] = 'Movie does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            for idx, media_file in enumerate(media_files, start=1):
+                file_upload = generate_pre_signed_post(movie_obj.movie_name, media_file.get('file_name'), idx,
+                                                       media_file.get('file_size'))
+                resp['data'].append(file_upload)
+
+            if not any(file_upload['status'] for file_upload in resp['data']):
+                resp['status'] = False
+                resp['msg'] = 'No valid movie media files found.'
+                resp['status_code'] = 4000
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def complete_media_upload(movie_id: int, s3_keys: list[str]) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media added successfully!', 'data': [], 'status_code': 2000,
+                                'status': True}
+        try:
+            movie_obj = MovieModel.get_movie(movie_id)
+            if movie_obj is None:
+                resp['status'] = False
+                resp['msg'] = 'Movie does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            for s3_key in s3_keys:
+                resp['data'].append(verify_uploaded_object(s3_key, movie_obj.movie_name))
+
+            uploaded_files = [uploaded_file for uploaded_file in resp['data'] if uploaded_file['status']]
+            if not uploaded_files:
+                resp['status'] = False
+                resp['msg'] = 'No uploaded movie media files found.'
+                resp['status_code'] = 4000
+                return
+
+            MoviesView.attach_media_urls(movie_obj, uploaded_files)
+        except ValidationError as ve:
+            logger.exception(ve, exc_info=True)
+            resp['status'] = False
+            resp['status_code'] = 4000
+            resp['msg'] = ve.errors()
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def attach_media_urls(movie_obj: MovieModel, uploaded_files: list[dict]) -> None:
+        """
+        This method appends the urls of uploaded media files to the movie and saves it.
+        Urls which are already attached to the movie are skipped.
+        :param movie_obj: MovieModel object.
+        :param uploaded_files: list of dicts with file_type and url of the uploaded files.
+        :return: None. Raises ValidationError if the movie ends up with too many urls.
+        """
+        image_urls = list(movie_obj.image_urls or [])
+        video_urls = list(movie_obj.video_urls or [])
+        for uploaded_file in uploaded_files:
+            urls = video_urls if uploaded_file['file_type'] == 'video' else image_urls
+            if uploaded_file['url'] not in urls:
+                urls.append(uploaded_file['url'])
+
+        # Parse data as pydantic model
+        pydnt_movie_model = PydntMovieModel.from_orm(movie_obj)
+        pydnt_movie_model.image_urls = image_urls
+        pydnt_movie_model.video_urls = video_urls
+
+        movie_obj.image_urls = pydnt_movie_model.image_urls
+        movie_obj.video_urls = pydnt_movie_model.video_urls
+        movie_obj.modified_at = datetime.utcnow()
+        movie_obj.save()
+
+    @staticmethod
+    def init_media_upload(movie_id: int, file_name: str, file_size: int | None = None,
+                          content_type: str | None = None) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media upload started successfully!', 'data': {}, 'status_code': 2001,
+                                'status': True}
+        try:
+            movie_obj = MovieModel.get_movie(movie_id)
+            if movie_obj is None:
+                resp['status'] = False
+                resp['msg'] = 'Movie does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            is_allowed, file_type, file_ext = allowed_file_formats(file_name)
+            if not is_allowed:
+                resp['status'] = False
+                resp['msg'] = 'File format not allowed.'
+                resp['status_code'] = 4000
+                return
+            if file_size is not None and not 0 < file_size <= MAX_MEDIA_FILE_SIZES[file_type]:
+                resp['status'] = False
+                resp['msg'] = f'File size should be between 1 and {MAX_MEDIA_FILE_SIZES[file_type]} bytes.'
+                resp['status_code'] = 4000
+                return
+
+            movie_name = secure_filename(movie_obj.movie_name)
+            s3_key = f'{movie_name}/{get_movie_file_name(file_name, movie_name, 1, file_type, file_ext)}'
+            s3_upload_id = start_multipart_upload(s3_key, content_type)
+            upload = MediaUploadModel.create(movie_id=movie_id, file_name=file_name, file_type=file_type,
+                                             s3_key=s3_key, s3_upload_id=s3_upload_id,
+                                             ttl=2 * MEDIA_UPLOAD_IDLE_TIMEOUT)
+            resp['data'] = {'upload_id': upload.upload_id, 'key': s3_key, 'max_chunk_size': MAX_MEDIA_CHUNK_SIZE}
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def upload_media_chunk(upload_id: str, part_no: int, chunk: bytes) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media chunk uploaded successfully!', 'data': {}, 'status_code': 2000,
+                                'status': True}
+        try:
+            if not 1 <= part_no <= MAX_MEDIA_CHUNKS:
+                resp['status'] = False
+                resp['msg'] = f'Chunk number should be between 1 and {MAX_MEDIA_CHUNKS}.'
+                resp['status_code'] = 4000
+                return
+            if not 0 < len(chunk) <= MAX_MEDIA_CHUNK_SIZE:
+                resp['status'] = False
+                resp['msg'] = f'Chunk size should be between 1 and {MAX_MEDIA_CHUNK_SIZE} bytes.'
+                resp['status_code'] = 4000
+                return
+
+            upload = MediaUploadModel.get(upload_id)
+            if upload is None:
+                resp['status'] = False
+                resp['msg'] = 'Upload does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            etag = upload_multipart_chunk(upload.s3_key, upload.s3_upload_id, part_no, chunk)
+            upload.add_part(part_no, etag, len(chunk), ttl=2 * MEDIA_UPLOAD_IDLE_TIMEOUT)
+            resp['data'] = {'upload_id': upload_id, 'part_no': part_no, 'size': len(chunk)}
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def get_media_upload_status(upload_id: str) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media upload status fetched successfully!', 'data': {},
+                                'status_code': 2000, 'status': True}
+        try:
+            upload = MediaUploadModel.get(upload_id)
+            if upload is None:
+                resp['status'] = False
+                resp['msg'] = 'Upload does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            parts = upload.get_parts()
+            received_part_nos = {part['part_no'] for part in parts}
+            next_part_no = next(part_no for part_no in range(1, len(parts) + 2) if part_no not in received_part_nos)
+            resp['data'] = {'upload_id': upload_id, 'movie_id': upload.movie_id, 'file_name': upload.file_name,
+                            'key': upload.s3_key, 'uploaded_size': sum(part['size'] for part in parts),
+                            'parts': [{'part_no': part['part_no'], 'size': part['size']} for part in parts],
+                            'next_part_no': next_part_no}
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def complete_chunked_media_upload(upload_id: str) -> dict:
+        resp: dict[str, Any] = {'msg': 'Movie media added successfully!', 'data': {}, 'status_code': 2000,
+                                'status': True}
+        try:
+            upload = MediaUploadModel.get(upload_id)
+            if upload is None:
+                resp['status'] = False
+                resp['msg'] = 'Upload does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            parts = upload.get_parts()
+            if not parts or [part['part_no'] for part in parts] != list(range(1, len(parts) + 1)):
+                resp['status'] = False
+                resp['msg'] = 'Some chunks are missing.'
+                resp['status_code'] = 4000
+                return
+            if sum(part['size'] for part in parts) > MAX_MEDIA_FILE_SIZES[upload.file_type]:
+                resp['status'] = False
+                resp['msg'] = 'File size exceeds the allowed limit.'
+                resp['status_code'] = 4000
+                return
+
+            movie_obj = MovieModel.get_movie(upload.movie_id)
+            if movie_obj is None:
+                resp['status'] = False
+                resp['msg'] = 'Movie does not exist!'
+                resp['status_code'] = 4000
+                return
+
+            complete_multipart_upload(upload.s3_key, upload.s3_upload_id, parts)
+            upload.delete()
+
+            uploaded_file = {'file_type': upload.file_type, 'url': construct_s3_object_url(s3_key=upload.s3_key)}
+            MoviesView.attach_media_urls(movie_obj, [uploaded_file])
+            resp['data'] = {'key': upload.s3_key, **uploaded_file}
+        except ValidationError as ve:
+            logger.exception(ve, exc_info=True)
+            resp['status'] = False
+            resp['status_code'] = 4000
+            resp['msg'] = ve.errors()
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            resp['status'] = False
+            resp['msg'] = 'Something went wrong.'
+            resp['status_code'] = 5000
+        finally:
+            return resp
+
+    @staticmethod
+    def reap_stale_media_uploads() -> int:
+        """
+        This method aborts resumable uploads which did not receive a chunk for MEDIA_UPLOAD_IDLE_TIMEOUT
+        seconds, so their parts do not stay in s3. The s3 multipart upload is aborted even if the state of
+        the upload expired already.
+        :return: Number of uploads reaped.
+        """
+        reaped = 0
+        for upload_id in MediaUploadModel.get_stale_upload_ids(MEDIA_UPLOAD_IDLE_TIMEOUT):
+            try:
+                upload = MediaUploadModel.get(upload_id)
+                s3_upload = (upload.s3_key, upload.s3_upload_id) if upload is not None \
+                    else MediaUploadModel.get_s3_upload(upload_id)
+                if s3_upload is not None:
+                    try:
+                        abort_multipart_upload(*s3_upload)
+                    except ClientError as e:
+                        # The upload was completed or aborted already.
+                        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                            raise
+
+                if upload is not None:
+                    upload.delete()
+                else:
+                    MediaUploadModel.forget(upload_id)
+                reaped += 1
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+        return reaped
+
     @staticmethod
     def update_movie_info(movie_id: int, movie_info: dict) -> dict:
         resp: dict[str, Any] = {'msg': 'Movie updated successfully', 'status_code': 2000, 'status': True}
@@ -162,14 +482,10 @@ class MoviesView:
     def delete_movie(movie_id) -> dict:
         resp = {'msg': 'Movie deleted successfully!', 'status': True, 'status_code': 2000}
         try:
-            movie_obj = MovieModel.get_movie(movie_id)
-            if movie_obj is not None:
-                if not movie_obj.is_deleted:
-                    movie_obj.is_deleted = True
-                    movie_obj.save()
-                else:
-                    resp['msg'] = 'Movie already deleted!'
-            else:
+            deleted, msg, status = MovieModel.soft_delete(movie_id)
+            if not status:
+                raise RuntimeError(msg)
+            if not deleted:
                 resp['msg'] = 'Movie does not exist!'
                 resp['status'] = False
                 resp['status_code'] = 4000
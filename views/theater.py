@@ -1,15 +1,20 @@
+import os
 from datetime import datetime, time
-from typing import Any
+from typing import Any, Iterator
 
 from pydantic import ValidationError
 
 from log_util import get_logger
+from utils import prime_iterator, decode_cursor, get_page_size, get_fetch_size, paginate
 from models.theater_model import (TheaterScreenStatus,
                                   PydntTheaterModel, PydntTheaterScreenModel, PydntShowTimings,
                                   TheaterModel, TheaterScreenModel, ShowTimingsModel)
 
 logger = get_logger(__name__)
 
+# 'json_agg' has Postgres build the /theaters/list-screens document, 'legacy' regroups the joined rows in python.
+LIST_SCREENS_IMPL = os.environ.get('list_screens_impl', 'json_agg')
+
 
 class TheaterView:
     def __init__(self, theater_name: str, no_of_screens: int):
@@ -41,11 +46,15 @@ class TheaterView:
             return resp
 
     @staticmethod
-    def get_theater_list() -> dict:
-        resp = {'msg': 'Theaters fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
+    def get_theater_list(after: str | None = None, limit: int | None = None) -> dict:
+        resp = {'msg': 'Theaters fetched successfully!', 'data': [], 'next_cursor': None, 'status': True,
+                'status_code': 2000}
         try:
-            theater_list, msg, status = TheaterModel.get_theaters_list()
-            resp['data'] = theater_list
+            after_id = decode_cursor(after)
+            limit = get_page_size(limit, after)
+
+            theater_list, msg, status = TheaterModel.get_theaters_list(after_id=after_id, limit=get_fetch_size(limit))
+            resp['data'], resp['next_cursor'] = paginate(theater_list, limit)
             if len(theater_list) == 0 and status:
                 resp['msg'] = 'No Theaters Found.'
                 resp['status'] = False
@@ -54,6 +63,11 @@ class TheaterView:
                 resp['msg'] = 'Something went wrong.'
                 resp['status'] = False
                 resp['status_code'] = 5000
+        except ValueError as ve:
+            resp['msg'] = str(ve)
+            resp['status'] = False
+            resp['status_code'] = 4000
+            logger.exception(ve, exc_info=True)
         except Exception as e:
             resp['msg'] = 'Something went wrong.'
             resp['status'] = False
@@ -62,6 +76,25 @@ class TheaterView:
         finally:
             return resp
 
+    @staticmethod
+    def stream_theater_list(after: str | None = None) -> tuple[dict, Iterator[dict] | None]:
+        resp = {'msg': 'Theaters fetched successfully!', 'status': True, 'status_code': 2000}
+        theaters_iter = None
+        try:
+            theaters_iter = prime_iterator(TheaterModel.iter_theaters(after_id=decode_cursor(after)))
+        except ValueError as ve:
+            resp['msg'] = str(ve)
+            resp['status'] = False
+            resp['status_code'] = 4000
+            logger.exception(ve, exc_info=True)
+        except Exception as e:
+            resp['msg'] = 'Something went wrong.'
+            resp['status'] = False
+            resp['status_code'] = 5000
+            logger.exception(e, exc_info=True)
+        finally:
+            return resp, theaters_iter
+
     @staticmethod
     def get_theater(theater_id: int) -> dict:
         resp: dict[str, Any] = {'msg': 'Theater fetched successfully!', 'data': {}, 'status': True, 'status_code': 2000}
@@ -96,26 +129,23 @@ class TheaterView:
     def update_theater(theater_id: int, name: str | None, no_of_screens: int | None) -> dict:
         resp: dict[str, Any] = {'msg': 'Theater updated successfully!', 'status': True, 'status_code': 2000}
         try:
-            theater_obj, msg, status = TheaterModel.get_theater(theater_id)
-            if theater_obj is None and status:
+            # Only the passed fields are validated, through assignment, and updated.
+            pydnt_theater_model = PydntTheaterModel.construct()
+            if name is not None:
+                pydnt_theater_model.name = name
+            if no_of_screens is not None:
+                pydnt_theater_model.no_of_screens = no_of_screens
+
+            updated, msg, status = TheaterModel.update_theater(theater_id,
+                                                               **pydnt_theater_model.dict(exclude_unset=True))
+            if not status:
+                resp['msg'] = msg
+                resp['status'] = False
+                resp['status_code'] = 5000
+            elif not updated:
                 resp['msg'] = f'No Theaters present with id: {theater_id}.'
                 resp['status'] = False
                 resp['status_code'] = 4000
-
-            pydnt_theater_model = PydntTheaterModel.from_orm(theater_obj)
-            pydnt_theater_model.name = name
-            pydnt_theater_model.no_of_screens = no_of_screens
-
-            if pydnt_theater_model.name != theater_obj.name:
-                theater_obj.name = pydnt_theater_model.name
-
-            if pydnt_theater_model.no_of_screens != no_of_screens:
-                theater_obj.no_of_screens = no_of_screens
-
-            theater_obj.name = pydnt_theater_model.name
-            theater_obj.no_of_screens = pydnt_theater_model.no_of_screens
-            theater_obj.modified_at = datetime.utcnow()
-            theater_obj.save()
         except ValidationError as ve:
             resp['msg'] = ve.errors()
             resp['status'] = False
@@ -132,18 +162,15 @@ class TheaterView:
     def delete_theater(theater_id: int):
         resp = {'msg': 'Theater deleted successfully', 'status': True, 'status_code': 2000}
         try:
-            theater_obj, msg, status = TheaterModel.get_theater(theater_id)
-            if theater_obj is not None:
-                theater_obj.is_deleted = True
-                theater_obj.save()
-            elif status:
-                resp['msg'] = f'No Theaters present with id: {theater_id}.'
-                resp['status'] = False
-                resp['status_code'] = 4000
-            else:
+            deleted, msg, status = TheaterModel.soft_delete(theater_id)
+            if not status:
                 resp['msg'] = 'Something went wrong.'
                 resp['status'] = False
                 resp['status_code'] = 5000
+            elif not deleted:
+                resp['msg'] = f'No Theaters present with id: {theater_id}.'
+                resp['status'] = False
+                resp['status_code'] = 4000
         except Exception as e:
             logger.exception(e, exc_info=True)
             resp['msg'] = 'Something went wrong.'
@@ -219,12 +246,21 @@ class TheaterScreenView:
             return resp
 
     @staticmethod
-    def theater_screen_list(theater_id: int):
-        resp: dict[str, Any] = {'msg': 'Theater screens fetched successfully!', 'data': [], 'status': True,
-                                'status_code': 2000}
+    def theater_screen_list(theater_id: int, after: str | None = None, limit: int | None = None):
+        resp: dict[str, Any] = {'msg': 'Theater screens fetched successfully!', 'data': [], 'next_cursor': None,
+                                'status': True, 'status_code': 2000}
         try:
-            theater_screen_list, msg, status = TheaterScreenModel.get_theater_screens(theater_id)
-            resp['data'] = theater_screen_list
+            after_id = decode_cursor(after)
+            limit = get_page_size(limit, after)
+
+            theater_screen_list, msg, status = TheaterScreenModel.get_theater_screens(theater_id, after_id=after_id,
+                                                                                      limit=get_fetch_size(limit))
+            resp['data'], resp['next_cursor'] = paginate(theater_screen_list, limit)
+        except ValueError as ve:
+            resp['msg'] = str(ve)
+            resp['status'] = False
+            resp['status_code'] = 4000
+            logger.exception(ve, exc_info=True)
         except Exception as e:
             resp['msg'] = 'Something went wrong.'
             resp['status'] = False
@@ -237,19 +273,17 @@ class TheaterScreenView:
     def delete_screen(screen_id: int):
         resp = {'msg': 'Theater screen deleted successfully!', 'status': True, 'status_code': 2000}
         try:
-            theater_screen_obj, msg, status = TheaterScreenModel.get_theater_screen(screen_id=screen_id)
-            if theater_screen_obj is None and status:
-                resp['msg'] = f'No Theater Screen present with id: {screen_id}'
-                resp['status'] = False
-                resp['status_code'] = 4000
-                return resp
+            deleted, msg, status = TheaterScreenModel.soft_delete(screen_id=screen_id)
             if not status:
                 resp['msg'] = 'Something went wrong.'
                 resp['status'] = False
                 resp['status_code'] = 5000
                 return resp
-            theater_screen_obj.is_deleted = True
-            theater_screen_obj.save()
+            if not deleted:
+                resp['msg'] = f'No Theater Screen present with id: {screen_id}'
+                resp['status'] = False
+                resp['status_code'] = 4000
+                return resp
         except Exception as e:
             logger.exception(e, exc_info=True)
             resp['msg'] = 'Something went wrong.'
@@ -342,6 +376,34 @@ class ShowTimingsView:
         finally:
             return resp
 
+    @staticmethod
+    def list_theater_screens_json(movie_id: int) -> tuple[dict, bytes | None]:
+        """
+        The counterpart of list_theater_screens which returns the data as the precomputed json document
+        of the movie, to be sent with create_response(resp, raw_data=...).
+        :return: Response dict, json bytes of the data or None on errors.
+        """
+        resp = {'msg': 'Movie screens fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
+        theater_screens_json = None
+        try:
+            theater_screens_json, msg, status = ShowTimingsModel.get_now_showing(movie_id)
+            if not status:
+                theater_screens_json = None
+                resp['msg'] = msg
+                resp['status'] = False
+                resp['status_code'] = 5000
+                return resp, theater_screens_json
+            if theater_screens_json == b'[]':
+                resp['msg'] = 'No Theaters Found!'
+        except Exception as e:
+            theater_screens_json = None
+            resp['msg'] = 'Something went wrong'
+            resp['status'] = False
+            resp['status_code'] = 5000
+            logger.exception(e, exc_info=True)
+        finally:
+            return resp, theater_screens_json
+
     @staticmethod
     def list_theater_screens(movie_id: int):
         resp = {'msg': 'Movie screens fetched successfully!', 'data': [], 'status': True, 'status_code': 2000}
@@ -352,7 +414,7 @@ class ShowTimingsView:
                 return resp
             if not status:
                 resp['msg'] = msg
-                resp['status'] = True
+                resp['status'] = False
                 resp['status_code'] = 5000
                 return resp
             resp['data'] = theater_screen_list
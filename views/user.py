@@ -4,6 +4,7 @@ from datetime import datetime
 from flask_jwt_extended import create_access_token, create_refresh_token
 from flask_bcrypt import generate_password_hash, check_password_hash
 
+from auth_util import revoke_user_sessions
 from log_util import get_logger
 
 from models.user_model import UserModel
@@ -91,6 +92,16 @@ class UserView:
             status, msg = False, 'An Error Occurred.'
         return status, msg
 
+    @staticmethod
+    def logout_all(user_claims: dict):
+        status, msg = True, 'User logged out of all sessions successfully'
+        try:
+            revoke_user_sessions(user_claims.get('id'))
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            status, msg = False, 'An Error Occurred.'
+        return status, msg
+
     @staticmethod
     def change_password(user_claims: dict, old_pass: str, new_pass: str):
         status, msg = True, 'Password changed successfully'
@@ -123,7 +134,9 @@ class UserView:
 
             if user_obj is not None:
                 use_attrs = {'is_deleted': True}
-                user_obj.update(use_attrs)
+                status, msg = user_obj.update_user(**use_attrs)
+                if status:
+                    msg = 'User deleted successfully'
             else:
                 status, msg = False, 'User does not exist'
         except Exception as e: